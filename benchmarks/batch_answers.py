@@ -0,0 +1,93 @@
+"""
+Batch question answering: throughput of batch_qa.BatchRunner by concurrency.
+
+Indexes a synthetic library with the offline fakes, then answers the same question file
+(`--duplicates` of the questions repeat an earlier one, with different case or
+punctuation) at each `--concurrency`, with the answer cache off so every run generates its
+answers. The fake LLM sleeps `--llm-latency` seconds per answer, as a remote model would.
+
+    python benchmarks/batch_answers.py --questions 200 --concurrency 1 8 16
+"""
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for path in (HERE, os.path.join(HERE, "..", "sharepoint")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fakes import FakeEmbeddings, fake_llm, make_corpus, make_questions
+
+
+def write_questions(path, count, files, duplicates, seed):
+    rng = random.Random(seed)
+    unique = make_questions(count, files, seed=seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for n, question in enumerate(unique):
+            if n and rng.random() < duplicates:
+                question = rng.choice(unique[:n]).upper().rstrip("?") + " ?"
+            f.write(json.dumps({"id": f"q{n}", "question": question}) + "\n")
+
+
+def main(args):
+    from agent import SharePointAgent
+    from batch_qa import BatchRunner
+
+    work = tempfile.mkdtemp(prefix="batch-qa-")
+    try:
+        data_dir = os.path.join(work, "data")
+        for relative, content in make_corpus(args.files, args.words):
+            path = os.path.join(data_dir, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+        agent = SharePointAgent(data_dir=data_dir, persist_directory=os.path.join(work, "index"),
+                                embeddings=FakeEmbeddings(args.dim), llm=fake_llm(args.llm_latency),
+                                embedding_cache_dir=None, use_answer_cache=False, vector_backend="local")
+        agent.create_vector_store()
+        questions = os.path.join(work, "questions.jsonl")
+        write_questions(questions, args.questions, args.files, args.duplicates, args.seed)
+
+        results = {}
+        for concurrency in args.concurrency:
+            output = os.path.join(work, f"answers-{concurrency}.jsonl")
+            with open(os.devnull, "w") as quiet:
+                stats = BatchRunner(agent, concurrency=concurrency, progress_every=3600, log=quiet).run(questions, output)
+            results[concurrency] = {
+                "seconds": stats["seconds"],
+                "questions_per_s": round(stats["answered"] / stats["seconds"], 1),
+                "generated": stats["answered"] - stats["shared"],
+                "shared": stats["shared"],
+                "errors": stats["errors"],
+            }
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"{args.questions} questions ({args.duplicates:.0%} repeated), {args.files} documents, "
+          f"{args.llm_latency * 1000:g} ms per answer")
+    print(f"{'concurrency':<14}" + "".join(f"{key:>18}" for key in next(iter(results.values()))))
+    for concurrency, row in results.items():
+        print(f"{concurrency:<14}" + "".join(f"{value:>18}" for value in row.values()))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="Share of questions repeating an earlier one")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 16])
+    parser.add_argument("--files", type=int, default=200, help="Documents in the library")
+    parser.add_argument("--words", type=int, default=1500, help="Words per document")
+    parser.add_argument("--dim", type=int, default=256, help="Fake embedding dimension")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per generated answer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    main(parser.parse_args())
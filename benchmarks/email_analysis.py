@@ -0,0 +1,77 @@
+"""
+Wall time of PersonalAssistant.analyze_emails versus inbox size, against a fake LLM.
+
+No credentials needed: the fake LLM (benchmarks/fakes.py) sleeps for a fixed latency per
+call and answers with valid JSON (an array when several emails are packed into one prompt).
+
+    python benchmarks/email_analysis.py --sizes 5 10 25 50 --latency 0.5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "personal_assistant"))
+
+from assistant_logic import PersonalAssistant
+from fakes import fake_llm
+
+
+def make_inbox(size):
+    return [{
+        "subject": f"Status update {i}",
+        "sender": f"Colleague {i % 7}",
+        "received": "2024-01-01T09:00:00",
+        "body_preview": f"Quick note #{i}: the report is ready for review.",
+        "id": f"msg-{i}",
+    } for i in range(size)]
+
+
+MODES = {
+    "sequential": {"max_concurrency": 1, "pack_size": 1},
+    "concurrent": {"max_concurrency": 8, "pack_size": 1},
+    "concurrent+packed": {"max_concurrency": 8, "pack_size": 5},
+}
+
+
+def run(sizes, latency):
+    assistant = PersonalAssistant(llm=fake_llm(latency), cache_path=None)
+    rows = []
+    for size in sizes:
+        inbox = make_inbox(size)
+        for mode, kwargs in MODES.items():
+            rows.append(timed(assistant, inbox, mode, **kwargs))
+
+        # Unchanged inbox on a second load: everything comes from the analysis cache.
+        with tempfile.TemporaryDirectory() as tmp:
+            cached = PersonalAssistant(llm=fake_llm(latency), cache_path=os.path.join(tmp, "cache.sqlite"))
+            cached.analyze_emails(inbox)
+            rows.append(timed(cached, inbox, "cached (warm)"))
+            cached.cache.close()
+    return rows
+
+
+def timed(assistant, inbox, mode, **kwargs):
+    started = time.perf_counter()
+    results = assistant.analyze_emails(inbox, **kwargs)
+    seconds = time.perf_counter() - started
+    assert len(results) == len(inbox)
+    print(f"{len(inbox):>6} {mode:<20} {seconds:>8.3f}s {len(inbox) / seconds:>8.1f} emails/s")
+    return {"inbox_size": len(inbox), "mode": mode, "seconds": round(seconds, 4),
+            "emails_per_second": round(len(inbox) / seconds, 2)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 10, 25, 50])
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub LLM latency per call (seconds)")
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    args = parser.parse_args()
+
+    print(f"{'inbox':>6} {'mode':<20} {'wall':>9} {'throughput':>15}")
+    rows = run(args.sizes, args.latency)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
@@ -0,0 +1,75 @@
+"""
+Email body extraction: BeautifulSoup get_text cut to 1000 characters (the previous approach)
+versus the streaming extractor in personal_assistant/email_text.py.
+
+Runs on HTML shaped like real mail (benchmarks/fakes.make_html_emails). Reports per-message
+parse time, tokens sent to the LLM, and how often quoted history, signatures or footers
+leak into the output, per email style.
+
+    python benchmarks/email_extraction.py --emails 600
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for path in (HERE, os.path.join(HERE, "..", "personal_assistant")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fakes import make_html_emails, HISTORY_WORD, SIGNATURE_WORD, FOOTER_WORD
+from email_text import extract_email_text
+from telemetry import estimate_tokens
+
+
+def soup_text(html):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "html.parser").get_text(separator=' ', strip=True)[:1000]
+
+
+def measure(name, extract, emails):
+    rows = {}
+    for style in sorted({style for style, _, _ in emails}) + ["all"]:
+        subset = [e for e in emails if style in ("all", e[0])]
+        seconds, tokens, leaked, kept = [], [], 0, 0
+        for _, html, new_text in subset:
+            started = time.perf_counter()
+            text = extract(html)
+            seconds.append(time.perf_counter() - started)
+            tokens.append(estimate_tokens(text))
+            leaked += any(word in text for word in (HISTORY_WORD, SIGNATURE_WORD, FOOTER_WORD))
+            # The first words of the new content must survive.
+            kept += " ".join(new_text.split()[:5]) in " ".join(text.split())
+        rows[style] = {
+            "parse_mean_ms": round(float(np.mean(seconds)) * 1000, 3),
+            "parse_p95_ms": round(float(np.percentile(seconds, 95)) * 1000, 3),
+            "tokens_mean": round(float(np.mean(tokens)), 1),
+            "leak_rate": round(leaked / len(subset), 3),
+            "new_content_kept": round(kept / len(subset), 3),
+        }
+    print(f"\n{name}")
+    for style, row in rows.items():
+        print(f"  {style:<14} " + "  ".join(f"{k}={v}" for k, v in row.items()))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    args = parser.parse_args()
+
+    emails = make_html_emails(args.emails, args.seed)
+    results = {"streaming": measure("streaming extractor", extract_email_text, emails)}
+    try:
+        results["beautifulsoup"] = measure("BeautifulSoup + 1000 characters", soup_text, emails)
+    except ImportError:
+        print("beautifulsoup4 not installed; skipping the baseline.")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
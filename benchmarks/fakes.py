@@ -0,0 +1,515 @@
+"""
+Deterministic offline stand-ins for the services the apps talk to.
+
+- FakeEmbeddings: feature-hashed bag-of-words vectors (similar texts get similar vectors).
+- fake_llm: a runnable with fixed latency that answers like a chat model, including the
+  JSON the email analysis expects.
+- FakeChatEndpoint: the same answers streamed by a "provider" with latency spikes and
+  injected errors, for exercising the LLM router.
+- FakeAccount: enough of an O365 Account for SharePointFetcher (drive delta feed and
+  downloads) and OutlookManager (inbox delta feed, unread mail, today's meetings), with
+  per-request latency.
+- make_corpus / make_questions / make_messages: synthetic documents (optionally with the copies
+  real libraries accumulate), questions and inboxes.
+- make_html_emails: HTML bodies shaped like real mail (newsletters, Outlook and Gmail
+  replies with quoted history, signatures and legal footers, plain text).
+
+Everything is seeded, so two runs with the same arguments see the same data.
+"""
+import re
+import json
+import time
+import zlib
+import random
+import threading
+import datetime
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable, RunnableLambda
+
+SERVICE_URL = "https://graph.fake/v1.0/"
+DRIVE_ID = "drive-1"
+ROOT_ID = "root"
+DELTA_PAGE_SIZE = 200
+MESSAGE_PAGE_SIZE = 25
+
+_WORD_RE = re.compile(r"[\w\-]+")
+
+
+class FakeEmbeddings(Embeddings):
+    """Feature-hashed word counts, normalized. `latency` is slept once per call."""
+
+    def __init__(self, dim=256, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+        self.model = f"fake-hash-{dim}"
+        self.calls = 0
+        self.texts = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD_RE.findall(text.lower()):
+            h = zlib.crc32(word.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if h & 1 << 31 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+
+def _answer(prompt):
+    text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+    if "JSON" not in text:
+        return "Based on the documents, here is a short answer."
+    count = len(re.findall(r"^\s*Email \d+:", text, flags=re.MULTILINE))
+    item = {"summary": "Stub summary.", "priority": "Medium",
+            "action_item": "None", "next_step": "Read it"}
+    if count:
+        return json.dumps([dict(item, index=n) for n in range(1, count + 1)])
+    return json.dumps(item)
+
+
+def fake_llm(latency=0.5):
+    """A runnable that behaves like a chat model with fixed latency and well-formed answers."""
+    def respond(prompt):
+        time.sleep(latency)
+        return _answer(prompt)
+    return RunnableLambda(respond)
+
+
+class FakeProviderError(RuntimeError):
+    pass
+
+
+class FakeChatEndpoint(Runnable):
+    """
+    A chat model provider that streams fake_llm's answers in a few chunks.
+
+    The first chunk arrives after `latency` seconds, or `spike_latency` for a `spike_rate`
+    share of calls; an `error_rate` share fail after `error_latency`. The attributes can be
+    changed while calls are running to degrade the provider or take it down.
+    """
+
+    def __init__(self, name, latency=0.1, spike_rate=0.0, spike_latency=1.0, error_rate=0.0, error_latency=0.02,
+                 chunk_latency=0.002, seed=0):
+        self.model_name = name
+        self.latency = latency
+        self.spike_rate = spike_rate
+        self.spike_latency = spike_latency
+        self.error_rate = error_rate
+        self.error_latency = error_latency
+        self.chunk_latency = chunk_latency
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def invoke(self, input, config=None, **kwargs):
+        return "".join(self.stream(input, config, **kwargs))
+
+    def stream(self, input, config=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            failing = self._rng.random() < self.error_rate
+            spiking = self._rng.random() < self.spike_rate
+        if failing:
+            time.sleep(self.error_latency)
+            raise FakeProviderError(f"{self.model_name} is unavailable (503)")
+        time.sleep(self.spike_latency if spiking else self.latency)
+        answer = _answer(input)
+        size = max(1, len(answer) // 8)
+        for i in range(0, len(answer), size):
+            if i:
+                time.sleep(self.chunk_latency)
+            yield answer[i:i + size]
+
+
+# --- synthetic data -----------------------------------------------------------------
+
+def _vocabulary(size=2000, seed=0):
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "po", "da", "fi", "gu", "he", "jo"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_corpus(files=200, words_per_file=1500, seed=0, duplicates=0):
+    """
+    Returns [(relative path, bytes)] of Markdown documents spread over a few folders.
+
+    `duplicates` adds that many copies of earlier documents, the way SharePoint libraries
+    collect them: the same file in another folder, a "final (1)" upload, a "v2" with a few
+    words edited and a version with a section appended.
+    """
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(seed=seed)
+    corpus = []
+    for i in range(files):
+        paragraphs = []
+        remaining = words_per_file
+        while remaining > 0:
+            n = min(remaining, rng.randint(40, 120))
+            paragraphs.append(" ".join(rng.choice(vocabulary) for _ in range(n)) + ".")
+            remaining -= n
+        # Every document names a policy id, so keyword retrieval has something exact to find.
+        paragraphs.insert(rng.randint(0, len(paragraphs)), f"Policy POL-{1000 + i} applies here.")
+        text = f"# Document {i}\n\n" + "\n\n".join(paragraphs) + "\n"
+        corpus.append((f"dept-{i % 8}/doc-{i:05d}.md", text.encode("utf-8")))
+    for n in range(duplicates):
+        path, content = corpus[rng.randrange(files)]
+        stem = path[:-len(".md")]
+        style = n % 4
+        if style == 0:
+            corpus.append((f"archive-{n}/{path}", content))
+        elif style == 1:
+            corpus.append((f"{stem} final ({n}).md", content))
+        elif style == 2:
+            words = content.decode("utf-8").split(" ")
+            for position in rng.sample(range(len(words)), max(1, len(words) // 200)):
+                words[position] = rng.choice(vocabulary)
+            corpus.append((f"{stem} v{n}.md", " ".join(words).encode("utf-8")))
+        else:
+            addendum = " ".join(rng.choice(vocabulary) for _ in range(words_per_file // 3))
+            corpus.append((f"{stem} extended {n}.md", content + f"\n## Addendum\n\n{addendum}.\n".encode("utf-8")))
+    return corpus
+
+
+def make_questions(count=100, files=200, seed=0):
+    """Questions mixing vocabulary words with the occasional exact policy id."""
+    rng = random.Random(seed + 1)
+    vocabulary = _vocabulary(seed=seed)
+    questions = []
+    for i in range(count):
+        if i % 5 == 4:
+            questions.append(f"What does POL-{1000 + rng.randrange(files)} cover?")
+        else:
+            questions.append("What do the documents say about " + " ".join(rng.sample(vocabulary, 3)) + "?")
+    return questions
+
+
+def make_messages(count=100, seed=0, now=None):
+    """Unread messages with HTML bodies of varied length, grouped into conversations."""
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(seed=seed)
+    now = now or datetime.datetime(2024, 1, 1, 9, 0)
+    messages = []
+    for i in range(count):
+        sentences = [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(6, 18))).capitalize() + "."
+                     for _ in range(rng.choice([1, 2, 4, 12, 40]))]
+        body = "<html><body>" + "".join(f"<p>{s}</p>" for s in sentences)
+        if i % 3:
+            body += ("<div>Best regards,<br>Colleague</div>"
+                     "<blockquote>On Monday, someone wrote:<p>Earlier message in the thread.</p></blockquote>")
+        body += "</body></html>"
+        messages.append(FakeMessage(
+            object_id=f"msg-{i}",
+            conversation_id=f"conv-{i // 3}",
+            subject=f"{'RE: ' if i % 3 else ''}Topic {i // 3}",
+            sender=f"Colleague {i % 7}",
+            received=now - datetime.timedelta(minutes=i),
+            body=body,
+        ))
+    return messages
+
+
+# Words that only appear in quoted history, signatures and footers, to check they are stripped.
+HISTORY_WORD = "zzhistory"
+SIGNATURE_WORD = "zzsignature"
+FOOTER_WORD = "zzfooter"
+
+_DISCLAIMER = (f"This email and any files transmitted with it are confidential and intended solely for the use "
+               f"of the individual or entity to whom they are addressed. {FOOTER_WORD} " * 3)
+_STYLE = "<style>" + "".join(f".c{i} {{ font-family: Segoe UI; color: #{i:06x}; margin: 0 }}" for i in range(120)) + "</style>"
+
+
+def _paragraphs(rng, vocabulary, count, words=(8, 30)):
+    return [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(*words))).capitalize() + "."
+            for _ in range(count)]
+
+
+def _history(rng, vocabulary, depth):
+    return "".join(f"<p>{p} {HISTORY_WORD}</p>" for p in _paragraphs(rng, vocabulary, 6 * depth))
+
+
+def make_html_emails(count=200, seed=0):
+    """Returns [(style, html, new content text)] covering the shapes of mail a real inbox gets."""
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(seed=seed)
+    signature = (f'<div id="Signature"><p>Jordan Example</p><p>Senior Analyst | Contoso Ltd</p>'
+                 f'<p>+1 555 0100 {SIGNATURE_WORD}</p></div>')
+    emails = []
+    for i in range(count):
+        style = ("newsletter", "outlook_reply", "gmail_reply", "corporate", "mobile", "plain_reply")[i % 6]
+        new = _paragraphs(rng, vocabulary, rng.randint(1, 4))
+        body_new = "".join(f"<p class='MsoNormal'>{p}</p>" for p in new)
+        if style == "newsletter":
+            new = _paragraphs(rng, vocabulary, rng.randint(20, 60))
+            cells = "".join(f"<tr><td class='c{n % 120}'><table><tr><td><span>{p}</span></td></tr></table></td></tr>"
+                            for n, p in enumerate(new))
+            html = (f"<html><head>{_STYLE}</head><body>"
+                    f"<div style='display:none;max-height:0'>Preheader teaser text {FOOTER_WORD}</div>"
+                    f"<table><tr><td><a href='#'>View this email in your browser</a></td></tr>{cells}</table>"
+                    f"<table><tr><td>You are receiving this because you subscribed. {FOOTER_WORD}</td></tr>"
+                    f"<tr><td><a href='#'>Unsubscribe</a> | Manage preferences {FOOTER_WORD}</td></tr></table>"
+                    f"</body></html>")
+        elif style == "outlook_reply":
+            html = (f"<html><head>{_STYLE}</head><body><div class='WordSection1'>{body_new}"
+                    f"<p>Kind regards,</p>{signature}"
+                    f"<div id='divRplyFwdMsg'><b>From:</b> Someone<br><b>Sent:</b> Monday<br>"
+                    f"<b>Subject:</b> RE: topic</div>{_history(rng, vocabulary, rng.randint(1, 6))}"
+                    f"</div></body></html>")
+        elif style == "gmail_reply":
+            html = (f"<div dir='ltr'>{body_new}<div class='gmail_signature'>-- <br>Sam {SIGNATURE_WORD}</div></div>"
+                    f"<br><div class='gmail_quote'><div class='gmail_attr'>On Mon, Jan 1, 2024 at 9:00 AM "
+                    f"Someone wrote:</div><blockquote class='gmail_quote'>{_history(rng, vocabulary, 3)}"
+                    f"</blockquote></div>")
+        elif style == "corporate":
+            html = (f"<html><body>{body_new}<p>Thanks,</p><p>Alex {SIGNATURE_WORD}</p>"
+                    f"<p style='font-size:8pt'>{_DISCLAIMER}</p></body></html>")
+        elif style == "mobile":
+            new = new[:1]
+            html = f"<div>{new[0]}</div><div><br></div><div>Sent from my iPhone {SIGNATURE_WORD}</div>"
+        else:
+            lines = "\n".join(new)
+            quoted = "\n".join(f"> {p} {HISTORY_WORD}" for p in _paragraphs(rng, vocabulary, 8))
+            html = f"{lines}\n\nOn Tue, 2 Jan 2024, Someone wrote:\n{quoted}\n"
+        emails.append((style, html, " ".join(new)))
+    return emails
+
+
+# --- O365 stand-ins -----------------------------------------------------------------
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None, content=b"", headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.content = content
+        self.headers = headers or {}
+
+    def json(self):
+        return self._data
+
+    def iter_content(self, chunk_size=1024 * 1024):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Serves the drive and inbox delta feeds and file content like Graph, sleeping `latency` per request."""
+
+    def __init__(self, files, latency=0.0, messages=()):
+        self.latency = latency
+        self.requests = 0
+        self.messages = list(messages)
+        self.files = {}
+        folders = {}
+        for n, (path, content) in enumerate(files):
+            parent = ROOT_ID
+            for depth, name in enumerate(path.split("/")[:-1]):
+                key = "/".join(path.split("/")[:depth + 1])
+                if key not in folders:
+                    folders[key] = {"id": f"folder-{len(folders)}", "name": name, "parent": parent}
+                parent = folders[key]["id"]
+            self.files[f"item-{n}"] = {"name": path.split("/")[-1], "parent": parent, "content": content}
+        self.folders = list(folders.values())
+
+    def get(self, url, headers=None, stream=False, **kwargs):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if url.endswith("/content"):
+            item_id = url.split("/items/")[1].split("/")[0]
+            return FakeResponse(content=self.files[item_id]["content"])
+        query = parse_qs(urlparse(url).query)
+        if "token" in query:
+            # Nothing changes between runs of the benchmark.
+            return FakeResponse(data={"value": [], "@odata.deltaLink": url})
+        page = int(query.get("page", ["0"])[0])
+        if "/messages/delta" in url:
+            return FakeResponse(data=self._message_page(page))
+        return FakeResponse(data=self._delta_page(page))
+
+    def _delta_page(self, page):
+        items = [{"id": ROOT_ID, "root": {}}]
+        items += [{"id": f["id"], "name": f["name"], "folder": {}, "parentReference": {"id": f["parent"]}}
+                  for f in self.folders]
+        items += [{"id": item_id, "name": f["name"], "file": {}, "size": len(f["content"]),
+                   "eTag": f"e-{item_id}", "cTag": f"c-{item_id}", "parentReference": {"id": f["parent"]}}
+                  for item_id, f in self.files.items()]
+        base = f"{SERVICE_URL}drives/{DRIVE_ID}/root/delta"
+        start = page * DELTA_PAGE_SIZE
+        data = {"value": items[start:start + DELTA_PAGE_SIZE]}
+        if start + DELTA_PAGE_SIZE < len(items):
+            data["@odata.nextLink"] = f"{base}?page={page + 1}"
+        else:
+            data["@odata.deltaLink"] = f"{base}?token=1"
+        return data
+
+
+    def _message_page(self, page):
+        base = f"{SERVICE_URL}me/mailFolders/inbox/messages/delta"
+        start = page * MESSAGE_PAGE_SIZE
+        data = {"value": [{
+            "id": m.object_id,
+            "conversationId": m.conversation_id,
+            "subject": m.subject,
+            "from": {"emailAddress": {"name": m.sender.name, "address": m.sender.address}},
+            "receivedDateTime": m.received.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "isRead": m.is_read,
+            "body": {"contentType": "html", "content": m.body},
+        } for m in self.messages[start:start + MESSAGE_PAGE_SIZE]]}
+        if start + MESSAGE_PAGE_SIZE < len(self.messages):
+            data["@odata.nextLink"] = f"{base}?page={page + 1}"
+        else:
+            data["@odata.deltaLink"] = f"{base}?token=1"
+        return data
+
+
+class FakeMessage:
+    def __init__(self, object_id, conversation_id, subject, sender, received, body):
+        self.object_id = object_id
+        self.conversation_id = conversation_id
+        self.subject = subject
+        self.sender = _Named(sender)
+        self.received = received
+        self.body = body
+        self.body_preview = re.sub(r"<[^>]+>", " ", body)[:255]
+        self.is_read = False
+
+
+class _Named:
+    def __init__(self, name):
+        self.name = name
+        self.address = f"{name.lower().replace(' ', '.')}@example.com"
+
+
+class FakeQuery:
+    """Accepts any O365 query-builder chain."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+
+class FakeFolder:
+    def __init__(self, messages, latency):
+        self.messages = messages
+        self.latency = latency
+
+    def get_messages(self, limit=25, query=None, download_attachments=False, **kwargs):
+        for i, message in enumerate(self.messages[:limit]):
+            if i % MESSAGE_PAGE_SIZE == 0 and self.latency:
+                time.sleep(self.latency)
+            yield message
+
+
+class FakeMailbox:
+    def __init__(self, messages, latency):
+        self._inbox = FakeFolder(messages, latency)
+
+    def inbox_folder(self):
+        return self._inbox
+
+    def new_query(self, *args):
+        return FakeQuery()
+
+
+class FakeEvent:
+    def __init__(self, subject, start, end):
+        self.subject = subject
+        self.start = start
+        self.end = end
+        self.location = None
+        self.body = ""
+
+
+class FakeCalendar:
+    def __init__(self, events, latency):
+        self.events = events
+        self.latency = latency
+
+    def new_query(self, *args):
+        return FakeQuery()
+
+    def get_events(self, query=None, include_recurring=True, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return list(self.events)
+
+
+class FakeSchedule:
+    def __init__(self, calendar):
+        self.calendar = calendar
+
+    def get_default_calendar(self):
+        return self.calendar
+
+
+class FakeDrive:
+    object_id = DRIVE_ID
+    name = "Documents"
+
+    def get_root_folder(self):
+        return _Root()
+
+
+class _Root:
+    object_id = ROOT_ID
+
+
+class FakeSite:
+    name = "Benchmark"
+    web_url = "https://example.sharepoint.com/sites/benchmark"
+
+    def list_document_libraries(self):
+        return [FakeDrive()]
+
+
+class _Protocol:
+    service_url = SERVICE_URL
+
+
+class FakeAccount:
+    """O365 Account stand-in; pass as `account=` to SharePointFetcher or OutlookManager."""
+
+    is_authenticated = True
+    protocol = _Protocol()
+
+    def __init__(self, files=(), messages=(), meetings=4, latency=0.0):
+        self.con = FakeConnection(files, latency, messages)
+        self._mailbox = FakeMailbox(list(messages), latency)
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time(9, 0))
+        events = [FakeEvent(f"Meeting {i}", today + datetime.timedelta(hours=i),
+                            today + datetime.timedelta(hours=i, minutes=30)) for i in range(meetings)]
+        self._schedule = FakeSchedule(FakeCalendar(events, latency))
+
+    def authenticate(self, **kwargs):
+        return True
+
+    def sharepoint(self):
+        return self
+
+    def search_site(self, name):
+        return [FakeSite()]
+
+    def mailbox(self):
+        return self._mailbox
+
+    def schedule(self):
+        return self._schedule
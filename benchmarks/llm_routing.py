@@ -0,0 +1,114 @@
+"""
+LLM routing: time to first token and errors with one provider, failover only, and hedging.
+
+Two fake chat endpoints (FakeChatEndpoint) stand in for OpenAI and Vertex AI, each with
+occasional latency spikes. Questions are streamed through `prompt | llm | parser` with
+`--concurrency` in flight, over four phases of `--requests` each:
+
+    steady      both providers healthy, spikes only
+    degraded    the primary's latency is multiplied by --degrade
+    outage      every call to the primary fails
+    recovered   the primary is healthy again
+
+and three setups: the primary alone, an LLMRouter with hedging off (failover only), and an
+LLMRouter with hedging. "extra calls" is provider calls beyond one per question.
+
+    python benchmarks/llm_routing.py --requests 200 --concurrency 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for path in (HERE, os.path.join(HERE, "..", "sharepoint")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fakes import FakeChatEndpoint
+
+PHASES = ("steady", "degraded", "outage", "recovered")
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else float("nan")
+
+
+def run_phase(chain, requests, concurrency):
+    def ask(i):
+        started = time.perf_counter()
+        try:
+            for _ in chain.stream({"question": f"What changed in policy {i}?"}):
+                return time.perf_counter() - started, None
+            return time.perf_counter() - started, None
+        except Exception as e:
+            return time.perf_counter() - started, e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(ask, range(requests)))
+    latencies = [seconds for seconds, error in results if error is None]
+    return {
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "errors": sum(error is not None for _, error in results),
+    }
+
+
+def run_setup(args, setup):
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+    from llm_router import LLMRouter
+
+    primary = FakeChatEndpoint("openai", args.latency, args.spike_rate, args.spike_latency, seed=args.seed)
+    secondary = FakeChatEndpoint("vertex", args.latency * args.secondary_ratio, args.spike_rate, args.spike_latency,
+                                 seed=args.seed + 1)
+    if setup == "single":
+        llm = primary
+    else:
+        llm = LLMRouter({"openai": primary, "vertex": secondary}, hedge=(setup == "hedged"),
+                        cooldown=args.cooldown)
+    chain = ChatPromptTemplate.from_template("Answer briefly: {question}") | llm | StrOutputParser()
+
+    results = {}
+    for phase in PHASES:
+        primary.latency = args.latency * (args.degrade if phase == "degraded" else 1)
+        primary.error_rate = 1.0 if phase == "outage" else 0.0
+        calls = primary.calls + secondary.calls
+        results[phase] = run_phase(chain, args.requests, args.concurrency)
+        results[phase]["extra_calls"] = f"{(primary.calls + secondary.calls - calls) / args.requests - 1:.1%}"
+    if isinstance(llm, LLMRouter):
+        results["router"] = llm.stats()
+    return results
+
+
+def main(args):
+    results = {setup: run_setup(args, setup) for setup in ("single", "failover", "hedged")}
+    print(f"{args.requests} questions per phase, {args.concurrency} in flight, first token "
+          f"{args.latency * 1000:g} ms with {args.spike_rate:.0%} spikes to {args.spike_latency * 1000:g} ms")
+    print(f"{'':<24}" + "".join(f"{setup:>12}" for setup in results))
+    for phase in PHASES:
+        for key in ("p50_ms", "p95_ms", "p99_ms", "errors", "extra_calls"):
+            print(f"{phase + ' ' + key:<24}" + "".join(f"{row[phase][key]:>12}" for row in results.values()))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Questions per phase")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="Primary's usual time to first token (s)")
+    parser.add_argument("--secondary-ratio", type=float, default=1.3, help="Secondary's latency relative to it")
+    parser.add_argument("--spike-rate", type=float, default=0.03, help="Share of calls hit by a latency spike")
+    parser.add_argument("--spike-latency", type=float, default=1.0, help="Time to first token during a spike (s)")
+    parser.add_argument("--degrade", type=float, default=8.0, help="Latency multiplier in the degraded phase")
+    parser.add_argument("--cooldown", type=float, default=2.0, help="Seconds a failing provider is skipped")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    main(parser.parse_args())
@@ -0,0 +1,118 @@
+"""
+Near-duplicate collapsing at ingestion: corpus size, embedding work and retrieval redundancy.
+
+Builds the same synthetic library (originals plus copies: other folders, "final (1)",
+lightly edited "v2"s and extended versions) twice, with and without deduplication, using
+the offline fakes (with per-call embedding latency) and no embedding cache, so every
+embedded chunk is counted. Retrieval redundancy is the share of top-k slots holding a
+near-copy of a higher-ranked chunk.
+
+    python benchmarks/near_duplicates.py --files 200 --duplicates 100 --questions 100
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for path in (HERE, os.path.join(HERE, "..", "sharepoint")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fakes import FakeEmbeddings, fake_llm, make_corpus, make_questions
+
+
+def disk_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def redundant_slots(docs, hasher, threshold):
+    """Retrieved chunks that are near-copies of a chunk ranked above them."""
+    from dedup import similarity
+    signatures = [hasher.signature(d.page_content) for d in docs]
+    redundant = 0
+    for i, signature in enumerate(signatures):
+        if signature is not None and any(other is not None and similarity(signature, other) >= threshold
+                                         for other in signatures[:i]):
+            redundant += 1
+    return redundant
+
+
+def run(args, data_dir, deduplicate):
+    from agent import SharePointAgent
+    from dedup import MinHasher, CHUNK_THRESHOLD
+    persist = tempfile.mkdtemp(prefix="dedup-db-")
+    embeddings = FakeEmbeddings(args.dim, args.embed_latency)
+    try:
+        agent = SharePointAgent(data_dir=data_dir, persist_directory=persist, embeddings=embeddings,
+                                llm=fake_llm(0), embedding_cache_dir=None, use_answer_cache=False,
+                                vector_backend=args.backend, deduplicate=deduplicate)
+        started = time.perf_counter()
+        update = agent.update_index()
+        seconds = time.perf_counter() - started
+        hasher = MinHasher()
+        slots = redundant = 0
+        for question in make_questions(args.questions, args.files, args.seed):
+            docs = agent.retrieve(question)
+            slots += len(docs)
+            redundant += redundant_slots(docs, hasher, CHUNK_THRESHOLD)
+        return {
+            "chunks_stored": sum(len(entry["chunks"]) for entry in agent.index_state.files.values()),
+            "duplicate_files": update.duplicate_files,
+            "duplicate_chunks": update.duplicate_chunks,
+            "embedded_texts": embeddings.texts,
+            "embedding_calls": embeddings.calls,
+            "index_build_seconds": round(seconds, 3),
+            "index_mb": round(disk_bytes(persist) / 1e6, 2),
+            "redundant_retrieval_slots": round(redundant / slots, 3) if slots else 0.0,
+        }
+    finally:
+        shutil.rmtree(persist, ignore_errors=True)
+
+
+def main(args):
+    work = tempfile.mkdtemp(prefix="dedup-")
+    try:
+        data_dir = os.path.join(work, "data")
+        for relative, content in make_corpus(args.files, args.words, args.seed, duplicates=args.duplicates):
+            path = os.path.join(data_dir, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+        results = {"off": run(args, data_dir, False), "on": run(args, data_dir, True)}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    off, on = results["off"], results["on"]
+    results["saved"] = {
+        "chunks": f"{1 - on['chunks_stored'] / off['chunks_stored']:.1%}",
+        "embedded_texts": f"{1 - on['embedded_texts'] / off['embedded_texts']:.1%}",
+        "embedding_calls": off["embedding_calls"] - on["embedding_calls"],
+        "index_size": f"{1 - on['index_mb'] / off['index_mb']:.1%}",
+    }
+    print(f"{args.files} documents + {args.duplicates} copies, {args.questions} questions")
+    print(f"{'':<28}{'off':>12}{'on':>12}")
+    for key in off:
+        print(f"{key:<28}{off[key]:>12}{on[key]:>12}")
+    print("saved: " + ", ".join(f"{key} {value}" for key, value in results["saved"].items()))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200, help="Original documents")
+    parser.add_argument("--duplicates", type=int, default=100, help="Copies added to the library")
+    parser.add_argument("--words", type=int, default=1500, help="Words per original document")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=256, help="Fake embedding dimension")
+    parser.add_argument("--embed-latency", type=float, default=0.2, help="Seconds per embedding call")
+    parser.add_argument("--backend", choices=("chroma", "local"), default="local")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    main(parser.parse_args())
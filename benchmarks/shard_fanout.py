@@ -0,0 +1,152 @@
+"""
+Sharded indexing: query latency by scope, and rebuilding one shard instead of everything.
+
+Writes the same synthetic libraries (one per site/library, each with its own vocabulary)
+into a single data directory for a monolithic SharePointAgent and into one shard each for
+a ShardedAgent, using the offline fakes and no embedding cache. Then measures:
+
+    build           indexing everything from scratch
+    rebuild         rebuilding one library's index (monolithic: everything)
+    query (all)     retrieval over every library
+    query (one)     retrieval scoped to one library (monolithic: cannot scope)
+
+Shards are searched on a thread pool, which overlaps waiting rather than computing: pass
+--search-latency to add a round trip to every index search, as a Chroma server or another
+remote store would, to see the fan-out run in parallel.
+
+    python benchmarks/shard_fanout.py --shards 8 --files 100 --questions 100
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for path in (HERE, os.path.join(HERE, "..", "sharepoint")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fakes import FakeEmbeddings, fake_llm, make_corpus, make_questions
+
+
+def write_corpus(data_dir, corpus):
+    for relative, content in corpus:
+        path = os.path.join(data_dir, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def remote(search, latency):
+    """`search` behind a simulated network round trip."""
+    def call(*args, **kwargs):
+        time.sleep(latency)
+        return search(*args, **kwargs)
+    return call
+
+
+def latencies(retrieve, questions):
+    samples = []
+    for question in questions:
+        _, seconds = timed(lambda: retrieve(question))
+        samples.append(seconds * 1000)
+    samples.sort()
+    return {"p50_ms": round(statistics.median(samples), 2),
+            "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 2)}
+
+
+def main(args):
+    from agent import SharePointAgent
+    from index_state import INDEX_STATE_FILENAME
+    from shards import ShardRegistry, ShardedAgent
+
+    work = tempfile.mkdtemp(prefix="shards-")
+    options = dict(llm=fake_llm(0), embedding_cache_dir=None, use_answer_cache=False)
+    try:
+        registry = ShardRegistry(os.path.join(work, "shards"))
+        mono_data = os.path.join(work, "mono", "data")
+        for n in range(args.shards):
+            shard = registry.add(f"site-{n}", "Documents")
+            corpus = make_corpus(args.files, args.words, seed=n)
+            write_corpus(shard.data_dir, corpus)
+            write_corpus(os.path.join(mono_data, shard.key), corpus)
+        first = registry.keys()[0]
+        everywhere = [q for n in range(args.shards)
+                      for q in make_questions(args.questions // args.shards + 1, args.files, seed=n)][:args.questions]
+        scoped = make_questions(args.questions, args.files, seed=0)
+
+        mono_embeddings = FakeEmbeddings(args.dim, args.embed_latency)
+        mono = SharePointAgent(data_dir=mono_data, persist_directory=os.path.join(work, "mono", "index"),
+                               embeddings=mono_embeddings, vector_backend=args.backend, **options)
+        sharded_embeddings = FakeEmbeddings(args.dim, args.embed_latency)
+        sharded = ShardedAgent(registry, embeddings=sharded_embeddings, vector_backend=args.backend,
+                               query_workers=args.workers, **options)
+
+        _, mono_build = timed(mono.create_vector_store)
+        _, sharded_build = timed(sharded.create_vector_store)
+
+        # Rebuilding one library: the monolithic agent has only one index to rebuild.
+        os.remove(os.path.join(mono.persist_directory, INDEX_STATE_FILENAME))
+        _, mono_rebuild = timed(mono.update_index)
+        _, shard_rebuild = timed(lambda: sharded.rebuild(first))
+
+        mono_embeddings.latency = sharded_embeddings.latency = 0
+        if args.search_latency:
+            mono.retrieve = remote(mono.retrieve, args.search_latency)
+            for key in registry.keys():
+                agent = sharded.shard_agent(key)
+                agent.scored_search = remote(agent.scored_search, args.search_latency)
+        results = {
+            "monolithic": {
+                "build_s": round(mono_build, 3),
+                "rebuild_s": round(mono_rebuild, 3),
+                "query_all": latencies(mono.retrieve, everywhere),
+                "query_one": latencies(mono.retrieve, scoped),
+            },
+            "sharded": {
+                "build_s": round(sharded_build, 3),
+                "rebuild_s": round(shard_rebuild, 3),
+                "query_all": latencies(sharded.retrieve, everywhere),
+                "query_one": latencies(lambda q: sharded.retrieve(q, shards=[first]), scoped),
+            },
+        }
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"{args.shards} libraries x {args.files} documents, {args.questions} questions, {args.backend} backend, "
+          f"{args.search_latency * 1000:g} ms per search round trip")
+    print(f"{'':<22}{'monolithic':>14}{'sharded':>14}")
+    for key in ("build_s", "rebuild_s"):
+        print(f"{key:<22}{results['monolithic'][key]:>14}{results['sharded'][key]:>14}")
+    for key in ("query_all", "query_one"):
+        for stat in ("p50_ms", "p95_ms"):
+            print(f"{key + ' ' + stat:<22}{results['monolithic'][key][stat]:>14}{results['sharded'][key][stat]:>14}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=8, help="Site/library shards")
+    parser.add_argument("--files", type=int, default=100, help="Documents per shard")
+    parser.add_argument("--words", type=int, default=1500, help="Words per document")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=8, help="Shards searched at once")
+    parser.add_argument("--dim", type=int, default=256, help="Fake embedding dimension")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per embedding call while indexing")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="Seconds added to every index search")
+    parser.add_argument("--backend", choices=("chroma", "local"), default="local")
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    main(parser.parse_args())
@@ -0,0 +1,91 @@
+"""
+Cold start of the SharePoint app's agent, measured in fresh processes.
+
+    import      `import agent` (what every Streamlit process pays before the first page)
+    first       building the OpenAI agent and opening an (empty) vector store
+    again       getting an agent for the same provider again, as a rerun, another session
+                or switching providers back does (a cache hit once agents are shared)
+
+Pass --rev to also measure an earlier revision (checked out in a temporary git worktree)
+and print both side by side:
+
+    python benchmarks/startup.py --rev HEAD~1 --repeat 5
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+PROBE = r"""
+import os, sys, json, time
+started = time.perf_counter()
+import agent
+imported = time.perf_counter()
+data_dir, persist_dir = sys.argv[1], sys.argv[2]
+options = dict(data_dir=data_dir, persist_directory=persist_dir, embedding_cache_dir=None)
+try:
+    from agent_cache import agent_cache
+    build = lambda: agent_cache.get(**options)
+except ImportError:
+    def build():
+        instance = agent.SharePointAgent(**options)
+        instance.create_vector_store()
+        return instance
+build()
+built = time.perf_counter()
+build()
+again = time.perf_counter()
+print(json.dumps({"import": imported - started, "first": built - imported, "again": again - built}))
+"""
+
+
+def measure(tree, repeat):
+    work = tempfile.mkdtemp(prefix="startup-")
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-startup-benchmark"),
+               PYTHONDONTWRITEBYTECODE="1")
+    samples = []
+    try:
+        os.makedirs(os.path.join(work, "data"))
+        for n in range(repeat):
+            persist = os.path.join(work, f"db-{n}")
+            output = subprocess.run([sys.executable, "-c", PROBE, os.path.join(work, "data"), persist],
+                                    cwd=os.path.join(tree, "sharepoint"), env=env, capture_output=True,
+                                    text=True, check=True).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return {key: round(statistics.median(s[key] for s in samples), 4) for key in samples[0]}
+
+
+def main(args):
+    results = {"current": measure(ROOT, args.repeat)}
+    if args.rev:
+        worktree = tempfile.mkdtemp(prefix="startup-rev-")
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, args.rev], cwd=ROOT, check=True,
+                       capture_output=True)
+        try:
+            results[args.rev] = measure(worktree, args.repeat)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=ROOT, capture_output=True)
+    print(f"{'seconds (median)':<18}" + "".join(f"{name:>14}" for name in results))
+    for key in ("import", "first", "again"):
+        print(f"{key:<18}" + "".join(f"{row[key]:>14.4f}" for row in results.values()))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rev", help="Earlier git revision to compare against, e.g. HEAD~1")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    main(parser.parse_args())
@@ -0,0 +1,290 @@
+"""
+Offline end-to-end benchmark of the SharePoint agent and the personal assistant.
+
+Runs against the fakes in benchmarks/fakes.py, so no OpenAI, Vertex AI or Graph credentials
+are needed. Each phase runs in a fresh process, so its peak RSS is its own:
+
+    sync      SharePointFetcher.sync_library from a fake drive (files/s, MB/s)
+    ingest    cold SharePointAgent index build (files/s, chunks/s, build time)
+    reopen    agent startup plus a no-op incremental index check
+    query     stream_query latency p50/p95/p99 (total, retrieval, first token)
+    email     OutlookManager fetch plus PersonalAssistant.analyze_emails (emails/s), the same
+              inbox analyzed per conversation, and the mailbox mirror's first sync versus a refresh
+    briefing  dashboard cold load: BriefingBuilder versus fetching mail, analysis and calendar in turn
+
+Results are written as JSON (--output); pass an earlier file as --compare to print the
+change per metric.
+
+    python benchmarks/suite.py --files 500 --questions 200 --emails 200 --output bench.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for path in (HERE, os.path.join(HERE, "..", "sharepoint"), os.path.join(HERE, "..", "personal_assistant")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fakes import FakeAccount, FakeEmbeddings, fake_llm, make_corpus, make_questions, make_messages
+
+PHASES = ("sync", "ingest", "reopen", "query", "email", "briefing")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where `resource` is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def percentiles(values, prefix):
+    if not values:
+        return {}
+    return {f"{prefix}_p{p}_ms": round(float(np.percentile(values, p)) * 1000, 2) for p in (50, 95, 99)}
+
+
+def _agent(args, embeddings):
+    from agent import SharePointAgent
+    return SharePointAgent(data_dir=os.path.join(args.work, "data"),
+                           persist_directory=os.path.join(args.work, "db"),
+                           embeddings=embeddings, llm=fake_llm(args.llm_latency),
+                           embedding_cache_dir=None, use_answer_cache=False,
+                           vector_backend=args.backend)
+
+
+def phase_sync(args):
+    from sharepoint_connector import SharePointFetcher
+    corpus = make_corpus(args.files, args.words, args.seed)
+    account = FakeAccount(files=corpus, latency=args.graph_latency)
+    fetcher = SharePointFetcher(None, None, account=account)
+    started = time.perf_counter()
+    result = fetcher.sync_library("Benchmark", "Documents", os.path.join(args.work, "data"))
+    seconds = time.perf_counter() - started
+    total_bytes = sum(len(content) for _, content in corpus)
+    return {
+        "files": len(result.added),
+        "seconds": round(seconds, 3),
+        "files_per_second": round(len(result.added) / seconds, 2),
+        "mb_per_second": round(total_bytes / 1e6 / seconds, 2),
+        "requests": account.con.requests,
+    }
+
+
+def phase_ingest(args):
+    embeddings = FakeEmbeddings(args.dim, args.embed_latency)
+    started = time.perf_counter()
+    agent = _agent(args, embeddings)
+    agent.create_vector_store()
+    seconds = time.perf_counter() - started
+    files = len(agent.index_state.files)
+    chunks = sum(len(entry["chunks"]) for entry in agent.index_state.files.values())
+    return {
+        "files": files,
+        "chunks": chunks,
+        "index_build_seconds": round(seconds, 3),
+        "files_per_second": round(files / seconds, 2),
+        "chunks_per_second": round(chunks / seconds, 2),
+        "embedding_calls": embeddings.calls,
+    }
+
+
+def phase_reopen(args):
+    embeddings = FakeEmbeddings(args.dim, args.embed_latency)
+    started = time.perf_counter()
+    agent = _agent(args, embeddings)
+    agent.create_vector_store()
+    return {"seconds": round(time.perf_counter() - started, 3), "embedding_calls": embeddings.calls}
+
+
+def phase_query(args):
+    from agent import QueryTimings
+    agent = _agent(args, FakeEmbeddings(args.dim, args.embed_latency))
+    agent.create_vector_store()
+    totals, retrievals, first_tokens = [], [], []
+    started = time.perf_counter()
+    for question in make_questions(args.questions, args.files, args.seed):
+        timings = QueryTimings()
+        "".join(agent.stream_query(question, timings))
+        totals.append(timings.total)
+        retrievals.append(timings.retrieval)
+        first_tokens.append(timings.first_token)
+    seconds = time.perf_counter() - started
+    return {
+        "questions": args.questions,
+        "queries_per_second": round(args.questions / seconds, 2),
+        **percentiles(totals, "total"),
+        **percentiles(retrievals, "retrieval"),
+        **percentiles(first_tokens, "first_token"),
+    }
+
+
+def phase_email(args):
+    from outlook_service import OutlookManager
+    from assistant_logic import PersonalAssistant
+    account = FakeAccount(messages=make_messages(args.emails, args.seed), latency=args.graph_latency)
+    assistant = PersonalAssistant(llm=fake_llm(args.llm_latency), cache_path=None)
+
+    # Direct inbox query, as without the mirror.
+    manager = OutlookManager(None, None, account=account, mirror_path=None)
+    started = time.perf_counter()
+    emails = manager.get_unread_emails_summary(limit=args.emails)
+    fetched = time.perf_counter()
+    assistant.analyze_emails(emails, max_concurrency=args.concurrency)
+    done = time.perf_counter()
+
+    # One LLM call per conversation instead of per message.
+    from outlook_service import group_conversations
+    conversations = group_conversations(emails)
+    thread_assistant = PersonalAssistant(llm=fake_llm(args.llm_latency), cache_path=None)
+    thread_started = time.perf_counter()
+    thread_assistant.analyze_conversations(conversations, max_concurrency=args.concurrency)
+    thread_seconds = time.perf_counter() - thread_started
+
+    # Mailbox mirror: the first sync downloads the inbox, later ones only the (empty) delta.
+    mirrored = OutlookManager(None, None, account=account, mirror_path=os.path.join(args.work, "mailbox.sqlite"),
+                              history_days=36500)
+    mirror_started = time.perf_counter()
+    mirrored.get_unread_emails_summary(limit=None)
+    mirror_cold = time.perf_counter()
+    requests_before = account.con.requests
+    mirrored.get_unread_emails_summary(limit=None)
+    mirror_warm = time.perf_counter()
+    return {
+        "emails": len(emails),
+        "fetch_seconds": round(fetched - started, 3),
+        "analyze_seconds": round(done - fetched, 3),
+        "emails_per_second": round(len(emails) / (done - started), 2),
+        "conversations": len(conversations),
+        "conversation_analyze_seconds": round(thread_seconds, 3),
+        "mirror_first_sync_seconds": round(mirror_cold - mirror_started, 3),
+        "mirror_refresh_ms": round((mirror_warm - mirror_cold) * 1000, 2),
+        "mirror_read_requests": account.con.requests - requests_before,
+    }
+
+
+def phase_briefing(args):
+    from outlook_service import OutlookManager
+    from assistant_logic import PersonalAssistant
+    from briefing import BriefingBuilder
+    account = FakeAccount(messages=make_messages(args.emails, args.seed), latency=args.graph_latency)
+    manager = OutlookManager(None, None, account=account, mirror_path=None)
+
+    assistant = PersonalAssistant(llm=fake_llm(args.llm_latency), cache_path=None)
+    started = time.perf_counter()
+    assistant.analyze_emails(manager.get_unread_emails_summary(limit=args.emails), max_concurrency=args.concurrency)
+    manager.get_todays_meetings()
+    manager.get_tasks()
+    sequential = time.perf_counter() - started
+
+    assistant = PersonalAssistant(llm=fake_llm(args.llm_latency), cache_path=None)
+    started = time.perf_counter()
+    briefing = BriefingBuilder(manager, assistant, email_limit=args.emails, max_concurrency=args.concurrency,
+                               timeouts={"emails": 600, "meetings": 600, "tasks": 600}).build()
+    concurrent = time.perf_counter() - started
+    return {
+        "emails": len(briefing.emails),
+        "sequential_seconds": round(sequential, 3),
+        "builder_seconds": round(concurrent, 3),
+        "speedup": round(sequential / concurrent, 2),
+    }
+
+
+def run_phase(name, args):
+    """Runs one phase in this (fresh) process; returns its metrics plus peak RSS."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+        metrics = globals()[f"phase_{name}"](args)
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    for phase, metrics in current["phases"].items():
+        before = previous.get("phases", {}).get(phase, {})
+        for key, value in metrics.items():
+            old = before.get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                print(f"  {phase:<7} {key:<24} {old:>12} -> {value:<12} ({(value - old) / old:+.1%})")
+
+
+def main(args):
+    own_work = args.work is None
+    args.work = args.work or tempfile.mkdtemp(prefix="bench-")
+    context = multiprocessing.get_context("spawn")
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("work", "output", "compare", "verbose")},
+        },
+        "phases": {},
+    }
+    try:
+        for name in args.phases:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                metrics = executor.submit(run_phase, name, args).result()
+            results["phases"][name] = metrics
+            print(f"{name:<7} " + ", ".join(f"{k}={v}" for k, v in metrics.items()))
+    finally:
+        if own_work:
+            shutil.rmtree(args.work, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print(f"Change versus {args.compare}:")
+            compare(json.load(f), results)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phases", nargs="+", choices=PHASES, default=list(PHASES),
+                        help="Phases to run; query/reopen need a previous ingest in --work")
+    parser.add_argument("--files", type=int, default=200, help="Documents in the fake drive")
+    parser.add_argument("--words", type=int, default=1500, help="Words per document")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--emails", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=256, help="Fake embedding dimension")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per embedding request")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per LLM call")
+    parser.add_argument("--graph-latency", type=float, default=0.01, help="Seconds per Graph request")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent email analyses")
+    parser.add_argument("--backend", choices=("chroma", "local"), default=None,
+                        help="Vector store (default: VECTOR_BACKEND or chroma)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work", help="Working directory to keep (default: a temporary one)")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the apps' own output")
+    main(parser.parse_args())
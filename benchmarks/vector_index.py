@@ -0,0 +1,154 @@
+"""
+LocalVectorIndex versus Chroma on a synthetic corpus: recall, startup, query latency and size.
+
+Embeddings are clustered random unit vectors served by a lookup-table embeddings object, so
+no API calls are made. Recall@k is reported against Chroma's results (what the agent uses
+today) and against exact float32 search.
+
+    python benchmarks/vector_index.py --size 20000 --dim 1536 --queries 200
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sharepoint"))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from vector_index import LocalVectorIndex
+
+BATCH = 1000
+
+
+class TableEmbeddings(Embeddings):
+    """Maps "chunk <n>" / "query <n>" texts to precomputed vectors."""
+
+    def __init__(self, documents, queries):
+        self.documents = documents
+        self.queries = queries
+
+    def embed_documents(self, texts):
+        return [self.documents[int(t.split()[1])].tolist() for t in texts]
+
+    def embed_query(self, text):
+        return self.queries[int(text.split()[1])].tolist()
+
+
+def make_corpus(size, dim, queries, clusters=200, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    docs = centers[rng.integers(clusters, size=size)] + 0.5 * rng.normal(size=(size, dim))
+    qs = centers[rng.integers(clusters, size=queries)] + 0.5 * rng.normal(size=(queries, dim))
+    docs /= np.linalg.norm(docs, axis=1, keepdims=True)
+    qs /= np.linalg.norm(qs, axis=1, keepdims=True)
+    return docs.astype(np.float32), qs.astype(np.float32)
+
+
+def disk_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def build(store, size):
+    started = time.perf_counter()
+    for i in range(0, size, BATCH):
+        chunk = range(i, min(i + BATCH, size))
+        store.add_documents([Document(page_content=f"chunk {n}", metadata={"source": f"doc-{n // 10}"})
+                             for n in chunk], ids=[f"id-{n}" for n in chunk])
+    return time.perf_counter() - started
+
+
+def run_queries(store, embeddings, k):
+    results = []
+    latencies = []
+    for q in range(len(embeddings.queries)):
+        started = time.perf_counter()
+        docs = store.similarity_search_by_vector(embeddings.embed_query(f"query {q}"), k=k)
+        latencies.append(time.perf_counter() - started)
+        results.append([int(d.page_content.split()[1]) for d in docs])
+    return results, latencies
+
+
+def recall(results, truth, k):
+    return float(np.mean([len(set(r[:k]) & set(t[:k])) / k for r, t in zip(results, truth)]))
+
+
+def measure(name, open_store, embeddings, size, k, truth, baseline, directory):
+    store = open_store()
+    build_seconds = build(store, size)
+    del store
+
+    started = time.perf_counter()
+    store = open_store()
+    open_seconds = time.perf_counter() - started
+    results, latencies = run_queries(store, embeddings, k)
+    row = {
+        "backend": name,
+        "build_seconds": round(build_seconds, 3),
+        "open_seconds": round(open_seconds, 4),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "disk_mb": round(disk_bytes(directory) / 1e6, 2),
+        f"recall@{k}_exact": round(recall(results, truth, k), 4),
+    }
+    if baseline is not None:
+        row[f"recall@{k}_chroma"] = round(recall(results, baseline, k), 4)
+    print(f"{name:<22} build {row['build_seconds']:>8.2f}s  open {row['open_seconds']:>7.3f}s  "
+          f"p50 {row['query_p50_ms']:>7.2f}ms  p95 {row['query_p95_ms']:>7.2f}ms  "
+          f"disk {row['disk_mb']:>8.1f}MB  recall(exact) {row[f'recall@{k}_exact']:.3f}"
+          + (f"  recall(chroma) {row[f'recall@{k}_chroma']:.3f}" if baseline is not None else ""))
+    return row, results
+
+
+def run(size, dim, queries, k, n_lists):
+    docs, qs = make_corpus(size, dim, queries)
+    embeddings = TableEmbeddings(docs, qs)
+    truth = np.argsort(-(qs @ docs.T), axis=1)[:, :k].tolist()
+
+    rows = []
+    baseline = None
+    work = tempfile.mkdtemp()
+    try:
+        try:
+            from langchain_chroma import Chroma
+        except ImportError:
+            print("langchain_chroma not installed; recall is reported against exact search only.")
+        else:
+            directory = os.path.join(work, "chroma")
+            row, baseline = measure("chroma", lambda: Chroma(persist_directory=directory, embedding_function=embeddings),
+                                    embeddings, size, k, truth, None, directory)
+            rows.append(row)
+
+        variants = [("local float16", "float16", 0), ("local int8", "int8", 0)]
+        if n_lists:
+            variants += [(f"local float16 ivf{n_lists}", "float16", n_lists),
+                         (f"local int8 ivf{n_lists}", "int8", n_lists)]
+        for name, dtype, lists in variants:
+            directory = os.path.join(work, name.replace(" ", "_"))
+            row, _ = measure(name, lambda: LocalVectorIndex(directory, embeddings, dtype=dtype, n_lists=lists),
+                             embeddings, size, k, truth, baseline, directory)
+            rows.append(row)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=20000, help="Number of chunks")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--ivf-lists", type=int, default=64, help="IVF lists for the partitioned variants (0 = skip)")
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    args = parser.parse_args()
+
+    rows = run(args.size, args.dim, args.queries, args.k, args.ivf_lists)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
@@ -0,0 +1 @@
+"""Modules shared by the sharepoint/ and personal_assistant/ apps."""
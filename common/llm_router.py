@@ -0,0 +1,276 @@
+"""
+Latency-aware routing over several chat models (e.g. OpenAI and Vertex AI), with hedging and failover.
+
+`LLMRouter` is a Runnable, so it drops into `prompt | llm | parser` chains in place of a
+single model. Per provider it keeps recent latencies (time to first token when streaming,
+whole-call time otherwise) and recent outcomes:
+
+- Each request goes to the provider with the lowest recent latency (a moving average,
+  inflated by the provider's recent error rate; a provider later in the list must be
+  `PREFERENCE_MARGIN` times faster to take over).
+- If no output has arrived once the request passes that provider's p95 latency, one hedged
+  request is sent to the next provider and whichever answers first is used; the other is
+  abandoned, and its elapsed time is recorded as a (lower bound) latency sample.
+- An error fails over to the next provider. A provider failing `MIN_ERRORS` calls in a row,
+  or at least half of its recent calls, is skipped for `COOLDOWN` seconds, then tried again.
+
+Once a streamed answer has started, a later error is raised rather than retried elsewhere.
+
+Shared by sharepoint/ and personal_assistant/, which import it as `llm_router` (see their llm_router.py).
+"""
+import math
+import time
+import queue
+import threading
+import contextvars
+from collections import deque
+
+from langchain_core.runnables import Runnable
+from common.telemetry import telemetry
+
+# Recent latencies kept per provider for the hedge threshold.
+LATENCY_WINDOW = 100
+# Hedge once a request passes this quantile of the provider's recent latencies...
+HEDGE_QUANTILE = 0.95
+# ...measured over at least this many calls; until then, after DEFAULT_HEDGE_AFTER seconds.
+MIN_SAMPLES = 10
+DEFAULT_HEDGE_AFTER = 3.0
+MIN_HEDGE_AFTER = 0.05
+# Weight of the newest sample in the moving average used for ordering.
+EWMA_ALPHA = 0.3
+PREFERENCE_MARGIN = 1.25
+# Cool a provider down after MIN_ERRORS consecutive errors, or MIN_ERRORS errors making up
+# MAX_ERROR_RATE of its last ERROR_WINDOW calls.
+ERROR_WINDOW = 20
+MIN_ERRORS = 3
+MAX_ERROR_RATE = 0.5
+COOLDOWN = 30.0
+
+
+def model_name(model) -> str:
+    return getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__
+
+
+class ProviderStats:
+    """Rolling latency and error statistics for one provider."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        # "stream": time to first chunk; "invoke": whole call.
+        self.latencies = {"stream": deque(maxlen=window), "invoke": deque(maxlen=window)}
+        self.ewma = {}
+        self.outcomes = deque(maxlen=ERROR_WINDOW)
+        self.cooling_until = 0.0
+        self.consecutive_errors = 0
+        self.calls = self.errors = self.wins = self.hedges = self.failovers = 0
+
+    def observe(self, kind, seconds):
+        self.latencies[kind].append(seconds)
+        previous = self.ewma.get(kind)
+        self.ewma[kind] = seconds if previous is None else previous + EWMA_ALPHA * (seconds - previous)
+
+    def quantile(self, kind, q):
+        samples = sorted(self.latencies[kind])
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(math.ceil(q * len(samples))) - 1)]
+
+    @property
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def to_dict(self, now):
+        return {
+            "calls": self.calls, "wins": self.wins, "errors": self.errors, "hedges": self.hedges,
+            "failovers": self.failovers, "error_rate": round(self.error_rate, 3),
+            "cooling_down_s": round(max(0.0, self.cooling_until - now), 1),
+            **{f"{kind}_{name}_s": round(value, 4) for kind in self.latencies
+               for name, value in (("p50", self.quantile(kind, 0.5)), ("p95", self.quantile(kind, HEDGE_QUANTILE)))
+               if value is not None},
+        }
+
+
+class _Attempt:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.cancelled = threading.Event()
+
+
+class LLMRouter(Runnable):
+    """
+    Routes each call to one of several chat models, hedging slow calls and failing over on errors.
+
+    Args:
+        providers: {name: model} (or a list of models, named by their model name), most
+            preferred first. Any Runnable taking a prompt works, including the benchmark fakes.
+        hedge: Send a second request when the first is slower than the hedge threshold.
+    """
+
+    def __init__(self, providers, hedge=True, hedge_quantile=HEDGE_QUANTILE, default_hedge_after=DEFAULT_HEDGE_AFTER,
+                 min_hedge_after=MIN_HEDGE_AFTER, cooldown=COOLDOWN):
+        if not isinstance(providers, dict):
+            providers = {model_name(model): model for model in providers}
+        if not providers:
+            raise ValueError("LLMRouter needs at least one provider")
+        self.providers = dict(providers)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_after = default_hedge_after
+        self.min_hedge_after = min_hedge_after
+        self.cooldown = cooldown
+        self._stats = {name: ProviderStats() for name in self.providers}
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self) -> str:
+        return "router(" + ",".join(model_name(model) for model in self.providers.values()) + ")"
+
+    def invoke(self, input, config=None, **kwargs):
+        return next(self._race(input, config, kwargs, "invoke"))
+
+    def stream(self, input, config=None, **kwargs):
+        yield from self._race(input, config, kwargs, "stream")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {name: stats.to_dict(now) for name, stats in self._stats.items()}
+
+    # --- routing -----------------------------------------------------------------------
+
+    def ordered(self, kind="stream"):
+        """Provider names in the order they would be tried now."""
+        now = time.monotonic()
+        with self._lock:
+            def key(item):
+                index, name = item
+                stats = self._stats[name]
+                latency = stats.ewma.get(kind)
+                # Providers without samples keep their configured place behind measured ones.
+                cost = (latency or 0.0) * PREFERENCE_MARGIN ** index / max(0.05, 1.0 - stats.error_rate)
+                return (stats.cooling_until > now, latency is None, cost, index)
+            return [name for _, name in sorted(enumerate(self.providers), key=key)]
+
+    def hedge_after(self, name, kind="stream") -> float:
+        """Seconds without output after which a call to `name` is hedged."""
+        with self._lock:
+            stats = self._stats[name]
+            if len(stats.latencies[kind]) < MIN_SAMPLES:
+                return self.default_hedge_after
+            return max(self.min_hedge_after, stats.quantile(kind, self.hedge_quantile))
+
+    def _race(self, input, config, kwargs, kind):
+        # Parallel attempts must not share a run id.
+        config = {key: value for key, value in (config or {}).items() if key != "run_id"}
+        events = queue.Queue()
+        pending = self.ordered(kind)
+        running = set()
+
+        def launch(reason):
+            attempt = _Attempt(pending.pop(0))
+            running.add(attempt)
+            with self._lock:
+                stats = self._stats[attempt.name]
+                stats.calls += 1
+                if reason == "hedge":
+                    stats.hedges += 1
+                elif reason == "failover":
+                    stats.failovers += 1
+            telemetry.count("llm_router", provider=attempt.name, reason=reason)
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(self._run, attempt, input, config, kwargs, kind, events),
+                             name=f"llm-{attempt.name}", daemon=True).start()
+            return attempt
+
+        first = launch("primary")
+        hedge_at = first.started + self.hedge_after(first.name, kind) if self.hedge and pending else None
+        winner = None
+        try:
+            while winner is None:
+                timeout = None if hedge_at is None else max(0.0, hedge_at - time.perf_counter())
+                try:
+                    attempt, event, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    launch("hedge")
+                    hedge_at = None
+                    continue
+                if event == "error":
+                    running.discard(attempt)
+                    self._failed(attempt, value)
+                    if running:
+                        continue
+                    if not pending:
+                        raise value
+                    current = launch("failover")
+                    hedge_at = (current.started + self.hedge_after(current.name, kind)
+                                if self.hedge and pending else None)
+                    continue
+                winner = attempt
+                self._won(winner, running - {winner}, kind)
+                if event == "done":
+                    return
+                yield value
+            while kind == "stream":
+                attempt, event, value = events.get()
+                if attempt is not winner:
+                    continue
+                if event == "done":
+                    return
+                if event == "error":
+                    self._failed(winner, value)
+                    raise value
+                yield value
+        finally:
+            for attempt in running:
+                attempt.cancelled.set()
+
+    def _run(self, attempt, input, config, kwargs, kind, events):
+        model = self.providers[attempt.name]
+        try:
+            if kind == "invoke":
+                events.put((attempt, "result", model.invoke(input, config, **kwargs)))
+                return
+            chunks = model.stream(input, config, **kwargs)
+            try:
+                for chunk in chunks:
+                    if attempt.cancelled.is_set():
+                        return
+                    events.put((attempt, "chunk", chunk))
+            finally:
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+            events.put((attempt, "done", None))
+        except Exception as e:
+            events.put((attempt, "error", e))
+
+    def _won(self, winner, losers, kind):
+        now = time.perf_counter()
+        with self._lock:
+            stats = self._stats[winner.name]
+            stats.wins += 1
+            stats.outcomes.append(True)
+            stats.consecutive_errors = 0
+            stats.observe(kind, now - winner.started)
+            for loser in losers:
+                # Still running when abandoned: it took at least this long.
+                loser.cancelled.set()
+                self._stats[loser.name].observe(kind, now - loser.started)
+        if telemetry.enabled:
+            telemetry.observe("llm_router.latency", now - winner.started, provider=winner.name, kind=kind,
+                              hedged=bool(losers))
+
+    def _failed(self, attempt, error):
+        cooled = False
+        with self._lock:
+            stats = self._stats[attempt.name]
+            stats.errors += 1
+            stats.outcomes.append(False)
+            stats.consecutive_errors += 1
+            if stats.consecutive_errors >= MIN_ERRORS or (stats.outcomes.count(False) >= MIN_ERRORS
+                                                         and stats.error_rate >= MAX_ERROR_RATE):
+                cooled = stats.cooling_until <= time.monotonic()
+                stats.cooling_until = time.monotonic() + self.cooldown
+        telemetry.count("llm_router_errors", provider=attempt.name, error=type(error).__name__)
+        if cooled:
+            print(f"LLM provider {attempt.name} is failing ({error}); skipping it for {self.cooldown:g}s.")
@@ -0,0 +1,358 @@
+"""
+Lightweight spans and counters for timing the apps' stages.
+
+Configured with the AGENT_TELEMETRY environment variable (comma separated):
+
+    memory              keep per-stage statistics in process (for the Streamlit timing panels)
+    jsonl:<path>        also append every finished span, and counters on flush, as JSON lines
+    prometheus:<port>   also serve the statistics in Prometheus text format on localhost:<port>
+
+Unset means disabled: `span()` returns a shared no-op object and `count()` returns at once,
+so instrumented code pays one attribute check. It can also be switched on at runtime with
+`telemetry.enable()`.
+
+Shared by sharepoint/ and personal_assistant/, which import it as `telemetry` (see their telemetry.py).
+"""
+import os
+import json
+import time
+import atexit
+import random
+import threading
+import contextvars
+from collections import deque
+
+TELEMETRY_ENV = "AGENT_TELEMETRY"
+# Durations kept per stage for percentiles.
+RESERVOIR_SIZE = 1024
+RECENT_SPANS = 200
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+
+def estimate_tokens(text) -> int:
+    """Token count with tiktoken when available, otherwise the usual ~4 characters per token."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+class _NoopSpan:
+    """Returned while telemetry is disabled; every operation does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("telemetry", "name", "attributes", "span_id", "parent_id", "trace_id",
+                 "start", "wall_start", "duration", "error", "_token")
+
+    def __init__(self, telemetry, name, attributes):
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+        self.span_id = "%016x" % random.getrandbits(64)
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.duration = None
+        self.error = None
+        self._token = _current_span.set(self)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.start
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Ended from another context (e.g. a generator closed elsewhere); nothing to restore.
+            pass
+        self.telemetry._finish(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.end()
+        return False
+
+    def to_dict(self):
+        return {
+            "type": "span",
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.wall_start, 6),
+            "seconds": round(self.duration, 6),
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _Stage:
+    """Count, total, max and a reservoir of recent durations for one span name."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.samples = deque(maxlen=RESERVOIR_SIZE)
+
+    def add(self, seconds, error=False):
+        self.count += 1
+        self.errors += bool(error)
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+        self.samples.append(seconds)
+
+    def quantile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_s": round(self.total, 4),
+            "mean_s": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50_s": round(self.quantile(0.5), 4),
+            "p95_s": round(self.quantile(0.95), 4),
+            "max_s": round(self.max, 4),
+            "last_s": round(self.last, 4),
+        }
+
+
+class Telemetry:
+    def __init__(self):
+        self.enabled = False
+        self.jsonl_path = None
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._recent = deque(maxlen=RECENT_SPANS)
+        self._jsonl = None
+        self._server = None
+
+    @classmethod
+    def from_env(cls):
+        instance = cls()
+        for part in filter(None, (p.strip() for p in os.getenv(TELEMETRY_ENV, "").split(","))):
+            kind, _, value = part.partition(":")
+            if kind == "memory":
+                instance.enable()
+            elif kind == "jsonl":
+                instance.enable(jsonl_path=value or "telemetry.jsonl")
+            elif kind == "prometheus":
+                instance.enable()
+                instance.serve_prometheus(int(value or 9464))
+            else:
+                print(f"Ignoring unknown {TELEMETRY_ENV} entry: {part}")
+        return instance
+
+    def enable(self, jsonl_path=None):
+        if jsonl_path and jsonl_path != self.jsonl_path:
+            with self._lock:
+                if self._jsonl:
+                    self._jsonl.close()
+                self._jsonl = open(jsonl_path, "a", encoding="utf-8")
+                self.jsonl_path = jsonl_path
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    # --- recording --------------------------------------------------------------------
+
+    def span(self, name, **attributes):
+        """Times a block: `with telemetry.span("stage", key=value) as span: ...`."""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def count(self, name, value=1, **labels):
+        """Adds to a counter, e.g. count("llm_tokens", 120, direction="in")."""
+        if not self.enabled or not value:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **attributes):
+        """Records a duration measured elsewhere as if it were a span."""
+        if not self.enabled:
+            return
+        span = Span(self, name, attributes)
+        span.start -= seconds
+        span.wall_start -= seconds
+        span.end()
+
+    def _finish(self, span):
+        with self._lock:
+            stage = self._stages.get(span.name)
+            if stage is None:
+                stage = self._stages[span.name] = _Stage()
+            stage.add(span.duration, span.error)
+            self._recent.append(span)
+            if self._jsonl:
+                self._jsonl.write(json.dumps(span.to_dict(), default=str) + "\n")
+                self._jsonl.flush()
+
+    # --- reading ----------------------------------------------------------------------
+
+    def snapshot(self) -> dict:
+        """{"stages": {name: stats}, "counters": {name{labels}: value}}."""
+        with self._lock:
+            return {
+                "stages": {name: stage.to_dict() for name, stage in sorted(self._stages.items())},
+                "counters": {_counter_name(name, labels): value
+                             for (name, labels), value in sorted(self._counters.items())},
+            }
+
+    def stage_rows(self) -> list:
+        """Per-stage statistics as rows, slowest total first (for st.dataframe)."""
+        rows = [dict(stage=name, **stats) for name, stats in self.snapshot()["stages"].items()]
+        return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+    def recent_spans(self, limit=50) -> list:
+        with self._lock:
+            return [span.to_dict() for span in list(self._recent)[-limit:]]
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._recent.clear()
+
+    def flush(self):
+        """Writes the current counters to the JSON lines file."""
+        with self._lock:
+            if not self._jsonl:
+                return
+            counters = {_counter_name(name, labels): value for (name, labels), value in self._counters.items()}
+            self._jsonl.write(json.dumps({"type": "counters", "time": time.time(), "counters": counters}) + "\n")
+            self._jsonl.flush()
+
+    # --- Prometheus -------------------------------------------------------------------
+
+    def render_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = ["# TYPE agent_stage_seconds summary"]
+        for name, stats in snapshot["stages"].items():
+            label = f'stage="{_escape(name)}"'
+            lines.append(f'agent_stage_seconds{{{label},quantile="0.5"}} {stats["p50_s"]}')
+            lines.append(f'agent_stage_seconds{{{label},quantile="0.95"}} {stats["p95_s"]}')
+            lines.append(f"agent_stage_seconds_sum{{{label}}} {stats['total_s']}")
+            lines.append(f"agent_stage_seconds_count{{{label}}} {stats['count']}")
+        with self._lock:
+            counters = sorted(self._counters.items())
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"agent_{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port=9464):
+        """Serves /metrics on localhost in a daemon thread (once per process)."""
+        if self._server is not None:
+            return
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = telemetry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        except OSError as e:
+            print(f"Prometheus endpoint not started on port {port}: {e}")
+            return
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+
+
+def render_streamlit_panel(title="⏱ Timings"):
+    """Sidebar panel with per-stage timings and counters, plus a switch to collect them."""
+    import streamlit as st
+
+    with st.sidebar.expander(title):
+        collect = st.checkbox("Collect timings", value=telemetry.enabled, key="telemetry_enabled")
+        if collect and not telemetry.enabled:
+            telemetry.enable()
+        elif not collect and telemetry.enabled:
+            telemetry.disable()
+        if not collect:
+            st.caption(f"Or set {TELEMETRY_ENV}=memory, jsonl:<path> or prometheus:<port> before starting.")
+            return
+        rows = telemetry.stage_rows()
+        if rows:
+            st.dataframe(rows, hide_index=True)
+        else:
+            st.caption("No stages recorded yet.")
+        counters = telemetry.snapshot()["counters"]
+        if counters:
+            st.json(counters)
+        if st.button("Reset timings"):
+            telemetry.reset()
+
+
+def _counter_name(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide instance; Streamlit reruns and sessions share it.
+telemetry = Telemetry.from_env()
+atexit.register(telemetry.flush)
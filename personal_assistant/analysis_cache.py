@@ -0,0 +1,123 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+ANALYSIS_CACHE_PATH = "analysis_cache.sqlite"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def email_content_hash(email: dict) -> str:
+    """Hash of the parts of an email the LLM sees, so edits invalidate the cached analysis."""
+    content = "\n".join([email.get("sender") or "", email.get("subject") or "", email.get("body_preview") or ""])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Persistent cache of LLM email analyses in SQLite.
+
+    Entries are keyed by message id plus a hash of the analyzed content, expire after
+    `ttl_seconds`, and the least recently used ones are evicted beyond `max_entries`.
+    Conversation analyses are kept alongside, with the ids of the messages they cover.
+    """
+
+    def __init__(self, path=ANALYSIS_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                message_id TEXT, content_hash TEXT, analysis TEXT, created REAL, last_used REAL,
+                PRIMARY KEY (message_id, content_hash))
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS analyses_lru ON analyses (last_used)")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                conversation_id TEXT PRIMARY KEY, message_ids TEXT, analysis TEXT, updated REAL)
+        """)
+        self._db.commit()
+
+    def get_many(self, emails: list) -> dict:
+        """Returns {position: analysis} for emails with a fresh cached analysis."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i, email in enumerate(emails):
+                if not email.get("id"):
+                    self.misses += 1
+                    continue
+                key = (email["id"], email_content_hash(email))
+                row = self._db.execute(
+                    "SELECT analysis, created FROM analyses WHERE message_id = ? AND content_hash = ?",
+                    key).fetchone()
+                if row is None or now - row[1] > self.ttl_seconds:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                found[i] = json.loads(row[0])
+                self._db.execute("UPDATE analyses SET last_used = ? WHERE message_id = ? AND content_hash = ?",
+                                 (now, *key))
+            self._db.commit()
+        return found
+
+    def put_many(self, items):
+        """Stores (email, analysis) pairs, replacing older analyses of the same message."""
+        now = time.time()
+        with self._lock:
+            for email, analysis in items:
+                if not email.get("id"):
+                    continue
+                # An edited message makes the previous analysis useless.
+                self._db.execute("DELETE FROM analyses WHERE message_id = ?", (email["id"],))
+                self._db.execute("INSERT INTO analyses VALUES (?, ?, ?, ?, ?)",
+                                 (email["id"], email_content_hash(email), json.dumps(analysis), now, now))
+            self._evict(now)
+            self._db.commit()
+
+    def get_conversations(self, conversation_ids) -> dict:
+        """Returns {conversation id: (set of analyzed message ids, analysis)} for fresh entries."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for conversation_id in conversation_ids:
+                row = self._db.execute(
+                    "SELECT message_ids, analysis, updated FROM conversations WHERE conversation_id = ?",
+                    (conversation_id,)).fetchone()
+                if row is None or now - row[2] > self.ttl_seconds:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                found[conversation_id] = (set(json.loads(row[0])), json.loads(row[1]))
+        return found
+
+    def put_conversations(self, items):
+        """Stores (conversation id, analyzed message ids, analysis) triples."""
+        now = time.time()
+        with self._lock:
+            for conversation_id, message_ids, analysis in items:
+                self._db.execute("INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?)",
+                                 (conversation_id, json.dumps(sorted(message_ids)), json.dumps(analysis), now))
+            self._db.execute("DELETE FROM conversations WHERE updated < ?", (now - self.ttl_seconds,))
+            self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM analyses WHERE created < ?", (now - self.ttl_seconds,))
+        count = self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute("""
+                DELETE FROM analyses WHERE rowid IN (
+                    SELECT rowid FROM analyses ORDER BY last_used LIMIT ?)
+            """, (count - self.max_entries,))
+
+    def close(self):
+        self._db.close()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
@@ -4,33 +4,13 @@ from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from dotenv import load_dotenv
+from analysis_cache import AnalysisCache, ANALYSIS_CACHE_PATH
+from llm_router import LLMRouter
+from telemetry import telemetry, estimate_tokens
 
 load_dotenv()
 
-class PersonalAssistant:
-    def __init__(self):
-        # Default to GPT unless configured otherwise
-        self.llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7)
-
-    def analyze_emails(self, emails: list):
-        """
-        Summarizes emails and extracts actionable items.
-        
-        Args:
-            emails (list): List of email dicts {sender, subject, body_preview}
-            
-        Returns:
-            list: List of analyzed items {summary, priority, action_item, context}
-        """
-        if not emails:
-            return []
-
-        # Prompt for batch processing (or loop individually if too long)
-        # For simplicity, let's process top 5 together or loop.
-        
-        results = []
-        
-        template = """
+ANALYSIS_TEMPLATE = """
         You are my personal executive assistant. Analyze this email.
         
         Sender: {sender}
@@ -51,32 +31,303 @@ class PersonalAssistant:
             "next_step": "..."
         }}
         """
-        prompt = ChatPromptTemplate.from_template(template)
-        chain = prompt | self.llm | JsonOutputParser()
-
-        for email in emails:
-            try:
-                analysis = chain.invoke(email)
-                analysis['original_subject'] = email['subject']
-                analysis['sender'] = email['sender']
-                results.append(analysis)
-            except Exception as e:
-                # Fallback if parsing fails
-                results.append({
-                    "summary": "Could not analyze automatically.",
-                    "priority": "Unknown",
-                    "action_item": "Review manually",
-                    "next_step": "Open email",
-                    "original_subject": email['subject'],
-                    "sender": email['sender']
-                })
+
+PACKED_ANALYSIS_TEMPLATE = """
+        You are my personal executive assistant. Analyze each of the emails below independently.
+
+        {emails}
+
+        For every email:
+        1. Summarize the core message in 1 sentence.
+        2. Assign a priority (High, Medium, Low) based on urgency/sender.
+        3. Identify any requested action item or meeting.
+        4. Suggest a direct next step for me.
+
+        Output a JSON array only, one object per email, in the same order:
+        [
+            {{
+                "index": <email number>,
+                "summary": "...",
+                "priority": "...",
+                "action_item": "...",
+                "next_step": "..."
+            }}
+        ]
+        """
+
+CONVERSATION_TEMPLATE = """
+        You are my personal executive assistant. Analyze this email conversation.
+
+        Subject: {subject}
+        What you concluded from the earlier messages: {previous}
+
+        New messages, oldest first:
+        {messages}
+
+        Task:
+        1. Summarize where the conversation stands in 1 sentence.
+        2. Assign a priority (High, Medium, Low) based on urgency/senders.
+        3. Identify any requested action item or meeting.
+        4. Suggest a direct next step for me.
+
+        Output JSON format only:
+        {{
+            "summary": "...",
+            "priority": "...",
+            "action_item": "...",
+            "next_step": "..."
+        }}
+        """
+
+# Emails shorter than this (in characters) may share one prompt when packing is enabled.
+SHORT_EMAIL_CHARS = 400
+
+
+class PersonalAssistant:
+    def __init__(self, llm=None, cache_path=ANALYSIS_CACHE_PATH, llm_routing=None):
+        # Default to GPT unless configured otherwise
+        self.llm = llm or ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7)
+        # With LLM_ROUTING=true and Vertex AI configured, slow calls are hedged to Gemini and
+        # errors fail over to it (and back).
+        if llm_routing is None:
+            llm_routing = os.getenv("LLM_ROUTING", "false").lower() == "true"
+        if llm_routing and llm is None and os.getenv("GOOGLE_CLOUD_PROJECT"):
+            from langchain_google_vertexai import ChatVertexAI
+            gemini = ChatVertexAI(model_name="gemini-1.5-pro", temperature=0.7,
+                                  project=os.getenv("GOOGLE_CLOUD_PROJECT"),
+                                  location=os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1"))
+            self.llm = LLMRouter({"openai": self.llm, "vertex": gemini})
+        # Analyses persist across dashboard sessions; pass cache_path=None to disable.
+        self.cache = AnalysisCache(cache_path) if cache_path else None
+
+    def analyze_emails(self, emails: list, max_concurrency: int = 8, pack_size: int = 1):
+        """
+        Summarizes emails and extracts actionable items.
         
+        Args:
+            emails (list): List of email dicts {sender, subject, body_preview}
+            max_concurrency (int): How many LLM calls run at the same time.
+            pack_size (int): If > 1, up to this many short emails share one prompt
+                that returns a JSON array. Long emails are always analyzed alone.
+            
+        Returns:
+            list: List of analyzed items {summary, priority, action_item, context},
+                in the same order as `emails`.
+        """
+        if not emails:
+            return []
+
+        with telemetry.span("assistant.analyze_emails", emails=len(emails), pack_size=pack_size) as span:
+            results, cached = self._analyze(emails, max_concurrency, pack_size)
+            span.set(cached=cached)
+        telemetry.count("analysis_cache", cached, result="hit")
+        telemetry.count("analysis_cache", len(emails) - cached, result="miss")
+        return results
+
+    def _analyze(self, emails, max_concurrency, pack_size):
+        """Returns (results, number answered from the cache)."""
+        # Reuse analyses of messages that have not changed since they were last analyzed.
+        results = [None] * len(emails)
+        cached = self.cache.get_many(emails) if self.cache else {}
+        for i, analysis in cached.items():
+            results[i] = self._with_email_fields(analysis, emails[i])
+
+        pending = [i for i in range(len(emails)) if i not in cached]
+        if pending:
+            fresh, failed = self._analyze_uncached([emails[i] for i in pending], max_concurrency, pack_size)
+            for i, analysis in zip(pending, fresh):
+                results[i] = analysis
+            if self.cache:
+                self.cache.put_many([(emails[pending[j]], fresh[j]) for j in range(len(pending))
+                                     if j not in failed])
+        
+        return results, len(cached)
+
+    def _analyze_uncached(self, emails, max_concurrency, pack_size):
+        """Runs the LLM over emails. Returns (results, positions that fell back to a placeholder)."""
+        config = {"max_concurrency": max_concurrency}
+        results = [None] * len(emails)
+        failed = set()
+
+        singles = list(range(len(emails)))
+        packs = []
+        if pack_size > 1:
+            short = [i for i in singles if len(emails[i].get("body_preview", "")) < SHORT_EMAIL_CHARS]
+            packs = [short[i:i + pack_size] for i in range(0, len(short), pack_size)]
+            packs = [pack for pack in packs if len(pack) > 1]
+            packed = {i for pack in packs for i in pack}
+            singles = [i for i in singles if i not in packed]
+
+        if packs:
+            packed_chain = ChatPromptTemplate.from_template(PACKED_ANALYSIS_TEMPLATE) | self.llm | JsonOutputParser()
+            inputs = [{"emails": self._format_pack([emails[i] for i in pack])} for pack in packs]
+            with telemetry.span("assistant.llm", calls=len(inputs), packed=True):
+                outputs = packed_chain.batch(inputs, config=config, return_exceptions=True)
+            self._count_tokens(PACKED_ANALYSIS_TEMPLATE, inputs, outputs)
+            for pack, output in zip(packs, outputs):
+                analyses = self._unpack(output, len(pack))
+                if analyses is None:
+                    # Whole pack failed to parse: retry its emails one by one.
+                    singles.extend(pack)
+                    continue
+                for i, analysis in zip(pack, analyses):
+                    if analysis is None:
+                        singles.append(i)
+                    else:
+                        results[i] = self._with_email_fields(analysis, emails[i])
+
+        singles.sort()
+        if singles:
+            chain = ChatPromptTemplate.from_template(ANALYSIS_TEMPLATE) | self.llm | JsonOutputParser()
+            inputs = [emails[i] for i in singles]
+            with telemetry.span("assistant.llm", calls=len(inputs), packed=False):
+                outputs = chain.batch(inputs, config=config, return_exceptions=True)
+            self._count_tokens(ANALYSIS_TEMPLATE, inputs, outputs)
+            for i, output in zip(singles, outputs):
+                if isinstance(output, Exception) or not isinstance(output, dict):
+                    results[i] = self._fallback(emails[i])
+                    failed.add(i)
+                else:
+                    results[i] = self._with_email_fields(output, emails[i])
+
+        return results, failed
+
+    def analyze_conversations(self, conversations: list, max_concurrency: int = 8):
+        """
+        Analyzes email threads, one LLM call and one item per conversation.
+
+        Args:
+            conversations (list): Threads from `OutlookManager.get_unread_conversations`
+                {conversation_id, subject, sender, id, messages: [email dicts, oldest first]}.
+            max_concurrency (int): How many LLM calls run at the same time.
+
+        Returns:
+            list: One analyzed item per conversation, in the same order, like `analyze_emails`
+                plus `conversation_id` and `messages` (the thread's message count).
+
+        With the cache enabled, a thread is only sent again when it has messages the last
+        analysis did not cover, and then only those messages plus the previous summary.
+        """
+        if not conversations:
+            return []
+
+        with telemetry.span("assistant.analyze_conversations", conversations=len(conversations)) as span:
+            results, cached, resent = self._analyze_conversations(conversations, max_concurrency)
+            span.set(cached=cached, messages_sent=resent)
+        telemetry.count("analysis_cache", cached, result="hit")
+        telemetry.count("analysis_cache", len(conversations) - cached, result="miss")
+        telemetry.count("conversation_messages", resent, sent="new")
+        telemetry.count("conversation_messages", sum(len(c["messages"]) for c in conversations) - resent,
+                        sent="skipped")
         return results
 
+    def _analyze_conversations(self, conversations, max_concurrency):
+        """Returns (results, threads answered from the cache, messages sent to the LLM)."""
+        results = [None] * len(conversations)
+        known = self.cache.get_conversations([c["conversation_id"] for c in conversations]) if self.cache else {}
+        pending, inputs, covered = [], [], []
+        resent = 0
+        for i, conversation in enumerate(conversations):
+            seen, previous = known.get(conversation["conversation_id"], (set(), None))
+            new = [m for m in conversation["messages"] if m.get("id") not in seen]
+            if previous is not None and not new:
+                results[i] = self._with_thread_fields(previous, conversation)
+                continue
+            pending.append(i)
+            covered.append(seen | {m.get("id") for m in new})
+            resent += len(new)
+            inputs.append({
+                "subject": conversation["subject"],
+                "previous": previous["summary"] if previous else "Nothing yet, this is the first look.",
+                "messages": "\n\n".join(f"Sender: {m['sender']}\nReceived: {m.get('received', '')}\n"
+                                        f"Content: {m['body_preview']}" for m in new),
+            })
+        cached = len(conversations) - len(pending)
+        if not pending:
+            return results, cached, resent
+
+        chain = ChatPromptTemplate.from_template(CONVERSATION_TEMPLATE) | self.llm | JsonOutputParser()
+        with telemetry.span("assistant.llm", calls=len(inputs), packed=False):
+            outputs = chain.batch(inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True)
+        self._count_tokens(CONVERSATION_TEMPLATE, inputs, outputs)
+        fresh = []
+        for i, seen, output in zip(pending, covered, outputs):
+            conversation = conversations[i]
+            if isinstance(output, Exception) or not isinstance(output, dict):
+                results[i] = self._with_thread_fields(self._fallback(conversation), conversation)
+                continue
+            fresh.append((conversation["conversation_id"], seen, dict(output)))
+            results[i] = self._with_thread_fields(output, conversation)
+        if self.cache:
+            self.cache.put_conversations(fresh)
+        return results, cached, resent
+
+    @classmethod
+    def _with_thread_fields(cls, analysis, conversation):
+        analysis = cls._with_email_fields(dict(analysis), conversation)
+        analysis['conversation_id'] = conversation['conversation_id']
+        analysis['messages'] = len(conversation['messages'])
+        return analysis
+
+    @staticmethod
+    def _count_tokens(template, inputs, outputs):
+        """Approximate LLM tokens in/out, only computed when telemetry is on."""
+        if not telemetry.enabled:
+            return
+        tokens_in = sum(estimate_tokens(template) + estimate_tokens(" ".join(str(v) for v in item.values()))
+                        for item in inputs)
+        tokens_out = sum(estimate_tokens(json.dumps(output)) for output in outputs
+                         if not isinstance(output, Exception))
+        telemetry.count("llm_tokens", tokens_in, app="assistant", direction="in")
+        telemetry.count("llm_tokens", tokens_out, app="assistant", direction="out")
+        telemetry.count("llm_errors", sum(isinstance(output, Exception) for output in outputs), app="assistant")
+
+    @staticmethod
+    def _format_pack(emails):
+        return "\n\n".join(
+            f"Email {n}:\nSender: {email['sender']}\nSubject: {email['subject']}\nContent: {email['body_preview']}"
+            for n, email in enumerate(emails, start=1)
+        )
+
+    @staticmethod
+    def _unpack(output, expected):
+        """Maps a packed JSON array back to emails; None entries are missing or malformed items."""
+        if isinstance(output, Exception) or not isinstance(output, list):
+            return None
+        analyses = [None] * expected
+        for position, item in enumerate(output):
+            if not isinstance(item, dict):
+                continue
+            index = item.pop("index", position + 1)
+            if isinstance(index, int) and 1 <= index <= expected:
+                analyses[index - 1] = item
+        return analyses
+
+    @staticmethod
+    def _with_email_fields(analysis, email):
+        analysis['original_subject'] = email['subject']
+        analysis['sender'] = email['sender']
+        analysis['id'] = email.get('id')
+        return analysis
+
+    @staticmethod
+    def _fallback(email):
+        # Fallback if parsing fails
+        return {
+            "summary": "Could not analyze automatically.",
+            "priority": "Unknown",
+            "action_item": "Review manually",
+            "next_step": "Open email",
+            "original_subject": email['subject'],
+            "sender": email['sender'],
+            "id": email.get('id')
+        }
+
     def plan_day(self, meetings: list, tasks: list):
         """
         Generates a daily briefing/schedule narrative.
         """
+        telemetry.count("assistant_plan_day")
         # Simple structured text for now
         context = f"Meetings Today: {len(meetings)}\nTasks Pending: {len(tasks)}"
         return f"Good morning! You have {len(meetings)} meetings scheduling today. Focus on clearing your inbox first."
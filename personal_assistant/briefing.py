@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from telemetry import telemetry
+
+# Seconds each source may take, measured from the start of the build.
+DEFAULT_TIMEOUTS = {"emails": 30.0, "meetings": 15.0, "tasks": 15.0}
+
+SNAPSHOT_PATH = "briefing_snapshot.json"
+# Bumped when the snapshot layout changes; older files are ignored.
+SNAPSHOT_SCHEMA = 1
+
+
+class Briefing:
+    """What a build collected. Sources that failed or ran out of time are listed in `warnings`."""
+
+    def __init__(self):
+        self.emails = []
+        self.meetings = []
+        self.tasks = []
+        self.warnings = []
+        self.seconds = {}  # source -> seconds until it finished (or gave up)
+
+    def to_dict(self):
+        return {
+            "emails": self.emails,
+            "meetings": self.meetings,
+            "tasks": self.tasks,
+            "warnings": self.warnings,
+            "seconds": self.seconds,
+        }
+
+
+class BriefingBuilder:
+    """
+    Collects mail, calendar and tasks at the same time.
+
+    Each unread email is sent for analysis as soon as Graph returns it, so the LLM works
+    while later pages are still downloading. With `by_conversation`, emails are grouped into
+    threads once they have all arrived and each thread is analyzed as one item instead.
+    Every source has its own deadline: whatever has arrived by then is used and the rest is
+    reported in `Briefing.warnings`, so one slow source cannot hold up the whole briefing.
+    """
+
+    def __init__(self, manager, assistant, email_limit=5, max_concurrency=8, timeouts=None,
+                 by_conversation=False):
+        self.manager = manager
+        self.assistant = assistant
+        self.email_limit = email_limit
+        self.max_concurrency = max_concurrency
+        self.by_conversation = by_conversation
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+
+    def build(self) -> Briefing:
+        with telemetry.span("briefing.build") as span:
+            briefing = self._build()
+            span.set(emails=len(briefing.emails), meetings=len(briefing.meetings),
+                     warnings=len(briefing.warnings))
+        return briefing
+
+    def _build(self):
+        briefing = Briefing()
+        started = time.perf_counter()
+        deadline = {source: started + seconds for source, seconds in self.timeouts.items()}
+
+        fetchers = ThreadPoolExecutor(max_workers=3, thread_name_prefix="briefing-fetch")
+        analyzers = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="briefing-llm")
+        arrived = []  # (email, analysis future) in inbox order
+        lock = threading.Lock()
+        try:
+            sources = {
+                "emails": fetchers.submit(self._stream_emails, arrived, lock, analyzers),
+                "meetings": fetchers.submit(self._timed, "meetings", self.manager.get_todays_meetings),
+                "tasks": fetchers.submit(self._timed, "tasks", self.manager.get_tasks),
+            }
+            for source in sorted(sources, key=deadline.get):
+                future = sources[source]
+                wait([future], timeout=max(0.0, deadline[source] - time.perf_counter()))
+                briefing.seconds[source] = round(time.perf_counter() - started, 3)
+                if not future.done():
+                    briefing.warnings.append(f"{source.capitalize()} did not finish within "
+                                             f"{self.timeouts[source]:.0f}s; showing what arrived.")
+                    telemetry.count("briefing_timeouts", source=source)
+                elif future.exception() is not None:
+                    briefing.warnings.append(f"Could not load {source}: {future.exception()}")
+                    telemetry.count("briefing_errors", source=source)
+                elif source != "emails":
+                    setattr(briefing, source, future.result())
+
+            # Analyses share the email deadline.
+            with lock:
+                pending = list(arrived)
+            wait([f for _, f in pending], timeout=max(0.0, deadline["emails"] - time.perf_counter()))
+            unfinished = 0
+            for email, future in pending:
+                if future.done() and future.exception() is None:
+                    briefing.emails.append(future.result()[0])
+                else:
+                    unfinished += 1
+                    briefing.emails.append(self._placeholder(email, future))
+            if unfinished:
+                briefing.warnings.append(f"{unfinished} email analyses did not finish in time.")
+            briefing.seconds["analysis"] = round(time.perf_counter() - started, 3)
+        finally:
+            # Stragglers keep running in the background; nothing waits on them.
+            fetchers.shutdown(wait=False, cancel_futures=True)
+            analyzers.shutdown(wait=False, cancel_futures=True)
+        return briefing
+
+    def _stream_emails(self, arrived, lock, analyzers):
+        with telemetry.span("briefing.emails"):
+            if self.by_conversation:
+                for conversation in self.manager.get_unread_conversations(limit=self.email_limit):
+                    future = analyzers.submit(self.assistant.analyze_conversations, [conversation])
+                    with lock:
+                        arrived.append((conversation, future))
+                return
+            for email in self.manager.iter_unread_emails(limit=self.email_limit):
+                future = analyzers.submit(self.assistant.analyze_emails, [email])
+                with lock:
+                    arrived.append((email, future))
+
+    @staticmethod
+    def _timed(source, fetch):
+        with telemetry.span(f"briefing.{source}"):
+            return fetch()
+
+    def _placeholder(self, email, future):
+        analysis = self.assistant._fallback(email)
+        if "messages" in email:
+            analysis = self.assistant._with_thread_fields(analysis, email)
+        if not future.done():
+            analysis["summary"] = "Analysis still running; refresh to see it."
+        return analysis
+
+
+def save_snapshot(briefing, path=SNAPSHOT_PATH) -> int:
+    """
+    Writes a briefing for the dashboard to pick up. Each save gets the next version number;
+    the file is replaced atomically so a reader never sees half of it. Returns the version.
+    """
+    previous = load_snapshot(path)
+    snapshot = {
+        "schema": SNAPSHOT_SCHEMA,
+        "version": (previous["version"] + 1) if previous else 1,
+        "generated_at": time.time(),
+        "data": briefing.to_dict(),
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, default=str)
+    os.replace(tmp_path, path)
+    return snapshot["version"]
+
+
+def load_snapshot(path=SNAPSHOT_PATH, max_age=None):
+    """Returns the saved snapshot, or None if missing, unreadable, of another schema or older than max_age seconds."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get("schema") != SNAPSHOT_SCHEMA:
+        return None
+    if max_age is not None and time.time() - snapshot["generated_at"] > max_age:
+        return None
+    return snapshot
@@ -0,0 +1,173 @@
+"""
+Precomputes the daily briefing in the background so the dashboard opens on a ready snapshot.
+
+Refreshes mail, calendar and the email analyses every `--interval` minutes, skips
+`--quiet-hours`, and always runs `--lead` minutes before `--workday-start` so the first
+look of the day is warm. Each run writes a new version of the snapshot (`--snapshot`),
+which the dashboard loads at once and swaps in when a newer version appears. Runs are
+cheap after the first: the mailbox mirror only fetches the delta and cached analyses are
+not sent to the LLM again.
+
+    python briefing_worker.py --interval 15 --quiet-hours 20:00-06:30 --workday-start 08:00
+    python briefing_worker.py --once
+
+Every option can also be set in the environment (or .env) as BRIEFING_<OPTION>, e.g.
+BRIEFING_INTERVAL=10 or BRIEFING_QUIET_HOURS=21:00-07:00.
+"""
+import os
+import time
+import argparse
+import datetime
+import threading
+from dotenv import load_dotenv
+
+from outlook_service import OutlookManager
+from assistant_logic import PersonalAssistant
+from briefing import BriefingBuilder, save_snapshot, SNAPSHOT_PATH
+from telemetry import telemetry
+
+
+def _env(name, default):
+    return os.getenv(f"BRIEFING_{name}", default)
+
+
+def parse_clock(value) -> datetime.time:
+    return datetime.datetime.strptime(value.strip(), "%H:%M").time()
+
+
+def parse_window(value):
+    """"20:00-06:30" -> (time(20, 0), time(6, 30)); an empty value means no quiet hours."""
+    if not value:
+        return None
+    start, end = value.split("-")
+    return parse_clock(start), parse_clock(end)
+
+
+class BriefingSchedule:
+    """Decides when the next refresh is due: every `interval`, outside quiet hours, plus a pre-workday run."""
+
+    def __init__(self, interval_minutes=15, quiet_hours=None, workday_start=None, lead_minutes=30):
+        self.interval = datetime.timedelta(minutes=interval_minutes)
+        self.quiet_hours = quiet_hours
+        self.workday_start = workday_start
+        self.lead = datetime.timedelta(minutes=lead_minutes)
+
+    def is_quiet(self, moment) -> bool:
+        if not self.quiet_hours:
+            return False
+        start, end = self.quiet_hours
+        clock = moment.time()
+        if start <= end:
+            return start <= clock < end
+        # Window wraps past midnight.
+        return clock >= start or clock < end
+
+    def quiet_end(self, moment):
+        """The end of the quiet window that contains `moment`."""
+        end = datetime.datetime.combine(moment.date(), self.quiet_hours[1])
+        return end if end > moment else end + datetime.timedelta(days=1)
+
+    def prewarm_after(self, moment):
+        """The first pre-workday run strictly after `moment`, or None without a workday start."""
+        if self.workday_start is None:
+            return None
+        run = datetime.datetime.combine(moment.date(), self.workday_start) - self.lead
+        return run if run > moment else run + datetime.timedelta(days=1)
+
+    def next_run(self, last=None, now=None):
+        """When to refresh next, given the time of the last refresh (None: never)."""
+        now = now or datetime.datetime.now()
+        if last is None:
+            return now
+        due = last + self.interval
+        if self.is_quiet(due):
+            due = self.quiet_end(due)
+        prewarm = self.prewarm_after(last)
+        if prewarm is not None:
+            due = min(due, prewarm)
+        return due
+
+
+class BriefingWorker:
+    def __init__(self, manager, assistant, schedule, snapshot_path=SNAPSHOT_PATH,
+                 email_limit=20, max_concurrency=8, timeout=300):
+        self.manager = manager
+        self.assistant = assistant
+        self.schedule = schedule
+        self.snapshot_path = snapshot_path
+        self.email_limit = email_limit
+        self.max_concurrency = max_concurrency
+        # Nobody is waiting on a background run, so sources get far longer than in the dashboard.
+        self.timeouts = {"emails": timeout, "meetings": timeout, "tasks": timeout}
+        self.stopped = threading.Event()
+
+    def refresh(self) -> int:
+        """Builds a briefing and saves it as the next snapshot version. Returns the version."""
+        started = time.perf_counter()
+        with telemetry.span("worker.refresh") as span:
+            briefing = BriefingBuilder(self.manager, self.assistant, email_limit=self.email_limit,
+                                       max_concurrency=self.max_concurrency, timeouts=self.timeouts,
+                                       by_conversation=True).build()
+            version = save_snapshot(briefing, self.snapshot_path)
+            span.set(version=version, emails=len(briefing.emails))
+        print(f"[{datetime.datetime.now():%H:%M:%S}] Snapshot v{version}: {len(briefing.emails)} emails, "
+              f"{len(briefing.meetings)} meetings in {time.perf_counter() - started:.1f}s")
+        for warning in briefing.warnings:
+            print(f"  warning: {warning}")
+        return version
+
+    def run(self):
+        """Refreshes on schedule until `stopped` is set (or Ctrl+C)."""
+        last = None
+        while not self.stopped.is_set():
+            due = self.schedule.next_run(last)
+            delay = (due - datetime.datetime.now()).total_seconds()
+            if delay > 0:
+                print(f"Next refresh at {due:%Y-%m-%d %H:%M}")
+                if self.stopped.wait(delay):
+                    break
+            last = datetime.datetime.now()
+            try:
+                self.refresh()
+            except Exception as e:
+                # A failed run (network, expired token) must not end the worker; the next one retries.
+                print(f"Refresh failed: {e}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interval", type=float, default=float(_env("INTERVAL", 15)), help="Minutes between refreshes")
+    parser.add_argument("--quiet-hours", default=_env("QUIET_HOURS", "20:00-06:30"),
+                        help='No scheduled refreshes in this window, e.g. "20:00-06:30" ("" for none)')
+    parser.add_argument("--workday-start", default=_env("WORKDAY_START", "08:00"),
+                        help='Start of the workday, e.g. "08:00" ("" to skip the pre-workday run)')
+    parser.add_argument("--lead", type=float, default=float(_env("LEAD", 30)),
+                        help="Minutes before the workday start to refresh")
+    parser.add_argument("--concurrency", type=int, default=int(_env("CONCURRENCY", 8)), help="Concurrent LLM calls")
+    parser.add_argument("--emails", type=int, default=int(_env("EMAILS", 20)), help="Unread emails to analyze")
+    parser.add_argument("--timeout", type=float, default=float(_env("TIMEOUT", 300)), help="Seconds per source")
+    parser.add_argument("--snapshot", default=_env("SNAPSHOT", SNAPSHOT_PATH), help="Snapshot file to write")
+    parser.add_argument("--once", action="store_true", help="Refresh once and exit")
+    args = parser.parse_args()
+
+    manager = OutlookManager(os.getenv("SHAREPOINT_CLIENT_ID"), os.getenv("SHAREPOINT_CLIENT_SECRET"),
+                             os.getenv("SHAREPOINT_TENANT_ID"))
+    if not manager.account.is_authenticated:
+        # The worker runs unattended; sign in once through the dashboard (or here) first.
+        manager.authenticate()
+    schedule = BriefingSchedule(args.interval, parse_window(args.quiet_hours),
+                                parse_clock(args.workday_start) if args.workday_start else None, args.lead)
+    worker = BriefingWorker(manager, PersonalAssistant(), schedule, snapshot_path=args.snapshot,
+                            email_limit=args.emails, max_concurrency=args.concurrency, timeout=args.timeout)
+    if args.once:
+        worker.refresh()
+        return
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        print("Stopped.")
+
+
+if __name__ == "__main__":
+    main()
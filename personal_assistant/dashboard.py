@@ -1,12 +1,19 @@
 import streamlit as st
 import os
+import time
 import datetime
 from outlook_service import OutlookManager
 from assistant_logic import PersonalAssistant
+from briefing import BriefingBuilder, load_snapshot
+from telemetry import telemetry, render_streamlit_panel
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Streamlit re-executes this script on every interaction; time each run.
+rerun_started = time.perf_counter()
+telemetry.count("streamlit_reruns", app="dashboard")
+
 st.set_page_config(page_title="Personal Assistant", layout="wide", initial_sidebar_state="expanded")
 
 # Custom CSS for "High Landing Page" feel
@@ -66,30 +73,65 @@ try:
 except Exception as e:
     st.error(f"Authentication Setup Issue: {e}")
 
+# Refresh re-fetches mail and calendar; only new or edited emails go back to the LLM
+# because analyses are cached by message id and content.
+with st.sidebar:
+    if st.button("🔄 Refresh briefing"):
+        st.session_state.pop("daily_data", None)
+        st.session_state.refresh_live = True
+    # Searches the local mailbox mirror, so results come back without a Graph round trip.
+    mail_query = st.text_input("🔎 Search mail")
+    if mail_query:
+        for hit in st.session_state.manager.search_emails(mail_query, limit=10):
+            st.markdown(f"**{hit['subject']}**  \n{hit['sender']} · {hit['received'][:10]}")
+            st.caption(hit['body_preview'][:200])
+
+# Unread emails analyzed per briefing. Mail is read from the local mirror, so this is bounded
+# by LLM time (and cached analyses), not by Graph round trips.
+EMAIL_LIMIT = 20
+# Snapshots written by briefing_worker.py older than this are ignored and the briefing is built live.
+SNAPSHOT_MAX_AGE = float(os.getenv("BRIEFING_SNAPSHOT_MAX_AGE", 2 * 3600))
+MOCK_TASKS = ["Review Project Plan", "Send Weekly Report"] # Mock tasks for now as API logic is tricky
+
+
+def use_briefing(data, generated_at, version=None):
+    st.session_state.daily_data = dict(data, tasks=data["tasks"] or MOCK_TASKS)
+    st.session_state.daily_data_generated_at = generated_at
+    st.session_state.daily_data_version = version
+
+
+# A snapshot precomputed by briefing_worker.py opens instantly; newer versions replace the
+# one on screen on the next rerun.
+snapshot = None if st.session_state.pop("refresh_live", False) else load_snapshot(max_age=SNAPSHOT_MAX_AGE)
+if snapshot and snapshot["generated_at"] > st.session_state.get("daily_data_generated_at", 0):
+    if "daily_data" in st.session_state:
+        st.toast(f"Briefing updated (v{snapshot['version']})")
+    use_briefing(snapshot["data"], snapshot["generated_at"], snapshot["version"])
+
 # Main Data Fetch (Turbocharged via cache/session state)
+# Mail, calendar and tasks are fetched at the same time and each email is analyzed as soon
+# as it arrives; a source that misses its deadline is shown as a warning instead of blocking.
 if "daily_data" not in st.session_state:
-    with st.spinner("Fetching emails and syncing calendar..."):
-        # 1. Fetch Emails
-        emails_raw = st.session_state.manager.get_unread_emails_summary(limit=5)
-        # 2. Analyze via AI
-        email_summary = st.session_state.assistant.analyze_emails(emails_raw)
-        
-        # 3. Fetch Calendar
-        meetings = st.session_state.manager.get_todays_meetings()
-        
-        st.session_state.daily_data = {
-            "emails": email_summary,
-            "meetings": meetings,
-            "tasks": ["Review Project Plan", "Send Weekly Report"] # Mock tasks for now as API logic is tricky
-        }
+    with st.spinner("Fetching emails and syncing calendar..."), telemetry.span("dashboard.collect"):
+        # One item per conversation: reply-all threads are analyzed once, over their new messages.
+        briefing = BriefingBuilder(st.session_state.manager, st.session_state.assistant,
+                                   email_limit=EMAIL_LIMIT, by_conversation=True).build()
+        use_briefing(briefing.to_dict(), time.time())
 
 data = st.session_state.daily_data
+if st.session_state.daily_data_version:
+    generated = datetime.datetime.fromtimestamp(st.session_state.daily_data_generated_at)
+    st.caption(f"Precomputed at {generated:%H:%M} (snapshot v{st.session_state.daily_data_version})")
+for warning in data["warnings"]:
+    st.warning(warning)
 
 # Dashboard Layout
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    st.markdown('<div class="metric-card"><h3>📧 Inbox</h3><p>5 Unread</p><p>2 Urgent</p></div>', unsafe_allow_html=True)
+    unread = st.session_state.manager.unread_count() if st.session_state.manager.mirror else len(data["emails"])
+    urgent = sum(mail.get("priority") == "High" for mail in data["emails"])
+    st.markdown(f'<div class="metric-card"><h3>📧 Inbox</h3><p>{unread} Unread</p><p>{urgent} Urgent</p></div>', unsafe_allow_html=True)
 
 with col2:
     st.markdown(f'<div class="metric-card"><h3>📅 Meetings</h3><p>{len(data["meetings"])} Today</p><p>Next: 10:00 AM</p></div>', unsafe_allow_html=True)
@@ -108,9 +150,10 @@ with tab1:
     st.markdown("### 📨 Priority Correspondence")
     for mail in data["emails"]:
         priority_color = "red" if mail.get("priority") == "High" else "gray"
+        thread = f" ({mail['messages']} messages)" if mail.get("messages", 1) > 1 else ""
         st.markdown(f"""
         <div class="email-card" style="border-left-color: {priority_color};">
-            <b>{mail['sender']}</b> | {mail['original_subject']}<br>
+            <b>{mail['sender']}</b> | {mail['original_subject']}{thread}<br>
             <span style="color: #666; font-size: 0.9em;">{mail['summary']}</span><br>
             <div style="margin-top: 5px;">
                 <span class="action-badge">Action: {mail['action_item']}</span>
@@ -119,7 +162,7 @@ with tab1:
         """, unsafe_allow_html=True)
         
         cols = st.columns([1, 4])
-        if cols[0].button("Add to Tasks", key=f"add_{mail['original_subject']}"):
+        if cols[0].button("Add to Tasks", key=f"add_{mail.get('id') or mail['original_subject']}"):
             st.toast(f"Added '{mail['action_item']}' to To-Do List")
 
 with tab2:
@@ -148,3 +191,5 @@ with tab3:
         st.write("- Vendor Assessment")
         st.text_input("Add new backlog item...")
 
+telemetry.observe("dashboard.rerun", time.perf_counter() - rerun_started)
+render_streamlit_panel()
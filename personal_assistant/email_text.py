@@ -0,0 +1,224 @@
+import re
+from html.parser import HTMLParser
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+# Tokens of body text handed to the LLM and shown as the preview.
+PREVIEW_TOKENS = 256
+# HTML is parsed in slices of this many characters so parsing can stop early.
+FEED_CHUNK = 4096
+# Characters collected per budgeted token before parsing stops (generous; the exact cut is by tokens).
+CHARS_PER_TOKEN = 6
+
+# Elements whose content is never text.
+SKIP_TAGS = {"style", "script", "head", "title", "noscript", "template", "svg", "xml"}
+# Elements that end a line.
+BLOCK_TAGS = {"p", "div", "br", "tr", "li", "ul", "ol", "table", "h1", "h2", "h3", "h4", "h5", "h6",
+              "section", "article", "header", "footer", "hr", "pre", "center"}
+VOID_TAGS = {"br", "hr", "img", "meta", "link", "input", "col", "area", "base", "wbr", "source"}
+
+# Lines of a signature after a sign-off ("Thanks," / name / title / phone ...) and their length.
+SIGNATURE_LINES = 6
+SIGNATURE_LINE_CHARS = 60
+# A legal or mailing-list footer only counts within this many lines of the end.
+FOOTER_LINES = 5
+
+# Markers of the quoted thread. Outlook puts the history after a marker div rather than inside it,
+# so everything from there on is dropped.
+_HISTORY_IDS = re.compile(r"divRplyFwdMsg|appendonsend|OLK_SRC_BODY_SECTION", re.I)
+_QUOTE_CLASSES = re.compile(r"gmail_quote|yahoo_quoted|moz-cite-prefix|protonmail_quote|OutlookMessageHeader", re.I)
+# Signature and footer blocks, skipped wherever they are.
+_BLOCK_MARKERS = re.compile(r"signature|footer", re.I)
+_HIDDEN_STYLE = re.compile(r"display\s*:\s*none|mso-hide\s*:\s*all|visibility\s*:\s*hidden", re.I)
+# Tags that only occur in HTML bodies; a plain-text body may still contain "<jane@example.com>".
+_HTML_TAG = re.compile(r"<(html|head|body|div|p|br|span|table|td|font|meta|!doctype|!--)[\s/>]", re.I)
+
+# A line that starts the quoted reply chain; nothing after it is new.
+_REPLY_HEADER = re.compile(
+    r"^(on\b.{0,200}\bwrote:?$|-{2,}\s*original message\s*-{2,}|-{2,}\s*forwarded message\s*-{2,}"
+    r"|begin forwarded message:|_{10,}$|le .{0,200} a [ée]crit\s?:$|am .{0,200} schrieb.{0,100}:$)", re.I)
+# "From:" starts a quoted header block only when the header's other fields follow.
+_FROM_FIELD = re.compile(r"^(from|von|de|van):\s*\S", re.I)
+_HEADER_FIELD = re.compile(
+    r"^(sent|to|date|cc|subject|gesendet|an|datum|betreff|envoy[ée]|[àa]|objet|enviado|para|asunto|fecha):\s*\S",
+    re.I)
+_INLINE_HEADER_FIELD = re.compile(r"\s(sent|date|gesendet|envoy[ée]|enviado):\s*\S", re.I)
+# A line that starts the signature or a mobile sign-off.
+_SIGNATURE = re.compile(r"^(--\s*$|sent from my \w+|get outlook for \w+|sent from (mail|outlook) for)", re.I)
+# A closing ("Thanks,"): the end of the message only if a short signature, a footer or the end follows.
+_SIGN_OFF = re.compile(r"^((best|kind|warm|many)\s+)?(regards|wishes|thanks|thank you|cheers|best)[,!.]?$", re.I)
+# Legal and mailing-list footers; nothing after them is new either.
+_FOOTER = re.compile(
+    r"^(confidentiality notice|disclaimer\b|this (e-?mail|message|communication)( and any (files|attachments)"
+    r"( transmitted with it)?)? (is|are|may contain|contains) (confidential|privileged|intended)"
+    r"|.*\bintended (solely |only )?for the (use of the )?(addressee|named recipient|individual)"
+    r"|you (are receiving|received) this (e-?mail|message|newsletter|because)"
+    r"|(to )?unsubscribe\b|.*(\||click here to|\bhere to) unsubscribe\b|.*\bunsubscribe\s*(\||$)"
+    r"|.*\bmanage (your )?(email )?preferences\b)", re.I)
+# Contact details, which make a line part of a signature whatever its shape.
+_CONTACT = re.compile(r"@|https?://|www\.|\+?\d[\d ().-]{6,}\d")
+_WORD = re.compile(r"[^\W\d_][\w'’-]*")
+# Newsletter chrome worth dropping without stopping.
+_NOISE = re.compile(r"^(view (this email )?in (your |a )?browser|having trouble viewing|\W*)$", re.I)
+
+
+def _signature_shaped(line) -> bool:
+    """A short name / title / company / contact line rather than a sentence."""
+    if len(line) > SIGNATURE_LINE_CHARS:
+        return False
+    if _CONTACT.search(line):
+        return True
+    if line[-1] in ".!?…:;":
+        return False
+    words = _WORD.findall(line)
+    return sum(word[0].isupper() for word in words) * 2 >= len(words)
+
+
+class _Done(Exception):
+    pass
+
+
+class _EmailTextParser(HTMLParser):
+    """Collects the new content of an email as lines, raising `_Done` once there is enough or only history is left."""
+
+    def __init__(self, char_budget):
+        super().__init__(convert_charrefs=True)
+        self.char_budget = char_budget
+        self.lines = []
+        self.chars = 0
+        self.current = []
+        self.skip_tag = None   # tag of the subtree being skipped
+        self.skip_depth = 0
+        # A possible end of the new content (a sign-off or footer), confirmed by what follows it.
+        self.cut = None
+        self.cut_kind = None   # "sign-off" or "footer"
+        self.tail = 0          # lines since the cut
+        self.from_line = None  # index of a "From:" line that may start a quoted header
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip_tag:
+            if tag == self.skip_tag and tag not in VOID_TAGS:
+                self.skip_depth += 1
+            return
+        attributes = dict(attrs)
+        element_id = attributes.get("id") or ""
+        classes = attributes.get("class") or ""
+        if _HISTORY_IDS.search(element_id):
+            self.flush()
+            self.finish()
+        if tag in BLOCK_TAGS or tag == "blockquote":
+            self.flush()
+        if (tag in SKIP_TAGS or tag == "blockquote" or _QUOTE_CLASSES.search(classes)
+                or tag == "footer" or _BLOCK_MARKERS.search(element_id + " " + classes)
+                or _HIDDEN_STYLE.search(attributes.get("style") or "")):
+            if tag not in VOID_TAGS:
+                self.skip_tag, self.skip_depth = tag, 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if self.skip_tag:
+            if tag == self.skip_tag:
+                self.skip_depth -= 1
+                if self.skip_depth == 0:
+                    self.skip_tag = None
+            return
+        if tag in BLOCK_TAGS:
+            self.flush()
+
+    def handle_data(self, data):
+        if not self.skip_tag:
+            self.current.append(data)
+
+    def flush(self):
+        text = " ".join("".join(self.current).split())
+        self.current = []
+        if text:
+            self.add_line(text)
+
+    def add_line(self, line):
+        if self.from_line is not None:
+            if _HEADER_FIELD.match(line):
+                del self.lines[self.from_line:]
+                self.finish()
+            self.from_line = None
+        if _REPLY_HEADER.match(line) or (_SIGNATURE.match(line) and self.lines):
+            self.finish()
+        if _FROM_FIELD.match(line):
+            if _INLINE_HEADER_FIELD.search(line):
+                self.finish()
+            self.from_line = len(self.lines)
+        if line.startswith(">") or _NOISE.match(line):
+            return
+        footer = _FOOTER.match(line)
+        if self.cut is not None:
+            self.tail += 1
+            if footer:
+                # A footer right after a signature: everything from the sign-off on goes.
+                self.cut_kind, self.tail = "footer", 0
+            elif self.cut_kind == "footer" and self.tail > FOOTER_LINES:
+                self.cut = None
+            elif self.cut_kind == "sign-off" and (self.tail > SIGNATURE_LINES or not _signature_shaped(line)):
+                self.cut = None
+        if self.cut is None:
+            if footer:
+                self.cut, self.cut_kind, self.tail = len(self.lines), "footer", 0
+            elif _SIGN_OFF.match(line) and self.lines:
+                self.cut, self.cut_kind, self.tail = len(self.lines), "sign-off", 0
+        self.lines.append(line)
+        self.chars += len(line) + 1
+        # The text after a possible cut is short by construction, so keep reading until it is decided.
+        if self.chars >= self.char_budget and self.cut is None:
+            raise _Done()
+
+    def finish(self):
+        raise _Done()
+
+    def text(self) -> str:
+        lines = self.lines if self.cut is None else self.lines[:self.cut]
+        return "\n".join(lines)
+
+
+def extract_email_text(body, max_tokens=PREVIEW_TOKENS) -> str:
+    """
+    The new content of an email body (HTML or plain text), at most `max_tokens` tokens.
+
+    Parses as a stream and stops once enough text is collected, at the start of the quoted
+    reply chain (including a "From:" line followed by "Sent:"/"To:"), or at a signature or
+    legal footer. A sign-off ("Thanks,") ends the message only when a short signature, a
+    footer or the end follows it, and footers only count in the last few lines. Styles,
+    scripts, hidden preheaders, blockquotes and signature and footer blocks are skipped.
+    Lines are separated by newlines.
+    """
+    if not body:
+        return ""
+    parser = _EmailTextParser(max_tokens * CHARS_PER_TOKEN)
+    try:
+        if _HTML_TAG.search(body[:FEED_CHUNK]):
+            for start in range(0, len(body), FEED_CHUNK):
+                parser.feed(body[start:start + FEED_CHUNK])
+            parser.close()
+            parser.flush()
+        else:
+            for line in body.splitlines():
+                line = " ".join(line.split())
+                if line:
+                    parser.add_line(line)
+    except _Done:
+        pass
+    return truncate_tokens(parser.text(), max_tokens)
+
+
+def truncate_tokens(text, max_tokens) -> str:
+    """Cuts text to `max_tokens` tokens with tiktoken when available, otherwise ~4 characters per token."""
+    if _ENCODING is None:
+        return text[:max_tokens * 4]
+    tokens = _ENCODING.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return _ENCODING.decode(tokens[:max_tokens])
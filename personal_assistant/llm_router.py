@@ -0,0 +1,14 @@
+"""
+The shared common/llm_router.py, importable as `llm_router` like the app's own modules.
+
+Puts the repository root on the path and replaces this module with common.llm_router, so
+every import in the process gets the same module object.
+"""
+import os
+import sys
+import importlib
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+sys.modules[__name__] = importlib.import_module("common.llm_router")
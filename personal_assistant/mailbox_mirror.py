@@ -0,0 +1,120 @@
+import sqlite3
+import threading
+
+from email_text import truncate_tokens, PREVIEW_TOKENS
+
+MAILBOX_MIRROR_PATH = "mailbox_mirror.sqlite"
+# Tokens of new body text kept per message for search; previews are cut to PREVIEW_TOKENS.
+SEARCH_TOKENS = 2048
+
+
+class MailboxMirror:
+    """
+    Local copy of one mail folder in SQLite, with full-text search over subject, sender and body.
+
+    OutlookManager keeps it current by applying Graph message delta pages (`apply`) and
+    storing the delta link it gets back, so after the first sync only changes cross the
+    network. Reads (unread counts, previews, search) never touch the network.
+    """
+
+    def __init__(self, path=MAILBOX_MIRROR_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                rowid INTEGER PRIMARY KEY, id TEXT UNIQUE, conversation_id TEXT, subject TEXT,
+                sender TEXT, sender_address TEXT, received TEXT, is_read INTEGER, body TEXT);
+            CREATE INDEX IF NOT EXISTS messages_unread ON messages (is_read, received);
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                subject, sender, body, content='messages', content_rowid='rowid');
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._db.commit()
+
+    @property
+    def delta_link(self):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'delta_link'").fetchone()
+        return row[0] if row else None
+
+    def apply(self, upserts, removed, delta_link=None):
+        """
+        Applies one delta page: `upserts` are message dicts (id, conversation_id, subject, sender,
+        sender_address, received, is_read, body), `removed` are ids. `delta_link` (the link to
+        continue from) is saved in the same transaction, so a sync never skips a page.
+        """
+        with self._lock:
+            self._delete(list(removed) + [m["id"] for m in upserts])
+            for m in upserts:
+                cursor = self._db.execute(
+                    "INSERT INTO messages (id, conversation_id, subject, sender, sender_address, received, "
+                    "is_read, body) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (m["id"], m.get("conversation_id"), m.get("subject") or "", m.get("sender") or "",
+                     m.get("sender_address") or "", m.get("received") or "", int(bool(m.get("is_read"))),
+                     m.get("body") or ""))
+                self._db.execute("INSERT INTO messages_fts (rowid, subject, sender, body) VALUES (?, ?, ?, ?)",
+                                 (cursor.lastrowid, m.get("subject") or "", m.get("sender") or "",
+                                  m.get("body") or ""))
+            if delta_link:
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('delta_link', ?)", (delta_link,))
+            self._db.commit()
+
+    def reset(self):
+        """Forgets every message and the delta link (before a full resync)."""
+        with self._lock:
+            self._db.execute("DELETE FROM messages")
+            self._db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('delete-all')")
+            self._db.execute("DELETE FROM meta")
+            self._db.commit()
+
+    def _delete(self, ids):
+        for message_id in ids:
+            row = self._db.execute("SELECT rowid, subject, sender, body FROM messages WHERE id = ?",
+                                   (message_id,)).fetchone()
+            if row is None:
+                continue
+            self._db.execute("INSERT INTO messages_fts (messages_fts, rowid, subject, sender, body) "
+                             "VALUES ('delete', ?, ?, ?, ?)", row)
+            self._db.execute("DELETE FROM messages WHERE rowid = ?", (row[0],))
+
+    # --- reads ------------------------------------------------------------------------
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def unread_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages WHERE is_read = 0").fetchone()[0]
+
+    def unread(self, limit=None) -> list:
+        """Unread messages, newest first, in the shape `OutlookManager` returns emails."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, conversation_id, subject, sender, received, body FROM messages "
+                "WHERE is_read = 0 ORDER BY received DESC LIMIT ?", (-1 if limit is None else limit,)).fetchall()
+        return [self._email(row) for row in rows]
+
+    def search(self, query, limit=20) -> list:
+        """Full-text search over subject, sender and body; every word must match. Best match first."""
+        terms = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+        if not terms:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT m.id, m.conversation_id, m.subject, m.sender, m.received, m.body "
+                "FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid "
+                "WHERE messages_fts MATCH ? ORDER BY bm25(messages_fts) LIMIT ?", (terms, limit)).fetchall()
+        return [self._email(row) for row in rows]
+
+    @staticmethod
+    def _email(row):
+        message_id, conversation_id, subject, sender, received, body = row
+        return {
+            "subject": subject,
+            "sender": sender,
+            "received": received,
+            "body_preview": truncate_tokens(body, PREVIEW_TOKENS),
+            "id": message_id,
+            "conversation_id": conversation_id,
+        }
@@ -1,16 +1,62 @@
 import os
+import re
+import time
 import datetime
 from O365 import Account, FileSystemTokenBackend
-from bs4 import BeautifulSoup
+from requests.exceptions import HTTPError
+from email_text import extract_email_text
+from mailbox_mirror import MailboxMirror, MAILBOX_MIRROR_PATH, SEARCH_TOKENS
+from telemetry import telemetry
+
+# Fields requested from the message delta feed.
+DELTA_SELECT = "subject,from,receivedDateTime,isRead,conversationId,body"
+# Messages per delta page.
+DELTA_PAGE_SIZE = 50
+# Reply/forward prefixes stripped from thread subjects.
+_SUBJECT_PREFIX = re.compile(r"^\s*((re|fw|fwd|aw|wg|sv|vs|tr)\s*(\[\d+\])?\s*:\s*)+", re.I)
+
+
+def group_conversations(emails) -> list:
+    """
+    Groups email dicts by conversation id, newest thread first. Each thread has the
+    messages oldest first, and takes its id, sender and received time from the newest one.
+    Emails without a conversation id form a thread of their own.
+    """
+    threads = {}
+    for email in emails:
+        key = email.get("conversation_id") or email.get("id")
+        threads.setdefault(key, []).append(email)
+    conversations = []
+    for key, messages in threads.items():
+        messages.sort(key=lambda m: m.get("received") or "")
+        latest = messages[-1]
+        conversations.append({
+            "conversation_id": key,
+            "subject": _SUBJECT_PREFIX.sub("", latest.get("subject") or "") or latest.get("subject"),
+            "sender": latest["sender"],
+            "senders": list(dict.fromkeys(m["sender"] for m in messages)),
+            "received": latest.get("received"),
+            "id": latest.get("id"),
+            "messages": messages,
+        })
+    conversations.sort(key=lambda c: c["received"] or "", reverse=True)
+    return conversations
 
 class OutlookManager:
-    def __init__(self, client_id, client_secret, tenant_id=None):
+    def __init__(self, client_id, client_secret, tenant_id=None, account=None,
+                 mirror_path=MAILBOX_MIRROR_PATH, history_days=30):
         self.credentials = (client_id, client_secret)
         # Using a new token file for Outlook scopes specifically if needed, 
         # or share the token backend but with expanded scopes.
         # It's safer to use a separate token file to avoid scope conflicts if the previous one was limited.
         self.token_backend = FileSystemTokenBackend(token_path='.', token_filename='o365_token_assistant.txt')
-        self.account = Account(self.credentials, token_backend=self.token_backend, tenant_id=tenant_id)
+        # `account` replaces the O365 Account, e.g. with the fake in benchmarks/fakes.py.
+        self.account = account or Account(self.credentials, token_backend=self.token_backend, tenant_id=tenant_id)
+        # Local copy of the inbox kept current with Graph delta queries; mirror_path=None
+        # queries the inbox directly on every call instead.
+        self.mirror = MailboxMirror(mirror_path) if mirror_path else None
+        # The first sync only mirrors messages received in the last `history_days` days.
+        self.history_days = history_days
 
     def authenticate(self):
         """Authenticates with extended scopes for Mail, Calendar, and Tasks."""
@@ -26,6 +72,22 @@ class OutlookManager:
 
     def get_unread_emails_summary(self, limit=5):
         """Fetches unread emails and returns a structured list."""
+        with telemetry.span("outlook.unread_emails", limit=limit) as span:
+            email_data = list(self.iter_unread_emails(limit))
+            span.set(messages=len(email_data))
+        return email_data
+
+    def iter_unread_emails(self, limit=5):
+        """
+        Yields unread emails, newest first. With the mirror this syncs the inbox delta and
+        reads locally; otherwise messages are yielded one at a time as Graph pages them in.
+        `limit=None` returns every unread email.
+        """
+        if self.mirror is not None:
+            self.sync_mailbox()
+            yield from self.mirror.unread(limit)
+            return
+
         mailbox = self.account.mailbox()
         inbox = mailbox.inbox_folder()
         
@@ -33,22 +95,125 @@ class OutlookManager:
         query = mailbox.new_query().on_attribute('is_read').equals(False)
         messages = inbox.get_messages(limit=limit, query=query, download_attachments=False)
         
-        email_data = []
+        count = 0
+        parse_seconds = 0.0
+        body_bytes = 0
         for msg in messages:
-            soup = BeautifulSoup(msg.body, "html.parser")
-            text_body = soup.get_text(separator=' ', strip=True)[:1000] # Truncate for AI
+            started = time.perf_counter()
+            text_body = extract_email_text(msg.body) # New content only, capped in tokens for AI
+            parse_seconds += time.perf_counter() - started
+            body_bytes += len(msg.body or "")
+            count += 1
             
-            email_data.append({
+            yield {
                 "subject": msg.subject,
                 "sender": msg.sender.name,
                 "received": msg.received.isoformat(), # Serialize for JSON/LLM
                 "body_preview": text_body,
-                "id": msg.object_id
-            })
-        return email_data
+                "id": msg.object_id,
+                "conversation_id": getattr(msg, "conversation_id", None)
+            }
+        # Graph paging and HTML parsing interleave; the parse share is recorded on its own.
+        telemetry.observe("outlook.html_to_text", parse_seconds, messages=count)
+        telemetry.count("graph_body_bytes", body_bytes)
+
+    def get_unread_conversations(self, limit=20):
+        """The `limit` newest unread emails grouped into threads (see `group_conversations`)."""
+        with telemetry.span("outlook.unread_conversations", limit=limit) as span:
+            conversations = group_conversations(self.iter_unread_emails(limit))
+            span.set(conversations=len(conversations))
+        return conversations
+
+    def unread_count(self):
+        """Number of unread inbox messages (from the mirror, as of the last sync)."""
+        if self.mirror is None:
+            return len(self.get_unread_emails_summary(limit=None))
+        return self.mirror.unread_count()
+
+    def search_emails(self, query, limit=20):
+        """Full-text search of the mirrored inbox; no network round trip."""
+        if self.mirror is None:
+            return []
+        with telemetry.span("outlook.search", limit=limit) as span:
+            results = self.mirror.search(query, limit)
+            span.set(results=len(results))
+        return results
+
+    def sync_mailbox(self):
+        """
+        Brings the mirror up to date with the inbox using a Graph message delta query.
+
+        The first run mirrors the last `history_days` of mail; later runs only download
+        messages that were added, changed (e.g. marked read) or removed since. Returns
+        (upserted, removed) counts.
+        """
+        with telemetry.span("outlook.sync") as span:
+            try:
+                upserted, removed = self._apply_delta(self.mirror.delta_link)
+            except HTTPError as e:
+                # 410 Gone: the delta token expired, Graph asks for a full resync.
+                if e.response is None or e.response.status_code != 410:
+                    raise
+                print("Mailbox delta token expired, running a full resync.")
+                self.mirror.reset()
+                upserted, removed = self._apply_delta(None)
+            span.set(upserted=upserted, removed=removed)
+        return upserted, removed
+
+    def _apply_delta(self, url):
+        if url is None:
+            since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=self.history_days)
+            url = (f"{self.account.protocol.service_url}me/mailFolders/inbox/messages/delta"
+                   f"?$select={DELTA_SELECT}&$filter=receivedDateTime ge {since.strftime('%Y-%m-%dT%H:%M:%SZ')}")
+        headers = {"Prefer": f"odata.maxpagesize={DELTA_PAGE_SIZE}"}
+        upserted = removed = 0
+        parse_seconds = 0.0
+        body_bytes = 0
+        while url:
+            response = self.account.con.get(url, headers=headers)
+            telemetry.count("graph_requests", source="mail_delta")
+            data = response.json()
+
+            changes, gone = [], []
+            for item in data.get("value", []):
+                if "@removed" in item:
+                    gone.append(item["id"])
+                    continue
+                html = (item.get("body") or {}).get("content") or ""
+                started = time.perf_counter()
+                body = extract_email_text(html, max_tokens=SEARCH_TOKENS)
+                parse_seconds += time.perf_counter() - started
+                body_bytes += len(html)
+                address = (item.get("from") or {}).get("emailAddress") or {}
+                changes.append({
+                    "id": item["id"],
+                    "conversation_id": item.get("conversationId"),
+                    "subject": item.get("subject"),
+                    "sender": address.get("name"),
+                    "sender_address": address.get("address"),
+                    "received": item.get("receivedDateTime"),
+                    "is_read": item.get("isRead", False),
+                    "body": body,
+                })
+
+            delta_link = data.get("@odata.deltaLink")
+            # The next link is saved too, so an interrupted first sync resumes where it stopped.
+            self.mirror.apply(changes, gone, delta_link or data.get("@odata.nextLink"))
+            upserted += len(changes)
+            removed += len(gone)
+            url = None if delta_link else data.get("@odata.nextLink")
+        telemetry.observe("outlook.html_to_text", parse_seconds, messages=upserted)
+        telemetry.count("graph_body_bytes", body_bytes)
+        return upserted, removed
 
     def get_todays_meetings(self):
         """Fetches calendar events for today."""
+        with telemetry.span("outlook.meetings") as span:
+            meetings = self._fetch_meetings()
+            span.set(meetings=len(meetings))
+        return meetings
+
+    def _fetch_meetings(self):
         schedule = self.account.schedule()
         calendar = schedule.get_default_calendar()
         
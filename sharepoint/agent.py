@@ -1,89 +1,205 @@
 import os
 import glob
-from typing import List, Optional
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
+import time
+import hashlib
+from typing import Iterator, List, Optional
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-# OpenAI Imports
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-# Google Vertex AI Imports
-from langchain_google_vertexai import VertexAIEmbeddings, VertexAI, VectorSearchVectorStore
-try:
-    from langchain_google_community import VertexAISearchRetriever
-except ImportError:
-    # Handle cases where community package might be missing or older version
-    print("Warning: langchain-google-community not found or VertexAISearchRetriever missing.")
-    VertexAISearchRetriever = None
-
-from langchain_chroma import Chroma
-from langchain_core.runnables import RunnablePassthrough
+# Provider stacks (OpenAI, Vertex AI, Vertex AI Search, Chroma) are imported where they are
+# selected, so startup only pays for the one in use.
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.documents import Document
 from dotenv import load_dotenv
+from index_state import IndexState, IndexUpdate, file_hash, chunk_ids
+from embedding_cache import EmbeddingCache, CachedEmbeddings, EMBEDDING_CACHE_DIR, embedding_namespace
+from keyword_index import KeywordIndex, KEYWORD_INDEX_FILENAME, reciprocal_rank_fusion
+from answer_cache import AnswerCache, ANSWER_CACHE_FILENAME, SEMANTIC_THRESHOLD
+from dedup import DedupIndex, DEDUP_INDEX_FILENAME
+from embedding_executor import EmbeddingExecutor
+from llm_router import LLMRouter
+from parsing import LOADERS, PARSE_TIMEOUT, parse_files
+from vector_index import LocalVectorIndex, LOCAL_INDEX_DIRNAME
+from telemetry import telemetry, estimate_tokens
 
 load_dotenv()
 
 PERSIST_DIRECTORY = "./chroma_db"
 DATA_DIRECTORY = "./data/sharepoint_docs"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Chroma rejects very large add/delete calls, so they are sent in batches.
+CHROMA_BATCH_SIZE = 1000
+RETRIEVAL_K = 5
+VECTOR_BACKENDS = ("chroma", "local")
+# Chunks embedded and committed per ingestion checkpoint; bounds peak memory while indexing.
+INGEST_BATCH_SIZE = 256
+
+RAG_TEMPLATE = """Answer the question based only on the following context:
+{context}
+
+Question: {question}
+"""
+
+
+class QueryTimings:
+    """Where the time of one query went, in seconds."""
+
+    def __init__(self):
+        self.retrieval = 0.0
+        self.first_token = 0.0  # from the call until the first answer token
+        self.generation = 0.0
+        self.total = 0.0
+        self.cached = False
+        self.keyword_fast_path = False  # answered from exact identifier matches, no embedding call
+        self.documents = []  # the chunks the answer was generated from (none for cached answers)
+
+    def __str__(self):
+        if self.cached:
+            return f"cached answer in {self.total:.2f}s"
+        return (f"{'keyword ' if self.keyword_fast_path else ''}retrieval {self.retrieval:.2f}s, first token {self.first_token:.2f}s, "
+                f"generation {self.generation:.2f}s, total {self.total:.2f}s")
+
+
+def openai_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
+
+
+def vertex_llm():
+    from langchain_google_vertexai import VertexAI
+    return VertexAI(model_name="gemini-1.5-pro", temperature=0, project=os.getenv("GOOGLE_CLOUD_PROJECT"),
+                    location=os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1"))
+
 
 class SharePointAgent:
-    def __init__(self, data_dir=DATA_DIRECTORY, persist_directory=PERSIST_DIRECTORY, use_google=False):
+    def __init__(self, data_dir=DATA_DIRECTORY, persist_directory=PERSIST_DIRECTORY, use_google=False,
+                 embedding_cache_dir=EMBEDDING_CACHE_DIR, parse_workers=None, parse_timeout=PARSE_TIMEOUT,
+                 use_answer_cache=True, answer_cache_threshold=SEMANTIC_THRESHOLD, hybrid_search=True,
+                 vector_backend=None, embeddings=None, llm=None, deduplicate=True, shared_from=None,
+                 llm_routing=None):
         self.data_dir = data_dir
         self.persist_directory = persist_directory
+        # "chroma", or "local" for the memory-mapped LocalVectorIndex (see vector_index.py).
+        self.vector_backend = (vector_backend or os.getenv("VECTOR_BACKEND", "chroma")).lower()
+        if self.vector_backend not in VECTOR_BACKENDS:
+            raise ValueError(f"vector_backend must be one of {VECTOR_BACKENDS}, got {self.vector_backend!r}")
+        # PDF/DOCX parsing is CPU-bound, so it is spread over a process pool (None = one per core).
+        self.parse_workers = parse_workers
+        self.parse_timeout = parse_timeout
+        self.load_errors = []
         self.use_google = use_google or os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
         
-        if self.use_google:
+        if shared_from is not None:
+            # A shard of a ShardedAgent: reuse its provider clients, embedding executor and cache.
+            self.embeddings = shared_from.embeddings
+            self.llm = shared_from.llm
+        elif embeddings is not None and llm is not None:
+            # Models passed in (e.g. the offline fakes in benchmarks/): no provider clients.
+            self.embeddings = embeddings
+            self.llm = llm
+        elif self.use_google:
             print("Using Google Vertex AI Stack")
+            from langchain_google_vertexai import VertexAIEmbeddings
             project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
             location = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
             
             # Embeddings
-            self.embeddings = VertexAIEmbeddings(model_name="text-embedding-004", project=project_id, location=location)
+            # Retries are left to the EmbeddingExecutor so they do not stack on its backoff.
+            self.embeddings = VertexAIEmbeddings(model_name="text-embedding-004", project=project_id, location=location,
+                                                 max_retries=0)
             # LLM (Gemini)
-            self.llm = VertexAI(model_name="gemini-1.5-pro", temperature=0, project=project_id, location=location)
+            self.llm = vertex_llm()
         else:
             print("Using OpenAI Stack")
-            self.embeddings = OpenAIEmbeddings()
-            self.llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
-            
+            from langchain_openai import OpenAIEmbeddings
+            self.embeddings = OpenAIEmbeddings(max_retries=0)  # retried by the EmbeddingExecutor
+            self.llm = openai_llm()
+        self.embeddings = embeddings or self.embeddings
+        self.llm = llm or self.llm
+
+        # Route generation across OpenAI and Vertex AI (hedging slow calls, failing over on
+        # errors). Embeddings stay with one provider, since vectors from two models don't mix.
+        if llm_routing is None:
+            llm_routing = os.getenv("LLM_ROUTING", "false").lower() == "true"
+        if llm_routing and llm is None and shared_from is None:
+            self.llm = self._route_llm()
+
+        if shared_from is not None:
+            # Already batched and cached by the agent it comes from.
+            self.embedding_executor = shared_from.embedding_executor
+            self.embedding_cache = shared_from.embedding_cache
+        else:
+            # Batch document embeddings and keep several batches in flight, backing off on 429s.
+            self.embedding_executor = EmbeddingExecutor(self.embeddings)
+            self.embeddings = self.embedding_executor
+
+            # Cache vectors on disk so rebuilds and repeated questions skip the embedding API.
+            # Pass embedding_cache_dir=None to disable.
+            self.embedding_cache = None
+            if embedding_cache_dir:
+                self.embedding_cache = EmbeddingCache(embedding_cache_dir)
+                self.embeddings = CachedEmbeddings(self.embeddings, self.embedding_cache)
+
+        # Answers live next to the index they were generated from.
+        self.answer_cache = None
+        if use_answer_cache:
+            os.makedirs(persist_directory, exist_ok=True)
+            self.answer_cache = AnswerCache(os.path.join(persist_directory, ANSWER_CACHE_FILENAME),
+                                            threshold=answer_cache_threshold)
+
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
         self.vectorstore = None
         self.retriever = None
+        self.index_state = None
+        self.corpus_fingerprint = None
+        # BM25 index over the same chunks, fused with vector search at query time.
+        self.hybrid_search = hybrid_search
+        self.keyword_index = None
+        # Near-duplicate files and chunks are stored once, with the copies recorded as aliases.
+        self.deduplicate = deduplicate
+        self.dedup_index = None
+
+    def list_source_files(self) -> List[str]:
+        """Lists supported files under the data directory, in a stable order."""
+        files = glob.glob(os.path.join(self.data_dir, "**/*.*"), recursive=True)
+        return sorted(os.path.normpath(f) for f in files
+                      if os.path.splitext(f)[1].lower() in LOADERS)
+
+    def iter_documents(self) -> Iterator:
+        """Yields documents from the data directory one file at a time, in a stable order."""
+        self.load_errors = []
+        for result in parse_files(self.list_source_files(), workers=self.parse_workers,
+                                  timeout=self.parse_timeout):
+            if result.error:
+                self.load_errors.append(result.error)
+            else:
+                yield from result.chunks
+        if self.load_errors:
+            print(f"{len(self.load_errors)} files could not be loaded (see agent.load_errors).")
 
     def load_documents(self) -> List:
         """Loads documents from the data directory."""
-        documents = []
         if not os.path.exists(self.data_dir):
             print(f"Data directory {self.data_dir} does not exist.")
             return []
 
-        loaders = {
-            ".pdf": PyPDFLoader,
-            ".docx": Docx2txtLoader,
-            ".txt": TextLoader,
-            ".md": TextLoader
-        }
+        print(f"Loading {len(self.list_source_files())} files...")
+        return list(self.iter_documents())
 
-        files = glob.glob(os.path.join(self.data_dir, "**/*.*"), recursive=True)
-        print(f"Loading {len(files)} files...")
-        
-        for file_path in files:
-            ext = os.path.splitext(file_path)[1].lower()
-            if ext in loaders:
-                try:
-                    loader = loaders[ext](file_path)
-                    documents.extend(loader.load())
-                except Exception as e:
-                    print(f"Error loading {file_path}: {e}")
-        
-        return documents
-
-    def create_vector_store(self, use_cloud_vector_search=False):
-        """Creates or loads the vector store."""
+    def create_vector_store(self, use_cloud_vector_search=False) -> Optional[IndexUpdate]:
+        """Creates or loads the vector store, returning the index update (None for Vertex AI Search)."""
         
         # Option 1: Vertex AI Search (Fully Managed Agent Data Store)
         # This bypasses local vector stores entirely.
         data_store_id = os.getenv("VERTEX_AI_DATA_STORE_ID")
         if self.use_google and data_store_id:
             print(f"Connecting to Vertex AI Search Data Store: {data_store_id}")
+            try:
+                from langchain_google_community import VertexAISearchRetriever
+            except ImportError:
+                # Handle cases where community package might be missing or older version
+                print("Warning: langchain-google-community not found or VertexAISearchRetriever missing.")
+                VertexAISearchRetriever = None
             if VertexAISearchRetriever:
                  self.retriever = VertexAISearchRetriever(
                     project_id=os.getenv("GOOGLE_CLOUD_PROJECT"),
@@ -99,57 +215,436 @@ class SharePointAgent:
         # Option 2: Local Vector Store (Chroma) with Google Embeddings
         # Or Option 3: Vertex AI Vector Search (Matching Engine) - omitted for simplicity as it requires complex setup
         
-        if os.path.exists(self.persist_directory) and os.listdir(self.persist_directory):
-            print("Loading existing vector store...")
-            self.vectorstore = Chroma(persist_directory=self.persist_directory, embedding_function=self.embeddings)
+        # Using ChromaDB (or LocalVectorIndex) as a local vector store, kept in sync with the
+        # data directory incrementally: only new or changed chunks are embedded.
+        print("Opening vector store...")
+        self.vectorstore = self._open_vectorstore()
+        update = self.update_index()
+
+        if not self.index_state.files:
+            print("No documents found to index.")
+            self.vectorstore = None
+            return update
+
+        self.retriever = self.vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": RETRIEVAL_K})
+        return update
+
+    def _route_llm(self):
+        """This agent's LLM and the other provider's behind an LLMRouter, if the other is configured."""
+        providers = {"vertex" if self.use_google else "openai": self.llm}
+        if self.use_google and os.getenv("OPENAI_API_KEY"):
+            providers["openai"] = openai_llm()
+        elif not self.use_google and os.getenv("GOOGLE_CLOUD_PROJECT"):
+            providers["vertex"] = vertex_llm()
+        if len(providers) == 1:
+            print("LLM routing needs both OPENAI_API_KEY and GOOGLE_CLOUD_PROJECT; using one provider.")
+            return self.llm
+        return LLMRouter(providers)
+
+    def _open_vectorstore(self):
+        if self.vector_backend == "local":
+            return LocalVectorIndex(os.path.join(self.persist_directory, LOCAL_INDEX_DIRNAME), self.embeddings,
+                                    dtype=os.getenv("LOCAL_INDEX_DTYPE", "float16"),
+                                    n_lists=int(os.getenv("LOCAL_INDEX_IVF_LISTS", "0")))
+        from langchain_chroma import Chroma
+        return Chroma(persist_directory=self.persist_directory, embedding_function=self.embeddings)
+
+    def update_index(self, paths: Optional[List[str]] = None) -> IndexUpdate:
+        """
+        Brings the vector store in line with the data directory.
+
+        Files are compared by mtime/size, then content hash; changed files are re-split and only
+        chunks whose content hash is new get embedded. Chunks of removed files are deleted.
+        Pass `paths` (e.g. from a SyncResult) to only look at those files.
+        """
+        with telemetry.span("agent.update_index", backend=self.vector_backend) as span:
+            update = self._update_index(paths)
+            span.set(files_indexed=update.files_indexed, files_removed=update.files_removed,
+                     chunks_added=update.chunks_added, chunks_deleted=update.chunks_deleted,
+                     errors=len(update.errors))
+        return update
+
+    def _update_index(self, paths):
+        if self.vectorstore is None:
+            self.vectorstore = self._open_vectorstore()
+        if self.hybrid_search and self.keyword_index is None:
+            self.keyword_index = KeywordIndex(os.path.join(self.persist_directory, KEYWORD_INDEX_FILENAME))
+        if self.deduplicate and self.dedup_index is None:
+            self.dedup_index = DedupIndex(os.path.join(self.persist_directory, DEDUP_INDEX_FILENAME))
+
+        state = IndexState.load(self.persist_directory, self.vector_backend)
+        if not state.exists:
+            paths = None
+            # Stores built before hashes were tracked have random ids; rebuild them once.
+            existing = self.vectorstore.get(include=[])["ids"]
+            if existing:
+                print(f"Rebuilding vector store without index state ({len(existing)} chunks).")
+                for i in range(0, len(existing), CHROMA_BATCH_SIZE):
+                    self.vectorstore.delete(ids=existing[i:i + CHROMA_BATCH_SIZE])
+        self.index_state = state
+        update = IndexUpdate()
+
+        if self.keyword_index is not None:
+            if not state.exists:
+                self.keyword_index.clear()
+            elif state.files and not len(self.keyword_index):
+                self._rebuild_keyword_index()
+        if self.dedup_index is not None:
+            if not state.exists:
+                self.dedup_index.clear()
+            elif state.files and not len(self.dedup_index):
+                self._rebuild_dedup_index(state)
+
+        if paths is None:
+            files = self.list_source_files()
+            current = set(files)
+            removed = [p for p in state.files if p not in current]
         else:
-            print("Creating new vector store...")
-            documents = self.load_documents()
-            if not documents:
-                print("No documents found to index.")
-                # If no docs locally, maybe we rely purely on cloud search?
-                if not self.retriever:
-                     return
-
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            splits = text_splitter.split_documents(documents)
-            
-            # Using ChromaDB as a local vector store
-            self.vectorstore = Chroma.from_documents(
-                documents=splits, 
-                embedding=self.embeddings, 
-                persist_directory=self.persist_directory
-            )
+            paths = sorted({os.path.normpath(p) for p in paths
+                            if os.path.splitext(p)[1].lower() in LOADERS})
+            files = [p for p in paths if os.path.exists(p)]
+            removed = [p for p in paths if not os.path.exists(p) and p in state.files]
+
+        if removed:
+            stale_ids = []
+            for file_path in removed:
+                stale_ids.extend(state.files.pop(file_path)["chunks"])
+                update.files_removed += 1
+                if self.dedup_index is not None:
+                    self.dedup_index.remove_document(file_path)
+            self._delete_chunks(stale_ids)
+            update.chunks_deleted += len(stale_ids)
+            if self.dedup_index is not None:
+                self.dedup_index.commit()
+            state.save()
+
+        # Stream changed files through split -> embed -> upsert in bounded batches. Each batch
+        # is checkpointed in the index state once Chroma has it, so memory stays flat and a
+        # crashed run resumes after the last committed batch.
+        self._ingest(files, state, update)
+        # Files whose canonical copy was changed or removed are decided again, and the first
+        # of them to be indexed becomes the new canonical copy.
+        released = self.dedup_index.take_released() if self.dedup_index is not None else set()
+        while released:
+            self._ingest(sorted(p for p in released if os.path.exists(p)), state, update, force=released)
+            released = self.dedup_index.take_released()
+        previous_version = self.cache_version if self.corpus_fingerprint else None
+        self.corpus_fingerprint = state.fingerprint()
+        if self.answer_cache and previous_version not in (None, self.cache_version):
+            self.answer_cache.discard(previous_version)
+
+        print(f"Index update: {update}")
+        for error in update.errors:
+            print(f"  Could not index {error}")
+        return update
+
+    def _ingest(self, files, state, update, force=()):
+        batch = []
+        batch_chunks = 0
+        for change in self._iter_file_changes(files, state, update, force):
+            batch.append(change)
+            batch_chunks += len(change["new_ids"])
+            if batch_chunks >= INGEST_BATCH_SIZE:
+                self._commit_batch(batch, state, update)
+                batch = []
+                batch_chunks = 0
+        self._commit_batch(batch, state, update)
+
+    def _iter_file_changes(self, files, state, update, force=()):
+        """Yields the chunks to add and delete for each changed file, one file at a time."""
+        to_parse = []
+        hashes = {}
+        for file_path in files:
+            entry = state.files.get(file_path)
+            if file_path in force:
+                to_parse.append(file_path)
+                hashes[file_path] = file_hash(file_path)
+                continue
+            if state.is_unchanged(file_path):
+                update.files_unchanged += 1
+                update.chunks_kept += len(entry["chunks"])
+                continue
+
+            content_hash = file_hash(file_path)
+            if entry and entry["hash"] == content_hash:
+                # Touched but identical: just refresh mtime/size.
+                state.record(file_path, content_hash, entry["chunks"])
+                update.files_unchanged += 1
+                update.chunks_kept += len(entry["chunks"])
+                continue
+            to_parse.append(file_path)
+            hashes[file_path] = content_hash
+
+        for result in parse_files(to_parse, self.text_splitter, workers=self.parse_workers,
+                                  timeout=self.parse_timeout):
+            telemetry.observe("agent.parse_file", result.seconds, error=bool(result.error))
+            if result.error:
+                update.errors.append(result.error)
+                continue
+            file_path = result.path
+            entry = state.files.get(file_path)
+            chunks = result.chunks
+            ids = chunk_ids(file_path, chunks)
+            old_ids = set(entry["chunks"]) if entry else set()
+
+            signatures = [None] * len(chunks)
+            if self.dedup_index is not None:
+                signatures = self.dedup_index.signatures(chunks)
+                if self.dedup_index.add_document(file_path, signatures) is not None:
+                    # A copy of a stored document: keep none of its chunks.
+                    update.duplicate_files += 1
+                    update.duplicate_chunks += len(chunks)
+                    telemetry.count("dedup", len(chunks), level="document")
+                    ids = chunks = []
+
+            new_chunks = []
+            new_ids = []
+            stored_ids = []
+            for chunk_id, chunk, signature in zip(ids, chunks, signatures):
+                if chunk_id in old_ids:
+                    update.chunks_kept += 1
+                elif self.dedup_index is not None and self.dedup_index.add_chunk(chunk_id, file_path, chunk, signature):
+                    update.duplicate_chunks += 1
+                    telemetry.count("dedup", level="chunk")
+                    continue
+                else:
+                    new_ids.append(chunk_id)
+                    new_chunks.append(chunk)
+                stored_ids.append(chunk_id)
+            ids = stored_ids
+            yield {
+                "path": file_path,
+                "hash": hashes[file_path],
+                "ids": ids,
+                "new_chunks": new_chunks,
+                "new_ids": new_ids,
+                "stale_ids": list(old_ids - set(ids)),
+            }
+
+    def _commit_batch(self, batch, state, update):
+        """Writes one batch of file changes to the vector store, then checkpoints the index state."""
+        if not batch:
+            return
+        new_chunks = [c for change in batch for c in change["new_chunks"]]
+        new_ids = [i for change in batch for i in change["new_ids"]]
+        stale_ids = [i for change in batch for i in change["stale_ids"]]
+
+        with telemetry.span("agent.embed_and_store", chunks=len(new_chunks)):
+            for i in range(0, len(new_chunks), CHROMA_BATCH_SIZE):
+                self.vectorstore.add_documents(new_chunks[i:i + CHROMA_BATCH_SIZE],
+                                               ids=new_ids[i:i + CHROMA_BATCH_SIZE])
+            self._delete_chunks(stale_ids)
+        if self.keyword_index is not None:
+            with telemetry.span("agent.keyword_index", chunks=len(new_chunks)):
+                self.keyword_index.add(new_ids, new_chunks)
+
+        if self.dedup_index is not None:
+            self.dedup_index.commit()
+        for change in batch:
+            state.record(change["path"], change["hash"], change["ids"])
+        # Saved after the store write: if embedding fails, the next run retries these files
+        # (adds are upserts, so a partially written batch is harmless).
+        state.save()
+
+        update.files_indexed += len(batch)
+        update.chunks_added += len(new_ids)
+        update.chunks_deleted += len(stale_ids)
+        print(f"Committed {len(batch)} files ({len(new_ids)} new chunks)")
+
+    def _delete_chunks(self, ids):
+        for i in range(0, len(ids), CHROMA_BATCH_SIZE):
+            self.vectorstore.delete(ids=ids[i:i + CHROMA_BATCH_SIZE])
+        if self.keyword_index is not None:
+            self.keyword_index.delete(ids)
+        if self.dedup_index is not None:
+            self.dedup_index.remove_chunks(ids)
+
+    def _rebuild_keyword_index(self):
+        """Backfills the keyword index from the vector store (e.g. for stores indexed before it existed)."""
+        print("Building keyword index from the vector store...")
+        offset = 0
+        while True:
+            page = self.vectorstore.get(include=["documents", "metadatas"], limit=CHROMA_BATCH_SIZE, offset=offset)
+            if not page["ids"]:
+                break
+            docs = [Document(page_content=text, metadata=metadata or {})
+                    for text, metadata in zip(page["documents"], page["metadatas"])]
+            self.keyword_index.add(page["ids"], docs)
+            offset += len(page["ids"])
 
-        if self.vectorstore:
-            self.retriever = self.vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 5})
+    def _rebuild_dedup_index(self, state):
+        """Registers what is already stored as canonical (e.g. for stores indexed before deduplication)."""
+        print("Building near-duplicate index from the vector store...")
+        for file_path, entry in state.files.items():
+            ids = entry["chunks"]
+            if not ids:
+                continue
+            page = self.vectorstore.get(ids=ids, include=["documents", "metadatas"])
+            found = {chunk_id: Document(page_content=text, metadata=metadata or {})
+                     for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])}
+            stored = [chunk_id for chunk_id in ids if chunk_id in found]
+            self.dedup_index.backfill(file_path, stored, [found[chunk_id] for chunk_id in stored])
+        self.dedup_index.commit()
 
     def query_agent(self, question: str):
         """Queries the agent."""
+        return "".join(self.stream_query(question))
+
+    def stream_query(self, question: str, timings: Optional["QueryTimings"] = None) -> Iterator[str]:
+        """
+        Queries the agent, yielding the answer as the LLM produces it.
+
+        Pass a QueryTimings to get retrieval, time-to-first-token and generation timings.
+        """
+        timings = timings if timings is not None else QueryTimings()
+        started = time.perf_counter()
+
         if not self.retriever:
             self.create_vector_store()
 
         if not self.retriever: 
-           return "Agent is empty. Please load documents or configure connection."
+           yield "Agent is empty. Please load documents or configure connection."
+           return
+
+        yield from self._answer(question, timings, started, self.cache_version, self.keyword_fast_path,
+                                self.retrieve, can_embed=self.vectorstore is not None)
+
+    def _answer(self, question, timings, started, version, fast_path, retrieve, can_embed) -> Iterator[str]:
+        """
+        Answer cache, retrieval and generation for `stream_query`. `fast_path(question)` and
+        `retrieve(question, embedding)` supply the context, so a ShardedAgent can scope them.
+        """
+        # Repeated (or near-identical) questions are answered from the cache until the corpus changes.
+        if self.answer_cache:
+            cached = self.answer_cache.lookup_exact(question, version)
+            if cached is not None:
+                timings.cached = True
+                timings.first_token = timings.total = time.perf_counter() - started
+                telemetry.count("answer_cache", result="exact")
+                telemetry.observe("agent.query", timings.total, outcome="cached")
+                yield cached
+                return
+
+        # Exact identifiers (policy numbers, SKUs, file names) found in only a few chunks
+        # answer retrieval on their own, without an embedding call.
+        retrieval_started = time.perf_counter()
+        context = fast_path(question)
+        embedding = None
+        if context:
+            timings.keyword_fast_path = True
+            telemetry.count("keyword_fast_path")
+        elif can_embed or self.answer_cache:
+            embedding = self.embeddings.embed_query(question)
+
+        if self.answer_cache:
+            cached = self.answer_cache.lookup_semantic(embedding, version) if embedding is not None else None
+            if cached is not None:
+                timings.cached = True
+                timings.first_token = timings.total = time.perf_counter() - started
+                telemetry.count("answer_cache", result="semantic")
+                telemetry.observe("agent.query", timings.total, outcome="cached")
+                yield cached
+                return
+            self.answer_cache.record_miss()
+            telemetry.count("answer_cache", result="miss")
+
+        if not context:
+            context = retrieve(question, embedding)
+        if self.dedup_index is not None:
+            # Name the copies of each chunk that were collapsed into it at ingestion.
+            self.dedup_index.annotate(context)
+        timings.retrieval = time.perf_counter() - retrieval_started
+        timings.documents = context
+        telemetry.observe("agent.retrieval", timings.retrieval, documents=len(context),
+                          keyword_fast_path=timings.keyword_fast_path)
 
         # RAG prompt
-        template = """Answer the question based only on the following context:
-{context}
+        prompt = ChatPromptTemplate.from_template(RAG_TEMPLATE)
+        chain = prompt | self.llm | StrOutputParser()
 
-Question: {question}
-"""
-        prompt = ChatPromptTemplate.from_template(template)
+        generation_started = time.perf_counter()
+        parts = []
+        for token in chain.stream({"context": context, "question": question}):
+            if not parts:
+                timings.first_token = time.perf_counter() - started
+            parts.append(token)
+            yield token
+        timings.generation = time.perf_counter() - generation_started
+        timings.total = time.perf_counter() - started
+        if telemetry.enabled:
+            tokens_in = estimate_tokens(RAG_TEMPLATE + question + "".join(d.page_content for d in context))
+            tokens_out = estimate_tokens("".join(parts))
+            telemetry.count("llm_tokens", tokens_in, app="sharepoint", direction="in")
+            telemetry.count("llm_tokens", tokens_out, app="sharepoint", direction="out")
+            telemetry.observe("agent.llm", timings.generation, first_token_s=round(timings.first_token, 4),
+                              tokens_in=tokens_in, tokens_out=tokens_out)
+            telemetry.observe("agent.query", timings.total, outcome="generated")
+
+        if self.answer_cache:
+            self.answer_cache.store(question, embedding, "".join(parts), version,
+                                    timings.generation + timings.retrieval)
+
+    def keyword_fast_path(self, question: str) -> List[Document]:
+        """Chunks containing every identifier in the question, if they are few and clearly the best BM25 match."""
+        if self.keyword_index is None:
+            return []
+        hits = self.keyword_index.search_identifiers(question, RETRIEVAL_K)
+        return hits if hits and len(hits) <= RETRIEVAL_K else []
+
+    def retrieve(self, question: str, embedding: Optional[List[float]] = None) -> List[Document]:
+        """
+        Hybrid retrieval: BM25 keyword hits and vector MMR hits merged by reciprocal rank fusion.
+
+        Falls back to the plain retriever for Vertex AI Search or when hybrid search is off.
+        """
+        if self.vectorstore is None or self.keyword_index is None:
+            return self.retriever.invoke(question)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(question)
+        vector_hits = self.vectorstore.max_marginal_relevance_search_by_vector(
+            embedding, k=RETRIEVAL_K, fetch_k=RETRIEVAL_K * 4)
+        keyword_hits = self.keyword_index.search(question, RETRIEVAL_K)
+        return reciprocal_rank_fusion([vector_hits, keyword_hits], limit=RETRIEVAL_K)
+
+    def scored_search(self, question: str, embedding: Optional[List[float]], k: int = RETRIEVAL_K):
+        """
+        Top-k vector hits as (Document, relevance in [0, 1]) and BM25 hits as (Document, score),
+        best first, for merging with other shards by score. Without a local store (Vertex AI
+        Search) the retriever's results are returned as vector hits ranked by position.
+        """
+        if self.vectorstore is None:
+            docs = self.retriever.invoke(question) if self.retriever else []
+            return [(doc, 1.0 / (rank + 1)) for rank, doc in enumerate(docs)], []
+        if embedding is None:
+            embedding = self.embeddings.embed_query(question)
+        relevance = self.vectorstore._select_relevance_score_fn()
+        if self.vector_backend == "local":
+            pairs = self.vectorstore.similarity_search_with_score_by_vector(embedding, k)
+        else:
+            pairs = self.vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k)
+        vector_hits = [(doc, relevance(score)) for doc, score in pairs]
+        keyword_hits = self.keyword_index.search_with_scores(question, k) if self.keyword_index is not None else []
+        return vector_hits, keyword_hits
 
-        chain = (
-            {"context": self.retriever, "question": RunnablePassthrough()}
-            | prompt
-            | self.llm
-            | StrOutputParser()
-        )
+    def refresh_index(self, paths: Optional[List[str]] = None) -> List[IndexUpdate]:
+        """Opens the index if it is not open yet, otherwise applies changed paths (see `update_index`)."""
+        if self.vectorstore is None and self.retriever is None:
+            update = self.create_vector_store()
+            return [update] if update is not None else []
+        if self.vectorstore is not None:
+            return [self.update_index(paths)]
+        return []
 
-        return chain.invoke(question)
+    @property
+    def cache_version(self) -> str:
+        """Identifies the indexed corpus plus the models answering, for answer cache invalidation."""
+        corpus = self.corpus_fingerprint or os.getenv("VERTEX_AI_DATA_STORE_ID", "")
+        llm_name = getattr(self.llm, "model_name", None) or getattr(self.llm, "model", None) or type(self.llm).__name__
+        key = f"{corpus}\n{embedding_namespace(self.embeddings)}\n{llm_name}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
 if __name__ == "__main__":
+    # One question at a time; batch_qa.py answers a file of questions concurrently.
     # Check if Google switch is requested (e.g. env var or arg)
     use_google = os.getenv("USE_GOOGLE_AGENT", "False").lower() == "true"
     agent = SharePointAgent(use_google=use_google)
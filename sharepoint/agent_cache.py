@@ -0,0 +1,98 @@
+import os
+import hashlib
+import threading
+
+from telemetry import telemetry
+
+
+class AgentCache:
+    """
+    Process-wide SharePointAgents, one per configuration, shared by every Streamlit session and rerun.
+    `get(..., sharded=True)` returns a ShardedAgent over the registered site/library shards.
+
+    The first `get` for a configuration builds the agent and opens its index (a no-op
+    incremental check when nothing changed); later calls return the same object, so
+    switching providers back and forth or opening another tab costs nothing. When the
+    documents change, `index_changed` updates every cached agent in place; `invalidate`
+    drops agents so the next `get` builds them again (e.g. after a configuration change).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents = {}
+        self._building = {}  # key -> lock, so one configuration is not built twice at once
+
+    @staticmethod
+    def key(use_google=False, **options):
+        """What identifies an agent: provider settings from the environment plus constructor options."""
+        if use_google:
+            provider = ("google", os.getenv("GOOGLE_CLOUD_PROJECT"), os.getenv("GOOGLE_CLOUD_LOCATION"),
+                        os.getenv("VERTEX_AI_DATA_STORE_ID"))
+        else:
+            # Only a fingerprint of the key, so a changed key gets a new client.
+            api_key = os.getenv("OPENAI_API_KEY") or ""
+            provider = ("openai", hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12])
+        return provider + tuple(sorted(options.items()))
+
+    def get(self, use_google=False, **options):
+        """Returns the shared agent for this configuration, building and indexing it on first use."""
+        key = self.key(use_google, **options)
+        agent = self._agents.get(key)
+        if agent is not None:
+            telemetry.count("agent_cache", result="hit")
+            return agent
+        with self._lock:
+            building = self._building.setdefault(key, threading.Lock())
+        with building:
+            agent = self._agents.get(key)
+            if agent is None:
+                telemetry.count("agent_cache", result="miss")
+                with telemetry.span("agent_cache.build", provider=key[0]):
+                    agent = self._build(use_google, options)
+                with self._lock:
+                    self._agents[key] = agent
+        return agent
+
+    @staticmethod
+    def _build(use_google, options):
+        options = dict(options)
+        if options.pop("sharded", False):
+            from shards import ShardedAgent
+            agent = ShardedAgent(use_google=use_google, **options)
+            agent.create_vector_store()
+            return agent
+        from agent import SharePointAgent
+        agent = SharePointAgent(use_google=use_google, **options)
+        # Initialize index if data exists
+        if os.path.exists(agent.data_dir) or (use_google and os.getenv("VERTEX_AI_DATA_STORE_ID")):
+            agent.create_vector_store()
+        return agent
+
+    def index_changed(self, paths=None) -> list:
+        """
+        Applies changed or removed document paths (None: rescan everything) to every cached
+        agent. Agents that had nothing indexed yet open their retriever now; sharded agents
+        update only the shards the paths fall in.
+        Returns one IndexUpdate per agent (or shard) that was updated.
+        """
+        with self._lock:
+            agents = list(self._agents.values())
+        updates = []
+        for agent in agents:
+            updates.extend(agent.refresh_index(paths))
+        return updates
+
+    def invalidate(self, use_google=None, **options):
+        """Drops the agent for one configuration, or every agent when called without arguments."""
+        with self._lock:
+            if use_google is None and not options:
+                self._agents.clear()
+            else:
+                self._agents.pop(self.key(use_google, **options), None)
+
+    def __len__(self):
+        return len(self._agents)
+
+
+# Streamlit imports modules once per process, so every session shares this instance.
+agent_cache = AgentCache()
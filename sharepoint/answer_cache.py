@@ -0,0 +1,170 @@
+import re
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_FILENAME = "answer_cache.sqlite"
+SEMANTIC_THRESHOLD = 0.95
+DEFAULT_TTL_SECONDS = 24 * 3600
+# Versions whose query vectors are kept in memory (per-provider agents, ShardedAgent scopes).
+MAX_LOADED_VERSIONS = 32
+# Expired answers are deleted at most this often.
+PURGE_INTERVAL_SECONDS = 600
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases and collapses whitespace/trailing punctuation for the exact-match tier."""
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip("?!. ")
+
+
+class AnswerCache:
+    """
+    Two-tier cache of RAG answers.
+
+    The exact tier matches normalized question text; the semantic tier compares the
+    question embedding with cached ones and reuses an answer above `threshold` cosine
+    similarity. Every entry is stamped with a corpus version (see
+    SharePointAgent.cache_version) and only answers lookups for that version. Versions
+    live side by side, since agents for different providers share the file and a
+    ShardedAgent uses one version per shard scope; a version's answers are deleted when
+    its corpus changes (`discard`) or when they expire.
+    """
+
+    def __init__(self, path, threshold=SEMANTIC_THRESHOLD, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._lock = threading.Lock()
+        self._loaded = OrderedDict()  # version -> [normalized query vectors or None, answer ids]
+        self._purged_at = 0.0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY, version TEXT, question TEXT, normalized TEXT,
+                embedding BLOB, answer TEXT, generation_seconds REAL, created REAL)
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_exact ON answers (version, normalized)")
+        self._db.commit()
+
+    def lookup(self, question, embedding, version):
+        """Returns a cached answer for the question under this corpus version, or None."""
+        answer = self.lookup_exact(question, version)
+        if answer is None and embedding is not None:
+            answer = self.lookup_semantic(embedding, version)
+        if answer is None:
+            self.record_miss()
+        return answer
+
+    def lookup_exact(self, question, version):
+        """Exact tier only; needs no embedding. Does not count a miss."""
+        with self._lock:
+            self._purge_expired()
+            row = self._db.execute(
+                "SELECT answer, generation_seconds FROM answers "
+                "WHERE version = ? AND normalized = ? AND created >= ? ORDER BY created DESC LIMIT 1",
+                (version, normalize_question(question), time.time() - self.ttl_seconds)).fetchone()
+            if row:
+                self.exact_hits += 1
+                self.seconds_saved += row[1]
+                return row[0]
+            return None
+
+    def lookup_semantic(self, embedding, version):
+        """Semantic tier only: the closest cached question above the threshold. Does not count a miss."""
+        with self._lock:
+            vectors, ids = self._vectors(version)
+            if vectors is None:
+                return None
+            query = _normalize(np.asarray(embedding, dtype=np.float32))
+            scores = vectors @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            row = self._db.execute(
+                "SELECT answer, generation_seconds FROM answers WHERE id = ? AND created >= ?",
+                (ids[best], time.time() - self.ttl_seconds)).fetchone()
+            if row:
+                self.semantic_hits += 1
+                self.seconds_saved += row[1]
+                return row[0]
+            return None
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def store(self, question, embedding, answer, version, generation_seconds):
+        with self._lock:
+            self._purge_expired()
+            blob = None
+            if embedding is not None:
+                vector = _normalize(np.asarray(embedding, dtype=np.float32))
+                blob = vector.tobytes()
+            cursor = self._db.execute(
+                "INSERT INTO answers (version, question, normalized, embedding, answer, generation_seconds, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (version, question, normalize_question(question), blob, answer, generation_seconds, time.time()))
+            self._db.commit()
+            loaded = self._loaded.get(version)
+            if blob is not None and loaded is not None:
+                loaded[0] = vector[None, :] if loaded[0] is None else np.vstack([loaded[0], vector])
+                loaded[1].append(cursor.lastrowid)
+
+    def discard(self, version):
+        """Deletes the answers of a corpus version that changed."""
+        with self._lock:
+            self._db.execute("DELETE FROM answers WHERE version = ?", (version,))
+            self._db.commit()
+            self._loaded.pop(version, None)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM answers")
+            self._db.commit()
+            self._loaded.clear()
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "seconds_saved": round(self.seconds_saved, 2),
+        }
+
+    def _vectors(self, version):
+        """The query vectors and answer ids of a version, loaded on first use."""
+        self._purge_expired()
+        loaded = self._loaded.get(version)
+        if loaded is not None:
+            self._loaded.move_to_end(version)
+            return loaded
+        rows = self._db.execute("SELECT id, embedding FROM answers WHERE version = ? AND embedding IS NOT NULL",
+                                (version,)).fetchall()
+        vectors = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+        loaded = self._loaded[version] = [vectors, [row[0] for row in rows]]
+        if len(self._loaded) > MAX_LOADED_VERSIONS:
+            self._loaded.popitem(last=False)
+        return loaded
+
+    def _purge_expired(self):
+        now = time.time()
+        if now - self._purged_at < PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = now
+        if self._db.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl_seconds,)).rowcount:
+            self._loaded.clear()
+        self._db.commit()
+
+
+def _normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -1,11 +1,19 @@
 import streamlit as st
 import os
-from agent import SharePointAgent
-from sharepoint_connector import SharePointFetcher
+import time
+from agent import QueryTimings
+from agent_cache import agent_cache
+from llm_router import LLMRouter
+from shards import ShardRegistry, sync_shards
+from telemetry import telemetry, render_streamlit_panel
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Streamlit re-executes this script on every interaction; time each run.
+rerun_started = time.perf_counter()
+telemetry.count("streamlit_reruns", app="sharepoint")
+
 st.title("SharePoint Document Assistant")
 
 # Sidebar for Setup
@@ -48,14 +56,45 @@ with st.sidebar:
             st.error("Please provide Client ID and Secret.")
         else:
             try:
+                from sharepoint_connector import SharePointFetcher
                 fetcher = SharePointFetcher(client_id, client_secret, tenant_id)
                 fetcher.authenticate()
-                st.info("Authenticated. Starting download...")
-                fetcher.download_files(site_url, library_name, "data/sharepoint_docs")
-                st.success("Download complete!")
-                # Re-initialize agent to index new docs
-                st.session_state.agent = SharePointAgent(use_google=(provider == "Google Vertex AI (ADK)"))
-                st.session_state.agent.create_vector_store()
+                st.info("Authenticated. Syncing library...")
+                # Each site/library is its own shard, with its own files and index.
+                shard = ShardRegistry().add(site_url, library_name)
+                sync_result = fetcher.sync_library(site_url, library_name, shard.data_dir)
+                if sync_result is None:
+                    st.error(f"Could not find library '{library_name}' in site '{site_url}'.")
+                else:
+                    st.success(f"Sync complete: {sync_result}")
+                    if sync_result.download_stats:
+                        st.caption(str(sync_result.download_stats))
+                    st.session_state.last_sync = sync_result
+                    if sync_result.has_changes:
+                        # Only re-embed the files the sync touched, in every cached agent.
+                        for update in agent_cache.index_changed(sync_result.changed + sync_result.removed):
+                            st.caption(f"Index updated: {update}")
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+    if st.button("Sync all shards"):
+        if not client_id or not client_secret:
+            st.error("Please provide Client ID and Secret.")
+        else:
+            try:
+                from sharepoint_connector import SharePointFetcher
+                fetcher = SharePointFetcher(client_id, client_secret, tenant_id)
+                fetcher.authenticate()
+                changed = []
+                for shard, sync_result in sync_shards(fetcher, ShardRegistry()):
+                    if sync_result is None:
+                        st.error(f"Could not find library '{shard.library}' in site '{shard.site}'.")
+                    else:
+                        st.caption(f"{shard.label}: {sync_result}")
+                        changed.extend(sync_result.changed + sync_result.removed)
+                if changed:
+                    for update in agent_cache.index_changed(changed):
+                        st.caption(f"Index updated: {update}")
             except Exception as e:
                 st.error(f"Error: {e}")
 
@@ -63,14 +102,27 @@ with st.sidebar:
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-# Initialize Agent based on selection
-if "agent" not in st.session_state or st.session_state.get("current_provider") != provider:
-    use_google = (provider == "Google Vertex AI (ADK)")
-    st.session_state.agent = SharePointAgent(use_google=use_google)
-    st.session_state.current_provider = provider
-    # Initialize index if data exists
-    if os.path.exists("./data/sharepoint_docs") or (use_google and os.getenv("VERTEX_AI_DATA_STORE_ID")):
-        st.session_state.agent.create_vector_store()
+# Agents are shared by all sessions and reruns; only the first use of a provider builds one.
+st.session_state.agent = agent_cache.get(use_google=(provider == "Google Vertex AI (ADK)"), sharded=True)
+st.session_state.current_provider = provider
+
+# Questions only go to the selected shards, so they cost what those shards hold, not the whole corpus.
+registry = st.session_state.agent.registry.load()
+with st.sidebar:
+    st.header("Shards")
+    selected_shards = st.multiselect("Search in", registry.keys(), default=registry.keys(),
+                                     format_func=lambda key: registry.get(key).label)
+    for key in selected_shards:
+        if st.button(f"Rebuild {registry.get(key).label}", key=f"rebuild-{key}"):
+            with st.spinner(f"Rebuilding {registry.get(key).label}..."):
+                st.caption(f"Rebuilt: {st.session_state.agent.rebuild(key)}")
+
+if st.session_state.agent.answer_cache:
+    with st.sidebar.expander("Answer cache"):
+        st.json(st.session_state.agent.answer_cache.stats())
+if isinstance(st.session_state.agent.llm, LLMRouter):
+    with st.sidebar.expander("LLM routing"):
+        st.json(st.session_state.agent.llm.stats())
 
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -84,13 +136,19 @@ if prompt := st.chat_input("Ask a question about your documents"):
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
         full_response = ""
-        # Get response from agent
+        timings = QueryTimings()
+        # Stream the response from the agent as it is generated
         try:
-            full_response = st.session_state.agent.query_agent(prompt)
+            for token in st.session_state.agent.stream_query(prompt, timings, shards=selected_shards):
+                full_response += token
+                message_placeholder.markdown(full_response + "▌")
         except Exception as e:
              full_response = f"Error querying agent: {e}"
         
         message_placeholder.markdown(full_response)
+        st.caption(str(timings))
     
     st.session_state.messages.append({"role": "assistant", "content": full_response})
 
+telemetry.observe("app.rerun", time.perf_counter() - rerun_started)
+render_streamlit_panel()
@@ -0,0 +1,256 @@
+"""
+Answers a JSONL file of questions with the SharePoint agent, many at a time.
+
+    python batch_qa.py questions.jsonl answers.jsonl --concurrency 16
+
+Each input line is a JSON object with a "question" and optionally an "id" (default: the line
+number) and "shards" (with --sharded, the shards to search), or just a JSON string. Each
+output line holds the id, question, answer, the sources it was generated from and the
+query's timings, or an "error".
+
+Questions that are the same after normalization (case, whitespace, trailing punctuation)
+and search the same shards are answered once; the copies get the same answer, a
+"duplicate_of" id and zero timings marked "shared". Answers are appended and flushed as they finish, so running the same
+command again after an interruption only answers what is missing (--retry-errors also
+redoes failed questions).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from dotenv import load_dotenv
+from agent import QueryTimings
+from answer_cache import normalize_question
+from telemetry import telemetry
+
+CONCURRENCY = 8
+# Seconds between progress lines.
+PROGRESS_SECONDS = 5.0
+
+
+class BatchItem:
+    def __init__(self, id, question, shards=None):
+        self.id = id
+        self.question = question
+        self.shards = sorted(shards) if shards is not None else None
+
+    @property
+    def key(self):
+        """Questions with the same key share one answer."""
+        return normalize_question(self.question), tuple(self.shards) if self.shards is not None else None
+
+
+def read_questions(path) -> list:
+    """BatchItems from a JSONL file; ids default to the 1-based line number and must be unique."""
+    items, seen = [], set()
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                if isinstance(entry, str):
+                    entry = {"question": entry}
+                item = BatchItem(str(entry.get("id", number)), entry["question"], entry.get("shards"))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise ValueError(f"{path}:{number}: expected a question string or object ({e})") from e
+            if item.id in seen:
+                raise ValueError(f"{path}:{number}: duplicate id {item.id!r}")
+            seen.add(item.id)
+            items.append(item)
+    return items
+
+
+def read_answers(path, retry_errors=False) -> dict:
+    """{id: record} already written to an output file (the last record per id wins)."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interruption
+            records[str(record["id"])] = record
+    if retry_errors:
+        records = {id: record for id, record in records.items() if "error" not in record}
+    return records
+
+
+def sources(documents) -> list:
+    """Source file (and page, and collapsed copies) of each retrieved chunk, without repeats."""
+    found = []
+    for doc in documents:
+        entry = {"source": doc.metadata.get("source")}
+        for field in ("page", "aliases"):
+            if doc.metadata.get(field) is not None:
+                entry[field] = doc.metadata[field]
+        if entry not in found:
+            found.append(entry)
+    return found
+
+
+def shared_copy(record, item) -> dict:
+    """The record of a copy of an answered question: its answer and sources, but no time spent."""
+    copy = dict(record, id=item.id, question=item.question, duplicate_of=record["id"])
+    if "timings" in record:
+        copy["timings"] = {key: 0.0 if key.endswith("_s") else False for key in record["timings"]}
+        copy["timings"]["shared"] = True
+    return copy
+
+
+class BatchRunner:
+    """
+    Answers BatchItems with up to `concurrency` questions in flight, writing JSONL records.
+
+    Works with a SharePointAgent or, for items with "shards", a ShardedAgent.
+    """
+
+    def __init__(self, agent, concurrency=CONCURRENCY, progress_every=PROGRESS_SECONDS, retry_errors=False,
+                 log=sys.stderr):
+        self.agent = agent
+        self.concurrency = concurrency
+        self.progress_every = progress_every
+        self.retry_errors = retry_errors
+        self.log = log
+
+    def run(self, questions_path, output_path) -> dict:
+        items = read_questions(questions_path)
+        if any(item.shards is not None for item in items) and not hasattr(self.agent, "registry"):
+            raise ValueError("Questions name shards; answer them with a ShardedAgent (--sharded).")
+        written = read_answers(output_path, self.retry_errors)
+        pending = [item for item in items if item.id not in written]
+
+        # Copies of a question share its answer, including one written by an earlier run.
+        groups = {}
+        for item in pending:
+            groups.setdefault(item.key, []).append(item)
+        answered = {}
+        for record in written.values():
+            if "error" not in record:
+                key = BatchItem(record["id"], record["question"], record.get("shards")).key
+                answered.setdefault(key, record)
+
+        stats = {"questions": len(items), "skipped": len(items) - len(pending), "answered": 0, "shared": 0,
+                 "cached": 0, "errors": 0, "interrupted": False}
+        started = time.perf_counter()
+        with telemetry.span("batch_qa.run", questions=len(items), pending=len(pending),
+                            unique=len(groups)) as span, open(output_path, "a", encoding="utf-8") as out:
+            if out.tell() and not self._ends_with_newline(output_path):
+                out.write("\n")
+
+            def write(members, original):
+                for item in members:
+                    record = original if item.id == original["id"] else shared_copy(original, item)
+                    stats["shared"] += record is not original
+                    if item.shards is not None:
+                        record["shards"] = item.shards
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    stats["errors" if "error" in record else "answered"] += 1
+                    stats["cached"] += bool(record.get("timings", {}).get("cached"))
+                out.flush()
+
+            for key in [key for key in groups if key in answered]:
+                write(groups.pop(key), answered[key])
+
+            pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-qa")
+            futures = {pool.submit(self.answer, members[0]): members for members in groups.values()}
+            remaining = set(futures)
+            last_report = time.perf_counter()
+            try:
+                while remaining:
+                    try:
+                        done, remaining = wait(remaining, timeout=self.progress_every, return_when=FIRST_COMPLETED)
+                    except KeyboardInterrupt:
+                        if stats["interrupted"]:
+                            break
+                        stats["interrupted"] = True
+                        remaining = {future for future in remaining if not future.cancel()}
+                        print(f"Interrupted; finishing {len(remaining)} questions in flight "
+                              f"(Ctrl-C again to stop now). Run the same command to resume.", file=self.log)
+                        continue
+                    for future in done:
+                        write(futures[future], future.result())
+                    if time.perf_counter() - last_report >= self.progress_every:
+                        self._progress(stats, len(pending), started)
+                        last_report = time.perf_counter()
+            finally:
+                pool.shutdown(wait=not stats["interrupted"], cancel_futures=True)
+            stats["seconds"] = round(time.perf_counter() - started, 2)
+            span.set(**{key: value for key, value in stats.items() if key != "interrupted"})
+        self._progress(stats, len(pending), started, final=True)
+        return stats
+
+    def answer(self, item) -> dict:
+        """One question's output record; errors are recorded, not raised."""
+        timings = QueryTimings()
+        record = {"id": item.id, "question": item.question}
+        try:
+            options = {"shards": item.shards} if item.shards is not None else {}
+            record["answer"] = "".join(self.agent.stream_query(item.question, timings, **options))
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            telemetry.count("batch_qa_errors", error=type(e).__name__)
+            return record
+        record["sources"] = sources(timings.documents)
+        record["timings"] = {
+            "retrieval_s": round(timings.retrieval, 4), "first_token_s": round(timings.first_token, 4),
+            "generation_s": round(timings.generation, 4), "total_s": round(timings.total, 4),
+            "cached": timings.cached, "keyword_fast_path": timings.keyword_fast_path,
+        }
+        return record
+
+    @staticmethod
+    def _ends_with_newline(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _progress(self, stats, pending, started, final=False):
+        done = stats["answered"] + stats["errors"]
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        line = (f"{done}/{pending} done ({stats['shared']} shared, {stats['cached']} cached, "
+                f"{stats['errors']} errors), {rate:.1f} questions/s")
+        if final:
+            skipped = f", {stats['skipped']} already answered" if stats["skipped"] else ""
+            line += f" in {elapsed:.1f}s{skipped}"
+        elif rate:
+            line += f", about {(pending - done) / rate:.0f}s left"
+        print(line, file=self.log)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="JSONL file of questions")
+    parser.add_argument("output", help="JSONL file to append answers to (also what a rerun resumes from)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Questions answered at once")
+    parser.add_argument("--progress", type=float, default=PROGRESS_SECONDS, help="Seconds between progress lines")
+    parser.add_argument("--retry-errors", action="store_true", help="Answer questions that failed last time again")
+    parser.add_argument("--sharded", action="store_true", help="Search the registered site/library shards")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Generate every answer, even repeated ones")
+    args = parser.parse_args()
+
+    use_google = os.getenv("USE_GOOGLE_AGENT", "False").lower() == "true"
+    if args.sharded:
+        from shards import ShardedAgent
+        agent = ShardedAgent(use_google=use_google, use_answer_cache=not args.no_answer_cache)
+    else:
+        from agent import SharePointAgent
+        agent = SharePointAgent(use_google=use_google, use_answer_cache=not args.no_answer_cache)
+    agent.create_vector_store()
+
+    runner = BatchRunner(agent, concurrency=args.concurrency, progress_every=args.progress,
+                         retry_errors=args.retry_errors)
+    stats = runner.run(args.questions, args.output)
+    if stats["interrupted"]:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
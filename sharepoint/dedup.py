@@ -0,0 +1,339 @@
+import re
+import zlib
+import sqlite3
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from index_state import chunk_hash
+
+DEDUP_INDEX_FILENAME = "dedup_index.sqlite"
+NUM_PERM = 128
+SHINGLE_WORDS = 5
+# Estimated Jaccard similarity of word 5-shingles above which two texts are the same content.
+DOCUMENT_THRESHOLD = 0.9
+CHUNK_THRESHOLD = 0.9
+# LSH bands are chosen so a pair right at the threshold is still a candidate this often.
+CANDIDATE_RECALL = 0.99
+# Words shingled and permuted per NumPy pass; small enough that the num_perm-wide
+# intermediate (8 bytes per shingle and permutation) stays in cache.
+SIGNATURE_BATCH = 1024
+
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"\w+")
+
+
+def _word_hashes(text, known) -> np.ndarray:
+    """crc32 of each lowercased word; `known` memoizes them across texts."""
+    words = _WORD_RE.findall(text.lower())
+    for word in set(words).difference(known):
+        known[word] = zlib.crc32(word.encode("utf-8"))
+    return np.fromiter(map(known.__getitem__, words), dtype=np.uint64, count=len(words))
+
+
+def _roll(word_hashes, k) -> np.ndarray:
+    """Hashes of every run of k consecutive words, combined arithmetically rather than as joined strings."""
+    count = len(word_hashes) - k + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(k):
+        hashes = (hashes * np.uint64(1000003) + word_hashes[offset:offset + count]) & np.uint64(_MAX_HASH)
+    return hashes
+
+
+def shingle_hashes(text, k=SHINGLE_WORDS) -> np.ndarray:
+    """32-bit hashes of the text's lowercased word k-grams; texts shorter than k words are one shingle."""
+    word_hashes = _word_hashes(text, {})
+    return _roll(word_hashes, min(k, len(word_hashes))) if len(word_hashes) else word_hashes
+
+
+class MinHasher:
+    """
+    MinHash signatures: for each of `num_perm` multiply-shift hash functions
+    ((a*x + b) mod 2**64) >> 32 over 32-bit shingle hashes, the minimum over the text's
+    shingles. The share of equal positions in two signatures estimates the Jaccard
+    similarity of their shingle sets.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.RandomState(seed)
+        # Odd multipliers; uint64 arithmetic wraps, which is the mod 2**64.
+        self.a = rng.randint(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.randint(0, 1 << 63, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, text) -> Optional[np.ndarray]:
+        """uint32 signature of the text, or None when it has no words."""
+        return self.signatures([text])[0]
+
+    def signatures(self, texts, k=SHINGLE_WORDS) -> list:
+        """Signatures of several texts, hashing and permuting their shingles in bounded batches."""
+        result = [None] * len(texts)
+        known = {}
+        group, size = [], 0
+        for i, text in enumerate(texts):
+            word_hashes = _word_hashes(text, known)
+            if len(word_hashes):
+                group.append((i, word_hashes))
+                size += len(word_hashes)
+            if group and (size >= SIGNATURE_BATCH or i == len(texts) - 1):
+                self._sign(group, k, result)
+                group, size = [], 0
+        return result
+
+    def _sign(self, group, k, result):
+        # Shingle every text in one pass over the concatenated words, keeping only the windows
+        # that lie inside one text; texts shorter than k words are one shingle each.
+        words = np.concatenate([w for _, w in group])
+        rolled = _roll(words, k) if len(words) >= k else None
+        shingles, lengths = [], []
+        offset = 0
+        for _, w in group:
+            if len(w) >= k:
+                shingles.append(rolled[offset:offset + len(w) - k + 1])
+            else:
+                shingles.append(_roll(w, len(w)))
+            lengths.append(len(shingles[-1]))
+            offset += len(w)
+        starts = np.cumsum([0] + lengths[:-1])
+        permuted = np.multiply.outer(np.concatenate(shingles), self.a)
+        permuted += self.b
+        permuted >>= np.uint64(32)
+        for (i, _), row in zip(group, np.minimum.reduceat(permuted, starts, axis=0).astype(np.uint32)):
+            result[i] = row
+
+
+def union_signature(signatures) -> Optional[np.ndarray]:
+    """Signature of the union of several shingle sets (e.g. a document from its chunks)."""
+    signatures = [s for s in signatures if s is not None]
+    return np.minimum.reduce(signatures) if signatures else None
+
+
+def similarity(a, b) -> float:
+    return float(np.mean(a == b))
+
+
+def lsh_bands(threshold, num_perm=NUM_PERM, recall=CANDIDATE_RECALL):
+    """(bands, rows): the most selective banding that still finds pairs at `threshold` with `recall`."""
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= recall:
+            best = (bands, rows)
+    return best
+
+
+class LSHIndex:
+    """In-memory banded LSH over MinHash signatures, verified against the estimated similarity."""
+
+    def __init__(self, threshold, num_perm=NUM_PERM):
+        self.threshold = threshold
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, key, signature):
+        self.remove(key)
+        self._signatures[key] = signature
+        for bucket, band in zip(self._buckets, self._keys(signature)):
+            bucket.setdefault(band, set()).add(key)
+
+    def remove(self, key):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for bucket, band in zip(self._buckets, self._keys(signature)):
+            members = bucket.get(band)
+            if members:
+                members.discard(key)
+                if not members:
+                    del bucket[band]
+
+    def query(self, signature):
+        """The most similar key at or above the threshold, or None."""
+        candidates = set()
+        for bucket, band in zip(self._buckets, self._keys(signature)):
+            candidates.update(bucket.get(band, ()))
+        best, best_score = None, self.threshold
+        for key in sorted(candidates):
+            score = similarity(signature, self._signatures[key])
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+
+class DedupIndex:
+    """
+    Near-duplicate detection for ingestion, at document and chunk level (MinHash + LSH).
+
+    Before a file's chunks are embedded, its text is compared with every canonical document:
+    a copy ("final (1)", the same PDF in another folder) becomes an alias of the first one
+    and none of its chunks are stored. Otherwise each new chunk is compared with the stored
+    chunks, and near-identical ones (boilerplate, mostly unchanged "v2" sections) are
+    aliased instead of embedded.
+
+    Signatures and alias links live in a SQLite sidecar next to the vector store; the LSH
+    tables are rebuilt in memory on open. When a canonical document or chunk goes away,
+    the files that aliased it are reported by `take_released` so they can be indexed again.
+    """
+
+    def __init__(self, path, document_threshold=DOCUMENT_THRESHOLD, chunk_threshold=CHUNK_THRESHOLD,
+                 num_perm=NUM_PERM):
+        self.hasher = MinHasher(num_perm)
+        self._documents = LSHIndex(document_threshold, num_perm)
+        self._chunks = LSHIndex(chunk_threshold, num_perm)
+        self._released = set()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (path TEXT PRIMARY KEY, signature BLOB, canonical TEXT);
+            CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT PRIMARY KEY, path TEXT, key TEXT, signature BLOB, canonical TEXT);
+            CREATE INDEX IF NOT EXISTS documents_canonical ON documents (canonical);
+            CREATE INDEX IF NOT EXISTS chunks_path ON chunks (path);
+            CREATE INDEX IF NOT EXISTS chunks_key ON chunks (key);
+            CREATE INDEX IF NOT EXISTS chunks_canonical ON chunks (canonical);
+        """)
+        self._db.commit()
+        for path, signature in self._db.execute(
+                "SELECT path, signature FROM documents WHERE canonical IS NULL AND signature IS NOT NULL"):
+            self._documents.add(path, np.frombuffer(signature, dtype=np.uint32))
+        for chunk_id, signature in self._db.execute(
+                "SELECT id, signature FROM chunks WHERE canonical IS NULL AND signature IS NOT NULL"):
+            self._chunks.add(chunk_id, np.frombuffer(signature, dtype=np.uint32))
+
+    def __len__(self):
+        return len(self._documents)
+
+    def signatures(self, chunks) -> list:
+        """One MinHash signature per chunk (None for chunks without words)."""
+        return self.hasher.signatures([c.page_content for c in chunks])
+
+    def add_document(self, path, signatures) -> Optional[str]:
+        """
+        Registers a (re)parsed file from its chunk signatures. Returns the canonical path if the
+        file duplicates another document, in which case it is recorded as that document's alias.
+        """
+        signature = union_signature(signatures)
+        with self._lock:
+            self._forget(path)
+            canonical = self._documents.query(signature) if signature is not None else None
+            if canonical is None and signature is not None:
+                self._documents.add(path, signature)
+            self._db.execute("INSERT OR REPLACE INTO documents (path, signature, canonical) VALUES (?, ?, ?)",
+                             (path, None if signature is None else signature.tobytes(), canonical))
+        return canonical
+
+    def add_chunk(self, chunk_id, path, chunk, signature) -> Optional[str]:
+        """
+        Registers a chunk about to be stored. Returns the id of a stored near-duplicate chunk
+        instead if there is one; the chunk is then recorded as its alias and should be skipped.
+        """
+        with self._lock:
+            canonical = self._chunks.query(signature) if signature is not None else None
+            if canonical is None and signature is not None:
+                self._chunks.add(chunk_id, signature)
+            self._db.execute("INSERT OR REPLACE INTO chunks (id, path, key, signature, canonical) VALUES (?, ?, ?, ?, ?)",
+                             (chunk_id, path, chunk_hash(chunk),
+                              None if canonical or signature is None else signature.tobytes(), canonical))
+        return canonical
+
+    def backfill(self, path, ids, chunks):
+        """Registers a file already in the store as canonical, without looking for duplicates."""
+        signatures = self.signatures(chunks)
+        signature = union_signature(signatures)
+        with self._lock:
+            if signature is not None:
+                self._documents.add(path, signature)
+            self._db.execute("INSERT OR REPLACE INTO documents (path, signature, canonical) VALUES (?, ?, NULL)",
+                             (path, None if signature is None else signature.tobytes()))
+            for chunk_id, chunk, chunk_signature in zip(ids, chunks, signatures):
+                if chunk_signature is not None:
+                    self._chunks.add(chunk_id, chunk_signature)
+                self._db.execute("INSERT OR REPLACE INTO chunks (id, path, key, signature, canonical) "
+                                 "VALUES (?, ?, ?, ?, NULL)",
+                                 (chunk_id, path, chunk_hash(chunk),
+                                  None if chunk_signature is None else chunk_signature.tobytes()))
+
+    def remove_document(self, path):
+        """Forgets a removed file; files that were its aliases are released."""
+        with self._lock:
+            self._forget(path)
+            self._db.execute("DELETE FROM documents WHERE path = ?", (path,))
+
+    def remove_chunks(self, ids: List[str]):
+        """Forgets chunks deleted from the store; files holding aliases of them are released."""
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                self._released.update(path for (path,) in self._db.execute(
+                    f"SELECT DISTINCT path FROM chunks WHERE canonical IN ({placeholders})", batch))
+                self._db.execute(f"DELETE FROM chunks WHERE id IN ({placeholders}) OR canonical IN ({placeholders})",
+                                 batch + batch)
+                for chunk_id in batch:
+                    self._chunks.remove(chunk_id)
+
+    def _forget(self, path):
+        # The file is about to be decided again: drop its document entry and chunk aliases
+        # (its stored chunks stay until they are deleted), and release documents that aliased it.
+        self._documents.remove(path)
+        self._released.update(alias for (alias,) in self._db.execute(
+            "SELECT path FROM documents WHERE canonical = ?", (path,)))
+        self._db.execute("DELETE FROM documents WHERE canonical = ?", (path,))
+        self._db.execute("DELETE FROM chunks WHERE path = ? AND canonical IS NOT NULL", (path,))
+
+    def take_released(self) -> set:
+        """Paths whose canonical copy went away since the last call; index them again."""
+        with self._lock:
+            released, self._released = self._released, set()
+        return released
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM documents")
+            self._db.execute("DELETE FROM chunks")
+            self._db.commit()
+            self._documents = LSHIndex(self._documents.threshold, self.hasher.num_perm)
+            self._chunks = LSHIndex(self._chunks.threshold, self.hasher.num_perm)
+            self._released = set()
+
+    def aliases(self, doc) -> List[str]:
+        """Other files holding the same content as a retrieved chunk: copies of its document and of the chunk."""
+        source = str(doc.metadata.get("source", ""))
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT path FROM documents WHERE canonical = ?
+                UNION
+                SELECT alias.path FROM chunks AS alias JOIN chunks AS stored ON alias.canonical = stored.id
+                WHERE stored.path = ? AND stored.key = ? AND alias.path != ?
+            """, (source, source, chunk_hash(doc), source)).fetchall()
+        return sorted(path for (path,) in rows)
+
+    def annotate(self, docs):
+        """Adds an `aliases` list to the metadata of retrieved chunks that have copies elsewhere."""
+        for doc in docs:
+            aliases = self.aliases(doc)
+            if aliases:
+                doc.metadata["aliases"] = aliases
+        return docs
+
+    def stats(self) -> dict:
+        with self._lock:
+            documents, document_aliases = self._db.execute(
+                "SELECT COUNT(*), COUNT(canonical) FROM documents").fetchone()
+            chunks, chunk_aliases = self._db.execute("SELECT COUNT(*), COUNT(canonical) FROM chunks").fetchone()
+        return {"documents": documents, "duplicate_documents": document_aliases,
+                "chunks": chunks, "duplicate_chunks": chunk_aliases}
@@ -0,0 +1,244 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from telemetry import telemetry
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadJob:
+    """A single file to fetch: where it comes from, where it goes and how big it should be."""
+
+    def __init__(self, url, local_path, size=None, key=None, version=None):
+        self.url = url
+        self.local_path = local_path
+        self.size = size
+        self.key = key  # Caller-defined id (e.g. the drive item id)
+        self.version = version  # Content version (e.g. the cTag); without one a .part is never resumed
+        self.bytes_downloaded = 0
+        self.error = None
+
+
+class DownloadStats:
+    def __init__(self):
+        self.completed = []
+        self.failed = []
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def files_per_second(self):
+        return len(self.completed) / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self):
+        return self.bytes / (1024 * 1024) / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"Downloaded {len(self.completed)} files ({self.bytes / (1024 * 1024):.1f} MB) "
+                f"in {self.seconds:.1f}s: {self.files_per_second:.1f} files/s, "
+                f"{self.mb_per_second:.2f} MB/s, {len(self.failed)} failed")
+
+
+class RetryableDownloadError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ParallelDownloader:
+    """
+    Downloads many files concurrently with bounded parallelism.
+
+    `session` is anything with a requests-style `get(url, headers=..., stream=True)`
+    (the O365 `Connection`, a `requests.Session`, or a local fake in tests).
+    Files are written to `<path>.part` and renamed into place once complete; a
+    leftover `.part` file from an interrupted run is resumed with a Range request if it
+    belongs to the same version of the file (recorded in `<path>.part.version`).
+    429/503 (and other transient 5xx) responses are retried honouring Retry-After.
+    `per_host_limit` applies to the host the content is served from, which for Graph is
+    the download host `/content` redirects to rather than the API host.
+    """
+
+    def __init__(self, session, max_workers=8, per_host_limit=4, max_retries=5,
+                 backoff_base=1.0, max_backoff=60.0, chunk_size=CHUNK_SIZE):
+        self.session = session
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.chunk_size = chunk_size
+        self._host_slots = {}
+        self._redirects = {}  # request host -> host its downloads were redirected to
+        self._lock = threading.Lock()
+
+    def download(self, jobs) -> DownloadStats:
+        """Runs all jobs and returns throughput stats. Failures are collected, not raised."""
+        stats = DownloadStats()
+        started = time.perf_counter()
+        with telemetry.span("download.files", files=len(jobs)) as span:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self._download_with_retries, job): job for job in jobs}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        future.result()
+                        stats.completed.append(job)
+                    except Exception as e:
+                        job.error = e
+                        stats.failed.append(job)
+                        print(f"Error downloading {job.local_path}: {e}")
+                    stats.bytes += job.bytes_downloaded
+            span.set(bytes=stats.bytes, failed=len(stats.failed))
+        stats.seconds = time.perf_counter() - started
+        telemetry.count("download_bytes", stats.bytes)
+        telemetry.count("download_files", len(stats.completed), result="ok")
+        telemetry.count("download_files", len(stats.failed), result="failed")
+        return stats
+
+    def _host_slot(self, host):
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def _serving_host(self, url):
+        """The host a request to `url` is expected to download from (its redirect target once seen)."""
+        host = urlparse(url).netloc
+        with self._lock:
+            return self._redirects.get(host, host)
+
+    def _download_with_retries(self, job):
+        attempt = 0
+        while True:
+            try:
+                self._download_once(job)
+                return
+            except (RetryableDownloadError, OSError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                delay = getattr(e, "retry_after", None)
+                if delay is None:
+                    delay = min(self.max_backoff, self.backoff_base * (2 ** (attempt - 1)))
+                    delay *= random.uniform(0.5, 1.0)
+                print(f"Retrying {job.local_path} in {delay:.1f}s ({e})")
+                telemetry.count("download_retries")
+                time.sleep(delay)
+
+    def _download_once(self, job):
+        os.makedirs(os.path.dirname(job.local_path) or ".", exist_ok=True)
+        tmp_path = job.local_path + ".part"
+        version_path = tmp_path + ".version"
+        offset = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+        if offset and (job.version is None or read_version(version_path) != job.version
+                       or (job.size is not None and offset > job.size)):
+            # Left by another (or an unknown) version of the file: its bytes must not prefix
+            # the new content.
+            offset = 0
+
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        host = self._serving_host(job.url)
+        slot = self._host_slot(host)
+        slot.acquire()
+        try:
+            response = self._get(job.url, headers)
+            served_from = urlparse(getattr(response, "url", None) or job.url).netloc
+            if served_from != host:
+                # Redirected (Graph sends /content to a download host): limit that host instead,
+                # and acquire its slot up front for the next files.
+                with self._lock:
+                    self._redirects[urlparse(job.url).netloc] = served_from
+                slot.release()
+                slot = None
+                redirected = self._host_slot(served_from)
+                redirected.acquire()
+                slot = redirected
+            self._write(job, response, tmp_path, version_path, offset)
+        finally:
+            if slot is not None:
+                slot.release()
+
+        if job.size is not None and os.path.getsize(tmp_path) != job.size:
+            raise RetryableDownloadError(
+                f"Incomplete download ({os.path.getsize(tmp_path)} of {job.size} bytes)")
+        os.replace(tmp_path, job.local_path)
+        if os.path.exists(version_path):
+            os.remove(version_path)
+
+    def _write(self, job, response, tmp_path, version_path, offset):
+        try:
+            if response.status_code == 416:
+                # Nothing left to fetch: the partial file is already complete.
+                if job.size is None or offset != job.size:
+                    os.remove(tmp_path)
+                    raise RetryableDownloadError("Range not satisfiable, restarting")
+            else:
+                if response.status_code != 206:
+                    # Server ignored the Range header; start over.
+                    offset = 0
+                if not offset:
+                    write_version(version_path, job.version)
+                with open(tmp_path, "ab" if offset else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            job.bytes_downloaded += len(chunk)
+        finally:
+            close = getattr(response, "close", None)
+            if close:
+                close()
+
+    def _get(self, url, headers):
+        try:
+            response = self.session.get(url, headers=headers, stream=True)
+        except Exception as e:
+            # O365's Connection raises HTTPError instead of returning error responses.
+            response = getattr(e, "response", None)
+            if response is None or (response.status_code not in RETRYABLE_STATUS
+                                    and response.status_code != 416):
+                raise
+        if response.status_code in RETRYABLE_STATUS:
+            raise RetryableDownloadError(f"HTTP {response.status_code}",
+                                         retry_after=parse_retry_after(response.headers.get("Retry-After")))
+        if response.status_code >= 400 and response.status_code != 416:
+            raise RuntimeError(f"HTTP {response.status_code} for {url}")
+        return response
+
+
+def read_version(path):
+    """The version recorded for a partial download, or None."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read() or None
+    except OSError:
+        return None
+
+
+def write_version(path, version):
+    if version is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(version)
+
+
+def parse_retry_after(value):
+    """Parses a Retry-After header (seconds or HTTP date) into seconds to wait."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,220 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from telemetry import telemetry
+
+EMBEDDING_CACHE_DIR = "./embedding_cache"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB of vectors per provider/model
+
+
+def embedding_namespace(embeddings) -> str:
+    """Identifies the provider and model so vectors from different models never mix."""
+    # Look through wrappers (executors, caches) to the model that actually produces vectors.
+    while getattr(embeddings, "embeddings", None) is not None:
+        embeddings = embeddings.embeddings
+    provider = type(embeddings).__name__
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None) or "default"
+    return f"{provider}:{model}"
+
+
+class EmbeddingCache:
+    """
+    Content-addressed, size-bounded embedding cache on disk.
+
+    Vectors for each (provider, model) live in one memory-mapped matrix file
+    (`<namespace id>.bin`, float16 by default); a SQLite table maps the text hash to a row
+    ("slot") and tracks last use. When a namespace reaches `max_bytes`, the least recently
+    used slot is overwritten. Safe to share between threads.
+    """
+
+    def __init__(self, cache_dir=EMBEDDING_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, dtype=np.float16):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._matrices = {}  # namespace id -> (memmap, capacity)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS namespaces (
+                id INTEGER PRIMARY KEY, name TEXT UNIQUE, dim INTEGER, dtype TEXT, capacity INTEGER);
+            CREATE TABLE IF NOT EXISTS entries (
+                ns INTEGER, key TEXT, slot INTEGER, last_used REAL, PRIMARY KEY (ns, key));
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries (ns, last_used);
+        """)
+        self._db.commit()
+
+    @staticmethod
+    def key(text: str, kind: str = "doc") -> str:
+        return hashlib.sha256(f"{kind}\n{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, namespace: str, keys: List[str]) -> List:
+        """Returns cached vectors for keys (None where missing) and refreshes their LRU position."""
+        with self._lock:
+            ns = self._namespace(namespace)
+            results = [None] * len(keys)
+            if ns is None:
+                self.misses += len(keys)
+                return results
+            ns_id, dim, _ = ns
+            matrix = self._matrix(ns_id, dim)
+
+            slots = {}
+            for i in range(0, len(keys), 500):
+                batch = list(set(keys[i:i + 500]))
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT key, slot FROM entries WHERE ns = ? AND key IN ({placeholders})",
+                    [ns_id, *batch]).fetchall()
+                slots.update(rows)
+
+            for i, k in enumerate(keys):
+                slot = slots.get(k)
+                if slot is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    results[i] = matrix[slot].astype(np.float32).tolist()
+
+            if slots:
+                now = time.time()
+                self._db.executemany("UPDATE entries SET last_used = ? WHERE ns = ? AND key = ?",
+                                     [(now, ns_id, k) for k in slots])
+                self._db.commit()
+            return results
+
+    def put_many(self, namespace: str, keys: List[str], vectors: List[List[float]]):
+        """Stores vectors, evicting least recently used entries once the namespace is full."""
+        if not keys:
+            return
+        with self._lock:
+            dim = len(vectors[0])
+            ns = self._namespace(namespace) or self._create_namespace(namespace, dim)
+            ns_id, dim, _ = ns
+            max_slots = max(1, self.max_bytes // (dim * self.dtype.itemsize))
+            now = time.time()
+            count = self._db.execute("SELECT COUNT(*) FROM entries WHERE ns = ?", (ns_id,)).fetchone()[0]
+
+            for k, vector in zip(keys, vectors):
+                row = self._db.execute("SELECT slot FROM entries WHERE ns = ? AND key = ?",
+                                       (ns_id, k)).fetchone()
+                if row:
+                    slot = row[0]
+                else:
+                    if count < max_slots:
+                        slot = count
+                        count += 1
+                    else:
+                        old_key, slot = self._db.execute(
+                            "SELECT key, slot FROM entries WHERE ns = ? ORDER BY last_used LIMIT 1",
+                            (ns_id,)).fetchone()
+                        self._db.execute("DELETE FROM entries WHERE ns = ? AND key = ?", (ns_id, old_key))
+                        self.evictions += 1
+                    self._db.execute("INSERT INTO entries (ns, key, slot, last_used) VALUES (?, ?, ?, ?)",
+                                     (ns_id, k, slot, now))
+                matrix = self._matrix(ns_id, dim, min_capacity=slot + 1, max_slots=max_slots)
+                matrix[slot] = np.asarray(vector, dtype=self.dtype)
+
+            self._matrices[ns_id][0].flush()
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+            }
+
+    def _namespace(self, name):
+        row = self._db.execute("SELECT id, dim, capacity FROM namespaces WHERE name = ? AND dtype = ?",
+                               (name, self.dtype.name)).fetchone()
+        return row
+
+    def _create_namespace(self, name, dim):
+        self._db.execute("INSERT INTO namespaces (name, dim, dtype, capacity) VALUES (?, ?, ?, 0)",
+                         (name, dim, self.dtype.name))
+        self._db.commit()
+        return self._namespace(name)
+
+    def _matrix(self, ns_id, dim, min_capacity=0, max_slots=None):
+        """Returns the memmap for a namespace, growing the file (doubling, up to max_slots) if needed."""
+        path = os.path.join(self.cache_dir, f"{ns_id}.bin")
+        matrix, capacity = self._matrices.get(ns_id, (None, 0))
+        if matrix is None:
+            capacity = self._db.execute("SELECT capacity FROM namespaces WHERE id = ?",
+                                        (ns_id,)).fetchone()[0]
+            if capacity:
+                matrix = np.memmap(path, dtype=self.dtype, mode="r+", shape=(capacity, dim))
+
+        if min_capacity > capacity:
+            new_capacity = max(min_capacity, capacity * 2, 1024)
+            if max_slots:
+                new_capacity = min(new_capacity, max_slots)
+            if matrix is not None:
+                matrix.flush()
+                del matrix
+            with open(path, "ab") as f:
+                f.truncate(new_capacity * dim * self.dtype.itemsize)
+            matrix = np.memmap(path, dtype=self.dtype, mode="r+", shape=(new_capacity, dim))
+            capacity = new_capacity
+            self._db.execute("UPDATE namespaces SET capacity = ? WHERE id = ?", (capacity, ns_id))
+
+        self._matrices[ns_id] = (matrix, capacity)
+        return matrix
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps any LangChain embeddings model with an EmbeddingCache.
+
+    Document and query vectors are cached separately because some providers embed them
+    differently (e.g. Vertex AI task types). Only cache misses reach the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.namespace = embedding_namespace(embeddings)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [EmbeddingCache.key(t, "doc") for t in texts]
+        vectors = self.cache.get_many(self.namespace, keys)
+
+        missing = {}
+        for i, (k, v) in enumerate(zip(keys, vectors)):
+            if v is None:
+                missing.setdefault(k, []).append(i)
+        telemetry.count("embedding_cache", len(texts) - sum(map(len, missing.values())), result="hit")
+        telemetry.count("embedding_cache", sum(map(len, missing.values())), result="miss")
+        if missing:
+            first = [positions[0] for positions in missing.values()]
+            computed = self.embeddings.embed_documents([texts[i] for i in first])
+            self.cache.put_many(self.namespace, list(missing), computed)
+            for positions, vector in zip(missing.values(), computed):
+                for i in positions:
+                    vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        key = EmbeddingCache.key(text, "query")
+        vector = self.cache.get_many(self.namespace, [key])[0]
+        telemetry.count("embedding_cache", result="miss" if vector is None else "hit")
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many(self.namespace, [key], [vector])
+        return vector
@@ -0,0 +1,300 @@
+import time
+import random
+import asyncio
+import threading
+import weakref
+import statistics
+from collections import deque
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+from telemetry import telemetry
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+MAX_BATCH_TOKENS = 8000
+MAX_BATCH_SIZE = 256
+# With latency_target="auto", a response slower than LATENCY_TARGET_FACTOR times the median
+# of the last LATENCY_WINDOW responses counts as slow (once MIN_LATENCY_SAMPLES are in).
+AUTO = "auto"
+LATENCY_WINDOW = 50
+MIN_LATENCY_SAMPLES = 10
+LATENCY_TARGET_FACTOR = 2.0
+# Query embeddings are interactive: fewer retries than document batches.
+QUERY_RETRIES = 2
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when available, otherwise the usual ~4 characters per token."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def pack_batches(texts: List[str], max_tokens=MAX_BATCH_TOKENS, max_size=MAX_BATCH_SIZE) -> List[List[int]]:
+    """Groups text indices into batches under the token and size limits. Oversized texts go alone."""
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_size):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def is_rate_limited(error) -> bool:
+    """Recognises throttling from OpenAI (429), Vertex AI (ResourceExhausted) or a plain HTTP client."""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if callable(status):
+        status = status()
+    if status in (429, 503) or getattr(status, "name", None) == "RESOURCE_EXHAUSTED":
+        return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) in (429, 503):
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "resource exhausted" in message
+
+
+def _status(error):
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if callable(status):
+        status = status()
+    if isinstance(status, int):
+        return status
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+
+def is_retryable(error) -> bool:
+    """
+    Throttling, server errors (5xx) and connection or timeout failures. Anything else (a bad
+    key, a 400 for over-long input) fails the same way on every attempt, so it is raised at once.
+    """
+    if is_rate_limited(error):
+        return True
+    status = _status(error)
+    if isinstance(status, int) and 500 <= status < 600:
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    # Provider SDKs have their own types (openai.APIConnectionError, APITimeoutError,
+    # google.api_core DeadlineExceeded, httpx.ConnectError, ...).
+    return any(name in cls.__name__ for cls in type(error).__mro__
+               for name in ("Timeout", "Connection", "Connect", "DeadlineExceeded", "ServiceUnavailable"))
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for in-flight requests.
+
+    Each fast success adds 1/limit (so about +1 per round of requests); a throttle halves the
+    limit and a response slower than the latency target shrinks it by `latency_backoff`. The
+    target is `latency_target` seconds, or with "auto" twice the recent median latency, so
+    the limit stops growing once more requests in flight only make each one slower.
+    None turns latency adaptation off.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, latency_target=AUTO, latency_backoff=0.9):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.latency_backoff = latency_backoff
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._loops = weakref.WeakKeyDictionary()  # event loop -> [condition, in-flight count]
+
+    @property
+    def in_flight(self):
+        return sum(state[1] for state in self._loops.values())
+
+    async def __aenter__(self):
+        # The limit is shared across calls; the waiting state belongs to the running loop.
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = self._loops[loop] = [asyncio.Condition(), 0]
+        async with state[0]:
+            await state[0].wait_for(lambda: state[1] < int(self.limit))
+            state[1] += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        state = self._loops[asyncio.get_running_loop()]
+        async with state[0]:
+            state[1] -= 1
+            state[0].notify_all()
+
+    @property
+    def target(self):
+        """Latency above which a response counts as slow, or None."""
+        if self.latency_target != AUTO:
+            return self.latency_target
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        return LATENCY_TARGET_FACTOR * statistics.median(self.latencies)
+
+    def on_success(self, latency):
+        target = self.target
+        self.latencies.append(latency)
+        if target and latency > target:
+            self.limit = max(self.minimum, self.limit * self.latency_backoff)
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self):
+        self.limit = max(self.minimum, self.limit / 2)
+
+
+class EmbeddingExecutor(Embeddings):
+    """
+    Sends document embeddings as token-bounded batches, several at a time.
+
+    Concurrency adapts to the provider (AIMD on 429s and latency), and a batch that fails
+    with a transient error (see is_retryable) is retried on its own with backoff, so one
+    throttled request does not restart the whole call. Query embeddings are retried the same way (up to QUERY_RETRIES times), so the
+    provider client's own retries should be off. Works with any LangChain embeddings
+    object, including local fakes.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_tokens=MAX_BATCH_TOKENS,
+                 max_batch_size=MAX_BATCH_SIZE, initial_concurrency=4, max_concurrency=16,
+                 latency_target=AUTO, max_retries=6, backoff_base=1.0, max_backoff=60.0):
+        self.embeddings = embeddings
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.limiter = AdaptiveLimiter(initial_concurrency, 1, max_concurrency, latency_target)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.batches = 0
+        self.retries = 0
+        self.throttles = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with telemetry.span("embedding.documents", texts=len(texts)):
+            return _run(self.aembed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        with telemetry.span("embedding.query"):
+            attempt = 0
+            while True:
+                try:
+                    return self.embeddings.embed_query(text)
+                except Exception as e:
+                    attempt += 1
+                    if attempt > QUERY_RETRIES or not is_retryable(e):
+                        raise
+                    time.sleep(self._retry_delay(e, attempt))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        attempt = 0
+        while True:
+            try:
+                return await self.embeddings.aembed_query(text)
+            except Exception as e:
+                attempt += 1
+                if attempt > QUERY_RETRIES or not is_retryable(e):
+                    raise
+                await asyncio.sleep(self._retry_delay(e, attempt))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = pack_batches(texts, self.max_batch_tokens, self.max_batch_size)
+        results = await asyncio.gather(*(self._embed_batch([texts[i] for i in batch]) for batch in batches))
+        vectors = [None] * len(texts)
+        for batch, batch_vectors in zip(batches, results):
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+        return vectors
+
+    async def _embed_batch(self, texts):
+        attempt = 0
+        while True:
+            async with self.limiter:
+                started = time.perf_counter()
+                try:
+                    vectors = await self._call(texts)
+                    self.limiter.on_success(time.perf_counter() - started)
+                    self.batches += 1
+                    if telemetry.enabled:
+                        telemetry.count("embedding_tokens", sum(count_tokens(t) for t in texts))
+                    return vectors
+                except Exception as e:
+                    error = e
+                    if is_rate_limited(e):
+                        self.limiter.on_throttle()
+
+            attempt += 1
+            if attempt > self.max_retries or not is_retryable(error):
+                raise error
+            await asyncio.sleep(self._retry_delay(error, attempt))
+
+    def _retry_delay(self, error, attempt):
+        """Retry-After if the provider sent one, otherwise jittered exponential backoff."""
+        self.retries += 1
+        telemetry.count("embedding_retries")
+        if is_rate_limited(error):
+            self.throttles += 1
+            telemetry.count("embedding_throttles")
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = min(self.max_backoff, self.backoff_base * (2 ** (attempt - 1))) * random.uniform(0.5, 1.0)
+        return delay
+
+    async def _call(self, texts):
+        if hasattr(self.embeddings, "aembed_documents"):
+            return await self.embeddings.aembed_documents(texts)
+        return await asyncio.to_thread(self.embeddings.embed_documents, texts)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "retries": self.retries,
+            "throttles": self.throttles,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "latency_target_s": round(self.limiter.target, 3) if self.limiter.target else None,
+        }
+
+
+def _run(coro):
+    """Runs a coroutine from sync code, even when called inside a running event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    result = {}
+
+    def target():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
@@ -0,0 +1,134 @@
+import os
+import json
+import hashlib
+
+INDEX_STATE_FILENAME = "index_state.json"
+
+
+def file_hash(file_path, block_size=1024 * 1024):
+    """SHA-256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(chunk):
+    """Content hash of a chunk: its text plus the page it came from."""
+    page = chunk.metadata.get("page", "")
+    return hashlib.sha256(f"{page}\n{chunk.page_content}".encode("utf-8")).hexdigest()
+
+
+def chunk_ids(source, chunks):
+    """
+    Stable vector store ids for a file's chunks.
+
+    The id depends only on the source path and chunk content, so an unchanged chunk keeps its
+    id across re-indexing and can be left alone. Repeated identical chunks get a counter suffix.
+    """
+    source_key = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        h = chunk_hash(chunk)
+        n = seen.get(h, 0)
+        seen[h] = n + 1
+        ids.append(f"{source_key}-{h[:32]}-{n}")
+    return ids
+
+
+class IndexState:
+    """
+    Side table recording what is in the vector store for each source file.
+
+    Stored next to the vector store files as JSON: {path: {"mtime", "size", "hash", "chunks": [ids]}}.
+    mtime/size let unchanged files skip hashing entirely; the hash catches touched-but-identical files.
+    The state also names the vector backend it describes; a state written for another backend
+    is treated as missing, so switching backends rebuilds the index.
+    """
+
+    def __init__(self, persist_directory, backend="chroma"):
+        self.path = os.path.join(persist_directory, INDEX_STATE_FILENAME)
+        self.backend = backend
+        self.files = {}
+        self.exists = False
+
+    @classmethod
+    def load(cls, persist_directory, backend="chroma"):
+        state = cls(persist_directory, backend)
+        if os.path.exists(state.path):
+            try:
+                with open(state.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("backend", "chroma") == backend:
+                    state.files = data.get("files", {})
+                    state.exists = True
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable index state {state.path}: {e}")
+        return state
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"backend": self.backend, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def fingerprint(self):
+        """Hash of every indexed file's content hash; changes whenever the corpus does."""
+        digest = hashlib.sha256()
+        for path in sorted(self.files):
+            digest.update(f"{path}\n{self.files[path]['hash']}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def is_unchanged(self, file_path):
+        """Cheap check using mtime and size only."""
+        entry = self.files.get(file_path)
+        if not entry:
+            return False
+        stat = os.stat(file_path)
+        return entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size
+
+    def record(self, file_path, content_hash, ids):
+        stat = os.stat(file_path)
+        self.files[file_path] = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": content_hash,
+            "chunks": ids,
+        }
+
+
+class IndexUpdate:
+    """What an incremental re-index did."""
+
+    def __init__(self):
+        self.files_indexed = 0
+        self.files_removed = 0
+        self.files_unchanged = 0
+        self.chunks_added = 0
+        self.chunks_deleted = 0
+        self.chunks_kept = 0
+        self.duplicate_files = 0  # copies of a stored document, recorded as aliases instead
+        self.duplicate_chunks = 0  # chunks not embedded because a near-identical one is stored
+        self.errors = []  # ParseError for each file that failed to load
+
+    def merge(self, other):
+        """Adds another update's counts (e.g. of another shard) to this one."""
+        for name, value in vars(other).items():
+            if name == "errors":
+                self.errors.extend(value)
+            else:
+                setattr(self, name, getattr(self, name) + value)
+        return self
+
+    @property
+    def has_changes(self):
+        return bool(self.chunks_added or self.chunks_deleted)
+
+    def __str__(self):
+        return (f"{self.files_indexed} files re-indexed, {self.files_removed} removed, "
+                f"{self.files_unchanged} unchanged; {self.chunks_added} chunks embedded, "
+                f"{self.chunks_deleted} deleted, {self.chunks_kept} kept, {len(self.errors)} errors; "
+                f"{self.duplicate_files} duplicate files and {self.duplicate_chunks} duplicate chunks skipped")
@@ -0,0 +1,168 @@
+import re
+import json
+import sqlite3
+import threading
+from typing import List
+
+from langchain_core.documents import Document
+
+KEYWORD_INDEX_FILENAME = "keyword_index.sqlite"
+RRF_K = 60
+# Identifier matches skip vector search only if, for the whole question, their weakest BM25
+# score is at least this many times the best score of any other chunk.
+FAST_PATH_MARGIN = 1.5
+
+_TOKEN_RE = re.compile(r"[\w][\w\-\.]*[\w]|[\w]")
+# POL2231, KB4012, x86-64: letters and digits mixed, at least 4 characters.
+_MIXED_ID_RE = re.compile(r"^(?=.{4,}$)(?=[\w\-\.]*[^\W\d_])(?=[\w\-\.]*\d)[\w\-\.]+$")
+# POL-2231, 2023-10-01, report_v2: an inner separator with a digit in the term.
+_SEPARATED_ID_RE = re.compile(r"^(?=.*\d)\w+([\-_\.]\w+)+$")
+_FILE_NAME_RE = re.compile(r"^[\w\-\.]+\.(pdf|docx?|xlsx?|pptx?|txt|md|csv|json|xml|html?)$")
+
+
+def query_terms(question: str) -> List[str]:
+    return _TOKEN_RE.findall(question.lower())
+
+
+def is_identifier(term: str) -> bool:
+    """
+    Policy numbers, SKUs and file names: letters mixed with digits (4+ characters), parts
+    joined by - _ . with a digit among them, or a name with a document extension. Plain
+    numbers ("2023", "5") and short codes ("q3") are ordinary terms.
+    """
+    return bool(_MIXED_ID_RE.match(term) or _SEPARATED_ID_RE.match(term) or _FILE_NAME_RE.match(term))
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def document_key(doc) -> tuple:
+    """Identifies a chunk across retrievers that return separate Document objects."""
+    return doc.metadata.get("source"), doc.metadata.get("page"), doc.page_content
+
+
+def reciprocal_rank_fusion(result_lists, k=RRF_K, limit=None) -> List:
+    """Merges ranked document lists: each document scores sum(1 / (k + rank)) over the lists."""
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ranked[:limit]]
+
+
+class KeywordIndex:
+    """
+    BM25 inverted index over the same chunks as the vector store (SQLite FTS5).
+
+    Chunks are added and deleted by the same ids Chroma uses, so the two stay in sync.
+    The tokenizer keeps `-` and `_` inside tokens so identifiers like POL-2231 match whole.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                rowid INTEGER PRIMARY KEY, id TEXT UNIQUE, source TEXT, content TEXT, metadata TEXT);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                source, content, content='chunks', content_rowid='rowid',
+                tokenize="unicode61 tokenchars '-_'");
+        """)
+        self._db.commit()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, ids: List[str], docs: List):
+        with self._lock:
+            self._delete(ids)
+            for chunk_id, doc in zip(ids, docs):
+                source = str(doc.metadata.get("source", ""))
+                cursor = self._db.execute(
+                    "INSERT INTO chunks (id, source, content, metadata) VALUES (?, ?, ?, ?)",
+                    (chunk_id, source, doc.page_content, json.dumps(doc.metadata, default=str)))
+                self._db.execute("INSERT INTO chunks_fts (rowid, source, content) VALUES (?, ?, ?)",
+                                 (cursor.lastrowid, source, doc.page_content))
+            self._db.commit()
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self._delete(ids)
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM chunks")
+            self._db.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('delete-all')")
+            self._db.commit()
+
+    def search(self, question: str, k=5) -> List:
+        """Top-k chunks by BM25 for any of the question's terms."""
+        return [doc for doc, _ in self.search_with_scores(question, k)]
+
+    def search_with_scores(self, question: str, k=5) -> List:
+        """Top-k (Document, BM25 score) pairs, higher is better."""
+        terms = query_terms(question)
+        if not terms:
+            return []
+        return self._match(" OR ".join(_quote(t) for t in terms), k, with_scores=True)
+
+    def search_identifiers(self, question: str, k=5, margin=FAST_PATH_MARGIN):
+        """
+        Chunks containing every identifier of the question (None if it has none), if they
+        stand out: at most k of them, and ahead of every other chunk in a BM25 search for the
+        whole question by `margin`. Otherwise an empty list.
+
+        Used as the keyword fast path: an exact policy number or file name that occurs in
+        only a few chunks is a strong enough match to skip the embedding round trip.
+        """
+        identifiers = [t for t in query_terms(question) if is_identifier(t)]
+        if not identifiers:
+            return None
+        hits = self._match(" AND ".join(_quote(t) for t in identifiers), k + 1)
+        if not hits or len(hits) > k:
+            return []
+        ranked = self.search_with_scores(question, len(hits) + 1)
+        keys = {document_key(doc) for doc in hits}
+        hit_scores = [score for doc, score in ranked if document_key(doc) in keys]
+        other_scores = [score for doc, score in ranked if document_key(doc) not in keys]
+        if len(hit_scores) < len(hits):
+            return []  # another chunk outranks an identifier match
+        if other_scores and min(hit_scores) < margin * max(other_scores):
+            return []
+        return hits
+
+    def _match(self, fts_query, k, with_scores=False):
+        with self._lock:
+            try:
+                rows = self._db.execute("""
+                    SELECT chunks.content, chunks.metadata, bm25(chunks_fts, 2.0, 1.0) FROM chunks_fts
+                    JOIN chunks ON chunks.rowid = chunks_fts.rowid
+                    WHERE chunks_fts MATCH ?
+                    ORDER BY bm25(chunks_fts, 2.0, 1.0) LIMIT ?
+                """, (fts_query, k)).fetchall()
+            except sqlite3.OperationalError:
+                # Malformed FTS query; treat as no lexical match.
+                return []
+        docs = [Document(page_content=content, metadata=json.loads(metadata)) for content, metadata, _ in rows]
+        if with_scores:
+            # SQLite's bm25() is lower-is-better.
+            return [(doc, -row[2]) for doc, row in zip(docs, rows)]
+        return docs
+
+    def _delete(self, ids):
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._db.execute(
+                f"SELECT rowid, source, content FROM chunks WHERE id IN ({placeholders})", batch).fetchall()
+            for rowid, source, content in rows:
+                self._db.execute(
+                    "INSERT INTO chunks_fts (chunks_fts, rowid, source, content) VALUES ('delete', ?, ?, ?)",
+                    (rowid, source, content))
+            self._db.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
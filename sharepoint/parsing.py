@@ -0,0 +1,188 @@
+import os
+import time
+import importlib
+import signal
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional
+
+# Loader class names in langchain_community.document_loaders, imported on first use so
+# startup does not pay for langchain_community.
+LOADERS = {
+    ".pdf": "PyPDFLoader",
+    ".docx": "Docx2txtLoader",
+    ".txt": "TextLoader",
+    ".md": "TextLoader"
+}
+PARSE_TIMEOUT = 120  # seconds per file
+
+
+def loader_class(ext):
+    return getattr(importlib.import_module("langchain_community.document_loaders"), LOADERS[ext])
+
+
+class ParseError:
+    """One file that could not be parsed, for the structured error report."""
+
+    def __init__(self, path, kind, message, seconds=0.0):
+        self.path = path
+        self.kind = kind  # "timeout" or "error"
+        self.message = message
+        self.seconds = seconds
+
+    def to_dict(self):
+        return {"path": self.path, "kind": self.kind, "message": self.message,
+                "seconds": round(self.seconds, 3)}
+
+    def __str__(self):
+        return f"{self.path}: {self.kind} ({self.message})"
+
+
+class ParseResult:
+    def __init__(self, path, chunks=None, error=None, seconds=0.0):
+        self.path = path
+        self.chunks = chunks
+        self.error = error
+        self.seconds = seconds
+
+
+class _ParseTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise _ParseTimeout()
+
+
+def parse_file(file_path, text_splitter=None, timeout=None) -> ParseResult:
+    """
+    Loads and (optionally) splits one file. Runs in a worker process, so it must stay
+    a module-level function. On POSIX the timeout is enforced with SIGALRM so a stuck
+    parser frees its worker instead of blocking it for the rest of the run.
+    """
+    started = time.perf_counter()
+    use_alarm = (timeout and hasattr(signal, "SIGALRM")
+                 and threading.current_thread() is threading.main_thread())
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        ext = os.path.splitext(file_path)[1].lower()
+        docs = loader_class(ext)(file_path).load()
+        chunks = text_splitter.split_documents(docs) if text_splitter else docs
+        return ParseResult(file_path, chunks=chunks, seconds=time.perf_counter() - started)
+    except _ParseTimeout:
+        seconds = time.perf_counter() - started
+        return ParseResult(file_path, error=ParseError(file_path, "timeout", f"exceeded {timeout}s", seconds),
+                           seconds=seconds)
+    except Exception as e:
+        seconds = time.perf_counter() - started
+        return ParseResult(file_path, error=ParseError(file_path, "error", f"{type(e).__name__}: {e}", seconds),
+                           seconds=seconds)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def parse_files(paths: List[str], text_splitter=None, workers: Optional[int] = None,
+                timeout=PARSE_TIMEOUT) -> Iterator[ParseResult]:
+    """
+    Parses files across a process pool, yielding results in input order.
+
+    At most `workers * 4` files are in flight so results can be consumed as a stream.
+    With one worker (or one file) everything runs in-process, unless the timeout could
+    not be enforced there (off the main thread, e.g. in Streamlit or a thread pool, or
+    without SIGALRM). Where SIGALRM is not available (Windows) the parent gives up on a
+    file after waiting `2 * timeout`; its worker is killed when the pool shuts down.
+
+    When a worker dies (e.g. a parser crashes the interpreter) every file in flight fails
+    with the pool, so each of them is parsed again in a pool of its own and only the
+    file that crashes again is reported as crashed.
+    """
+    workers = workers or os.cpu_count() or 1
+    alarm_available = (not timeout or (hasattr(signal, "SIGALRM")
+                                       and threading.current_thread() is threading.main_thread()))
+    if (workers <= 1 or len(paths) <= 1) and alarm_available:
+        for path in paths:
+            yield parse_file(path, text_splitter, timeout)
+        return
+    workers = max(1, min(workers, len(paths)))
+
+    pool = {"executor": ProcessPoolExecutor(max_workers=workers), "generation": 0}
+    stalled = False
+
+    def submit(path):
+        if pool["executor"] is None:
+            pool["executor"] = ProcessPoolExecutor(max_workers=workers)
+        try:
+            return pool["generation"], pool["executor"].submit(parse_file, path, text_splitter, timeout)
+        except BrokenProcessPool:
+            replace_pool()
+            return submit(path)
+
+    def replace_pool():
+        pool["executor"].shutdown(wait=False, cancel_futures=True)
+        pool["executor"] = None
+        pool["generation"] += 1
+
+    try:
+        pending = deque()  # [path, generation, future or None (parse in a pool of its own)]
+        queue = iter(paths)
+        for path in queue:
+            pending.append([path, *submit(path)])
+            if len(pending) >= workers * 4:
+                break
+
+        while pending:
+            path, generation, future = pending.popleft()
+            if future is None:
+                yield _parse_alone(path, text_splitter, timeout)
+            else:
+                try:
+                    yield future.result(timeout=timeout * 2 if timeout else None)
+                except FutureTimeoutError:
+                    stalled = True
+                    yield ParseResult(path, error=ParseError(path, "timeout", f"exceeded {timeout}s"))
+                except BrokenProcessPool:
+                    if generation == pool["generation"]:
+                        replace_pool()
+                    # Any of the files in flight may be the one that crashed it.
+                    pending.appendleft([path, generation, None])
+                    for entry in pending:
+                        if (entry[1] == generation and entry[2] is not None
+                                and not (entry[2].done() and entry[2].exception() is None)):
+                            entry[2] = None
+                    continue
+            next_path = next(queue, None)
+            if next_path is not None:
+                pending.append([next_path, *submit(next_path)])
+    finally:
+        if pool["executor"] is not None:
+            _shutdown(pool["executor"], stalled)
+
+
+def _parse_alone(path, text_splitter, timeout) -> ParseResult:
+    """Parses one file in a fresh single-worker pool, so a crash can only be its own."""
+    executor = ProcessPoolExecutor(max_workers=1)
+    stalled = False
+    try:
+        future = executor.submit(parse_file, path, text_splitter, timeout)
+        return future.result(timeout=timeout * 2 if timeout else None)
+    except FutureTimeoutError:
+        stalled = True
+        return ParseResult(path, error=ParseError(path, "timeout", f"exceeded {timeout}s"))
+    except BrokenProcessPool as e:
+        return ParseResult(path, error=ParseError(path, "error", f"worker crashed: {e}"))
+    finally:
+        _shutdown(executor, stalled)
+
+
+def _shutdown(executor, stalled):
+    if stalled:
+        # Stuck workers would otherwise block shutdown forever.
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.kill()
+    executor.shutdown(wait=not stalled, cancel_futures=True)
@@ -0,0 +1,346 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+
+from agent import SharePointAgent, QueryTimings, DATA_DIRECTORY, PERSIST_DIRECTORY, RETRIEVAL_K
+from embedding_cache import EMBEDDING_CACHE_DIR
+from index_state import IndexUpdate, INDEX_STATE_FILENAME
+from keyword_index import reciprocal_rank_fusion
+from telemetry import telemetry
+
+SHARDS_DIRECTORY = "./shards"
+SHARD_REGISTRY_FILENAME = "shards.json"
+# The single data/index directory used before sharding, adopted as one shard.
+LEGACY_SHARD = "default"
+# Shards searched at once per question.
+QUERY_WORKERS = 8
+
+
+def shard_key(site, library) -> str:
+    """Directory-safe key for a site/library pair, e.g. "contoso-hr--documents"."""
+    def slug(text):
+        return re.sub(r"[^a-z0-9]+", "-", (text or "").lower()).strip("-") or "x"
+    return f"{slug(site)}--{slug(library)}"
+
+
+class Shard:
+    """One site/library pair with its own download directory and index."""
+
+    def __init__(self, key, site, library, data_dir, persist_directory):
+        self.key = key
+        self.site = site
+        self.library = library
+        self.data_dir = os.path.normpath(data_dir)
+        self.persist_directory = os.path.normpath(persist_directory)
+
+    @property
+    def label(self):
+        return f"{self.site} / {self.library}" if self.site else self.key
+
+    def contains(self, path) -> bool:
+        return os.path.abspath(path).startswith(os.path.abspath(self.data_dir) + os.sep)
+
+    def local_path(self, path) -> str:
+        """`path` spelled the way this shard's index stores it (under data_dir as registered)."""
+        return os.path.join(self.data_dir, os.path.relpath(os.path.abspath(path), os.path.abspath(self.data_dir)))
+
+    def to_dict(self):
+        return {"site": self.site, "library": self.library, "data_dir": self.data_dir,
+                "persist_directory": self.persist_directory}
+
+
+class ShardRegistry:
+    """
+    The shards to index and search, stored as JSON under the shards directory.
+
+    A new site/library gets `<root>/<key>/data` for its files and `<root>/<key>/index` for its
+    vector, keyword and near-duplicate indexes, so each can be synced, rebuilt or dropped on
+    its own. Several processes may share the file; `load` picks up shards added elsewhere.
+    """
+
+    def __init__(self, root=SHARDS_DIRECTORY):
+        self.root = root
+        self.path = os.path.join(root, SHARD_REGISTRY_FILENAME)
+        self._lock = threading.Lock()
+        self.shards = {}
+        self.load()
+
+    def load(self):
+        shards = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for key, entry in json.load(f).get("shards", {}).items():
+                        shards[key] = Shard(key, entry.get("site"), entry.get("library"),
+                                            entry["data_dir"], entry["persist_directory"])
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring unreadable shard registry {self.path}: {e}")
+        with self._lock:
+            self.shards = shards
+        return self
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            data = {"shards": {key: shard.to_dict() for key, shard in self.shards.items()}}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def add(self, site, library) -> Shard:
+        """Registers a site/library (a no-op if it already is) and returns its shard."""
+        key = shard_key(site, library)
+        with self._lock:
+            shard = self.shards.get(key)
+            if shard is None:
+                base = os.path.join(self.root, key)
+                shard = self.shards[key] = Shard(key, site, library, os.path.join(base, "data"),
+                                                 os.path.join(base, "index"))
+        self.save()
+        return shard
+
+    def adopt_legacy(self, data_dir=DATA_DIRECTORY, persist_directory=PERSIST_DIRECTORY):
+        """Registers the pre-sharding data and index directories as the "default" shard, if they exist."""
+        if LEGACY_SHARD in self.shards or not os.path.isdir(data_dir):
+            return None
+        with self._lock:
+            shard = self.shards[LEGACY_SHARD] = Shard(LEGACY_SHARD, None, None, data_dir, persist_directory)
+        self.save()
+        return shard
+
+    def remove(self, key, delete_files=False):
+        with self._lock:
+            shard = self.shards.pop(key, None)
+        self.save()
+        if shard is not None and delete_files:
+            shutil.rmtree(shard.data_dir, ignore_errors=True)
+            shutil.rmtree(shard.persist_directory, ignore_errors=True)
+        return shard
+
+    def get(self, key) -> Optional[Shard]:
+        return self.shards.get(key)
+
+    def keys(self) -> List[str]:
+        return sorted(self.shards)
+
+    def __iter__(self):
+        return iter([self.shards[key] for key in self.keys()])
+
+    def __len__(self):
+        return len(self.shards)
+
+
+def sync_shards(fetcher, registry, keys=None) -> Iterator:
+    """Syncs each registered SharePoint shard (all, or `keys`), yielding (shard, SyncResult or None)."""
+    for shard in registry:
+        if shard.site and (keys is None or shard.key in keys):
+            yield shard, fetcher.sync_library(shard.site, shard.library, shard.data_dir)
+
+
+class ShardedAgent(SharePointAgent):
+    """
+    A SharePointAgent over many site/library shards, each a SharePointAgent with its own index.
+
+    Shards share this agent's provider clients, embedding executor and embedding cache. They
+    are opened on first use, updated and rebuilt independently, and a question is only sent to
+    the shards it is scoped to: the query is embedded once, the shards are searched
+    concurrently, vector hits are merged by relevance and keyword hits by BM25 score, and the
+    two rankings are fused as in `SharePointAgent.retrieve`. The answer cache sits at the root
+    and is keyed by the scoped shards' corpus versions; when a shard's corpus changes, the
+    answers of the scopes including it are discarded.
+    """
+
+    def __init__(self, registry=None, use_google=False, query_workers=QUERY_WORKERS,
+                 embedding_cache_dir=EMBEDDING_CACHE_DIR, use_answer_cache=True, embeddings=None, llm=None,
+                 llm_routing=None, **shard_options):
+        self.registry = registry if registry is not None else ShardRegistry()
+        self.registry.adopt_legacy()
+        super().__init__(data_dir=self.registry.root, persist_directory=self.registry.root, use_google=use_google,
+                         embedding_cache_dir=embedding_cache_dir, use_answer_cache=use_answer_cache,
+                         embeddings=embeddings, llm=llm, deduplicate=False, llm_routing=llm_routing)
+        self.shard_options = shard_options
+        self.query_workers = query_workers
+        self._agents = {}
+        self._agents_lock = threading.Lock()
+        self._pool = None
+        self._scope_versions = {}  # answer cache version -> the shard keys it covers
+
+    def shard_agent(self, key) -> SharePointAgent:
+        """The agent for one shard, created (but not opened) on first use."""
+        with self._agents_lock:
+            agent = self._agents.get(key)
+            if agent is None:
+                shard = self.registry.get(key)
+                if shard is None:
+                    raise KeyError(f"Unknown shard {key!r}")
+                agent = self._agents[key] = SharePointAgent(
+                    data_dir=shard.data_dir, persist_directory=shard.persist_directory, use_google=self.use_google,
+                    use_answer_cache=False, shared_from=self, **self.shard_options)
+            return agent
+
+    def _open(self, keys) -> List[SharePointAgent]:
+        agents = []
+        for key in keys:
+            agent = self.shard_agent(key)
+            if agent.vectorstore is None and agent.retriever is None and os.path.isdir(agent.data_dir):
+                with telemetry.span("shards.open", shard=key):
+                    agent.create_vector_store()
+            agents.append(agent)
+        return agents
+
+    def _scope(self, shards=None) -> List[str]:
+        if shards is None:
+            return self.registry.keys()
+        unknown = [key for key in shards if self.registry.get(key) is None]
+        if unknown:
+            raise KeyError(f"Unknown shards: {', '.join(unknown)}")
+        return sorted(shards)
+
+    def create_vector_store(self, use_cloud_vector_search=False):
+        """Opens every registered shard, bringing each index up to date."""
+        self.registry.load()
+        agents = self._open(self.registry.keys())
+        self.retriever = self if any(agent.retriever for agent in agents) else None
+
+    def update_index(self, paths: Optional[List[str]] = None, shards=None) -> IndexUpdate:
+        """Updates the shards the paths fall in (or every shard / `shards`), returning the combined update."""
+        combined = IndexUpdate()
+        for update in self.refresh_index(paths, shards):
+            combined.merge(update)
+        return combined
+
+    def refresh_index(self, paths: Optional[List[str]] = None, shards=None) -> List[IndexUpdate]:
+        """
+        Applies changed paths to the shards that contain them; paths=None rescans every shard
+        (or only `shards`). Shards not opened yet are opened, which indexes them fully.
+        """
+        self.registry.load()
+        keys = self._scope(shards)
+        updates = []
+        for key in keys:
+            shard = self.registry.get(key)
+            shard_paths = None if paths is None else [shard.local_path(p) for p in paths if shard.contains(p)]
+            if shard_paths == []:
+                continue
+            with telemetry.span("shards.update", shard=key):
+                updates.extend(self._refresh_shard(key, shard_paths))
+        with self._agents_lock:
+            self.retriever = self if any(agent.retriever for agent in self._agents.values()) else None
+        return updates
+
+    def rebuild(self, key) -> IndexUpdate:
+        """Builds one shard's index again from its files; other shards are untouched."""
+        shard = self.registry.get(key)
+        if shard is None:
+            raise KeyError(f"Unknown shard {key!r}")
+        # Without its index state the shard clears its vector, keyword and duplicate indexes
+        # and embeds every file again (the stores stay open, so Chroma's client stays valid).
+        state_path = os.path.join(shard.persist_directory, INDEX_STATE_FILENAME)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        with telemetry.span("shards.rebuild", shard=key):
+            updates = self._refresh_shard(key)
+        with self._agents_lock:
+            self.retriever = self if any(agent.retriever for agent in self._agents.values()) else None
+        return updates[0] if updates else IndexUpdate()
+
+    def _refresh_shard(self, key, paths=None) -> List[IndexUpdate]:
+        agent = self.shard_agent(key)
+        before = agent.cache_version
+        updates = agent.refresh_index(paths)
+        if self.answer_cache and agent.cache_version != before:
+            with self._agents_lock:
+                stale = [version for version, keys in self._scope_versions.items() if key in keys]
+                for version in stale:
+                    del self._scope_versions[version]
+            for version in stale:
+                self.answer_cache.discard(version)
+        return updates
+
+    def keyword_fast_path(self, question: str, shards=None) -> list:
+        """Identifier matches across the scoped shards, if there are at most RETRIEVAL_K in total."""
+        agents = [a for a in self._open(self._scope(shards)) if a.keyword_index is not None]
+        hits = []
+        for found in self._map(lambda agent: agent.keyword_index.search_identifiers(question, RETRIEVAL_K), agents):
+            hits.extend(found or [])
+            if len(hits) > RETRIEVAL_K:
+                return []
+        return hits
+
+    def retrieve(self, question: str, embedding=None, shards=None) -> list:
+        """Searches the scoped shards concurrently and merges their hits by score."""
+        keys = self._scope(shards)
+        scoped = [(key, agent) for key, agent in zip(keys, self._open(keys)) if agent.retriever]
+        if not scoped:
+            return []
+        if embedding is None and any(agent.vectorstore is not None for _, agent in scoped):
+            embedding = self.embeddings.embed_query(question)
+
+        def search(item):
+            key, agent = item
+            with telemetry.span("shards.search", shard=key):
+                vector_hits, keyword_hits = agent.scored_search(question, embedding, RETRIEVAL_K)
+                if agent.dedup_index is not None:
+                    agent.dedup_index.annotate([doc for doc, _ in vector_hits + keyword_hits])
+                return vector_hits, keyword_hits
+
+        vector_hits, keyword_hits = [], []
+        for shard_vector, shard_keyword in self._map(search, scoped):
+            vector_hits.extend(shard_vector)
+            keyword_hits.extend(shard_keyword)
+        vector_ranked = [doc for doc, _ in sorted(vector_hits, key=lambda hit: hit[1], reverse=True)[:RETRIEVAL_K]]
+        keyword_ranked = [doc for doc, _ in sorted(keyword_hits, key=lambda hit: hit[1], reverse=True)[:RETRIEVAL_K]]
+        return reciprocal_rank_fusion([vector_ranked, keyword_ranked], limit=RETRIEVAL_K)
+
+    def invoke(self, question: str):
+        """Retriever interface over every shard."""
+        return self.retrieve(question)
+
+    def _map(self, fn, items):
+        """fn over the items on the query pool (inline for one item), in order."""
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.query_workers, thread_name_prefix="shard-query")
+        return list(self._pool.map(fn, items))
+
+    def stream_query(self, question: str, timings: Optional[QueryTimings] = None, shards=None) -> Iterator[str]:
+        """
+        Queries the scoped shards (all when `shards` is None), yielding the answer as it is generated.
+        Only the scoped shards are opened and searched.
+        """
+        timings = timings if timings is not None else QueryTimings()
+        started = time.perf_counter()
+        keys = self._scope(shards)
+        if not keys:
+            yield "No shards selected. Pick at least one site/library to search."
+            return
+        agents = self._open(keys)
+        if not any(agent.retriever for agent in agents):
+            yield "Agent is empty. Please load documents or configure connection."
+            return
+        yield from self._answer(question, timings, started, self.scope_version(keys),
+                                lambda q: self.keyword_fast_path(q, keys),
+                                lambda q, embedding: self.retrieve(q, embedding, keys),
+                                can_embed=any(agent.vectorstore is not None for agent in agents))
+
+    def scope_version(self, keys) -> str:
+        """Answer cache version of a set of shards: changes when any of their corpora does."""
+        digest = hashlib.sha256()
+        for key in keys:
+            digest.update(f"{key}\n{self.shard_agent(key).cache_version}\n".encode("utf-8"))
+        version = digest.hexdigest()
+        with self._agents_lock:
+            self._scope_versions[version] = tuple(keys)
+        return version
+
+    @property
+    def cache_version(self) -> str:
+        return self.scope_version(self.registry.keys())
@@ -1,17 +1,24 @@
 import os
 from O365 import Account, FileSystemTokenBackend
-from typing import List, Generator
+from typing import List, Generator, Optional
 from pathlib import Path
+from requests.exceptions import HTTPError
 from dotenv import load_dotenv
+from sync_manifest import SyncManifest, SyncResult
+from downloader import DownloadJob, DownloadStats, ParallelDownloader
+from telemetry import telemetry
 
 load_dotenv()
 
+SUPPORTED_EXTENSIONS = ['.pdf', '.docx', '.txt', '.md']
+
 class SharePointFetcher:
-    def __init__(self, client_id, client_secret, tenant_id=None):
+    def __init__(self, client_id, client_secret, tenant_id=None, account=None):
         self.credentials = (client_id, client_secret)
         # Using FileSystemTokenBackend to store tokens locally
         self.token_backend = FileSystemTokenBackend(token_path='.', token_filename='o365_token.txt')
-        self.account = Account(self.credentials, token_backend=self.token_backend, tenant_id=tenant_id)
+        # `account` replaces the O365 Account, e.g. with the fake in benchmarks/fakes.py.
+        self.account = account or Account(self.credentials, token_backend=self.token_backend, tenant_id=tenant_id)
 
     def authenticate(self):
         """Authenticates the user. Note: This may require manual intervention first run."""
@@ -40,20 +47,23 @@ class SharePointFetcher:
         site = sharepoint.get_site(site_name_or_url) # Might need ID or URL
         return site
 
-    def list_files(self, folder, supported_extensions=['.pdf', '.docx', '.txt', '.md']) -> Generator:
+    def list_files(self, folder, supported_extensions=SUPPORTED_EXTENSIONS) -> Generator:
         """Recursively lists files in a folder."""
+        for _, item in self.walk_files(folder, supported_extensions):
+            yield item
+
+    def walk_files(self, folder, supported_extensions=SUPPORTED_EXTENSIONS, prefix="") -> Generator:
+        """Recursively lists (relative_path, file) pairs, keeping the folder hierarchy."""
         for item in folder.get_items():
+            path = f"{prefix}/{item.name}" if prefix else item.name
             if item.is_folder:
-                yield from self.list_files(item, supported_extensions)
+                yield from self.walk_files(item, supported_extensions, path)
             elif item.is_file:
                  if any(item.name.lower().endswith(ext) for ext in supported_extensions):
-                    yield item
-
-    def download_files(self, site_name: str, library_name: str, target_dir: str):
-        """Downloads files from a specific SharePoint library to a local directory."""
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
+                    yield path, item
 
+    def get_library(self, site_name: str, library_name: str):
+        """Finds a document library (a Graph 'drive') by site and library name."""
         sharepoint = self.account.sharepoint()
         # Note: Finding a site by name can be ambiguous. 
         # Using search is often better, or hardcoding the Site ID in a real app.
@@ -61,7 +71,7 @@ class SharePointFetcher:
         site = sharepoint.search_site(site_name)
         if not site:
             print(f"Site '{site_name}' not found.")
-            return
+            return None
 
         # Assuming the first result is the correct one if search returns a list, 
         # or it returns a single Site object.
@@ -69,7 +79,7 @@ class SharePointFetcher:
         if isinstance(site, list):
             if not site:
                 print(f"No site found matching '{site_name}'")
-                return
+                return None
             site = site[0] 
         
         print(f"Accessing Site: {site.name} ({site.web_url})")
@@ -86,15 +96,240 @@ class SharePointFetcher:
         if not target_library:
             print(f"Library '{library_name}' not found in site '{site.name}'.")
             print("Available libraries:", [d.name for d in drives])
-            return
+            return None
 
         print(f"Found Library: {target_library.name}")
-        root_folder = target_library.get_root_folder()
+        return target_library
+
+    def download_files(self, site_name: str, library_name: str, target_dir: str,
+                       max_workers=8, per_host_limit=4) -> Optional[DownloadStats]:
+        """Downloads files from a specific SharePoint library to a local directory."""
+        target_library = self.get_library(site_name, library_name)
+        if not target_library:
+            return None
+
+        return self.download_library(target_library, target_dir, max_workers, per_host_limit)
+
+    def download_library(self, drive, target_dir: str, max_workers=8, per_host_limit=4,
+                         session=None) -> DownloadStats:
+        """
+        Downloads every supported file of a drive in parallel, mirroring its folders under target_dir.
+
+        `drive` only needs `object_id` and `get_root_folder()`, and `session` defaults to the
+        authenticated O365 connection, so both can be replaced by local fakes.
+        """
+        os.makedirs(target_dir, exist_ok=True)
+        root_folder = drive.get_root_folder()
+
+        jobs = []
+        for rel_path, file_item in self.walk_files(root_folder):
+            local_path = os.path.join(target_dir, *rel_path.split("/"))
+            # O365 drive items do not keep the cTag; the modification time identifies the version.
+            modified = getattr(file_item, "modified", None)
+            jobs.append(DownloadJob(self._content_url(drive.object_id, file_item.object_id),
+                                    local_path, size=file_item.size, key=file_item.object_id,
+                                    version=modified.isoformat() if modified else None))
+
+        print(f"Downloading {len(jobs)} files with {max_workers} workers...")
+        downloader = ParallelDownloader(session or self.account.con, max_workers=max_workers,
+                                        per_host_limit=per_host_limit)
+        stats = downloader.download(jobs)
+        print(stats)
+        return stats
+
+    def sync_library(self, site_name: str, library_name: str, target_dir: str,
+                     supported_extensions=SUPPORTED_EXTENSIONS, max_workers=8,
+                     per_host_limit=4) -> Optional[SyncResult]:
+        """
+        Incrementally mirrors a library into target_dir using Graph delta queries.
+
+        The first run enumerates the whole library; later runs only download added or
+        changed files (by cTag), move renamed ones and delete local copies of removed ones.
+        The folder hierarchy is kept on disk so same-named files do not collide.
+        Returns a SyncResult listing the local paths that changed.
+        """
+        with telemetry.span("sharepoint.sync", library=library_name) as span:
+            with telemetry.span("sharepoint.get_library"):
+                target_library = self.get_library(site_name, library_name)
+            if not target_library:
+                return None
+            result = self._sync_drive(target_library, target_dir, supported_extensions, max_workers, per_host_limit)
+            span.set(added=len(result.added), modified=len(result.modified), removed=len(result.removed),
+                     full_resync=result.full_resync)
+            return result
+
+    def _sync_drive(self, target_library, target_dir, supported_extensions, max_workers, per_host_limit):
+        """Pages the delta feed (resyncing fully on 410), stages renames, downloads changes and returns a SyncResult."""
+        drive_id = target_library.object_id
+        manifest = SyncManifest.load(target_dir, drive_id)
+        previous = {item_id: dict(entry) for item_id, entry in manifest.files.items()}
+        result = SyncResult()
+
+        if manifest.root_id is None:
+            manifest.root_id = target_library.get_root_folder().object_id
+
+        try:
+            with telemetry.span("sharepoint.delta"):
+                delta_link = self._apply_delta(drive_id, manifest, supported_extensions)
+        except HTTPError as e:
+            # 410 Gone: the delta token expired, Graph asks for a full resync.
+            if e.response is None or e.response.status_code != 410:
+                raise
+            print("Delta token expired, running a full resync.")
+            result.full_resync = True
+            manifest.reset()
+            manifest.folders = {}
+            manifest.files = {}
+            delta_link = self._apply_delta(drive_id, manifest, supported_extensions)
+
+        # Work out what changed against the previous manifest.
+        downloads = []
+        jobs = []
+        renames = []
+        paths_in_use = set()
+        for item_id, old in previous.items():
+            entry = manifest.files.get(item_id)
+            if entry is None or manifest.relative_path(entry) is None:
+                manifest.files.pop(item_id, None)
+                self._remove_local(manifest, old["path"])
+                result.removed.append(manifest.local_path(old["path"]))
+
+        for item_id, entry in list(manifest.files.items()):
+            rel_path = manifest.relative_path(entry)
+            if rel_path is None:
+                # Parent folder was deleted and it never existed locally.
+                del manifest.files[item_id]
+                continue
+            old = previous.get(item_id)
+            local_path = manifest.local_path(rel_path)
+            paths_in_use.add(rel_path)
+
+            if old is None:
+                changes = result.added
+            elif (old.get("ctag") != entry["ctag"] or old.get("pending")
+                    or not os.path.exists(manifest.local_path(old["path"]))):
+                changes = result.modified
+            elif old["path"] != rel_path:
+                # Renamed or moved without content changes: no need to download again.
+                renames.append((item_id, old["path"], rel_path))
+                continue
+            else:
+                entry["path"] = rel_path
+                result.unchanged += 1
+                continue
+
+            downloads.append((item_id, old, rel_path, changes))
+            jobs.append(DownloadJob(self._content_url(drive_id, item_id), local_path,
+                                    size=entry["size"], key=item_id, version=entry["ctag"]))
+
+        self._apply_renames(manifest, renames, result)
+
+        if jobs:
+            downloader = ParallelDownloader(self.account.con, max_workers=max_workers,
+                                            per_host_limit=per_host_limit)
+            stats = downloader.download(jobs)
+            print(stats)
+            result.download_stats = stats
+            failed = {job.key for job in stats.failed}
+
+            for item_id, old, rel_path, changes in downloads:
+                entry = manifest.files[item_id]
+                if item_id in failed:
+                    # Retried on the next run even if the delta feed does not report it again.
+                    entry["pending"] = True
+                    entry["path"] = old["path"] if old else rel_path
+                    continue
+                entry.pop("pending", None)
+                if old and old["path"] != rel_path and old["path"] not in paths_in_use:
+                    # (Unless another file was renamed into its place.)
+                    self._remove_local(manifest, old["path"])
+                entry["path"] = rel_path
+                changes.append(manifest.local_path(rel_path))
+
+        manifest.delta_link = delta_link
+        manifest.save()
+        print(f"Sync complete: {result}")
+        return result
+
+    def _apply_renames(self, manifest, renames, result):
+        """
+        Moves renamed files to their new paths. Every file is first moved aside under a
+        temporary name, so files that swap names or take over each other's paths in one
+        delta do not overwrite one another.
+        """
+        staged = []
+        for item_id, old_path, rel_path in renames:
+            staging = f"{manifest.local_path(old_path)}.{item_id}.renaming"
+            os.replace(manifest.local_path(old_path), staging)
+            staged.append((item_id, old_path, rel_path, staging))
+        for item_id, old_path, rel_path, staging in staged:
+            local_path = manifest.local_path(rel_path)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            os.replace(staging, local_path)
+            manifest.files[item_id]["path"] = rel_path
+            result.removed.append(manifest.local_path(old_path))
+            result.added.append(local_path)
+        for _, old_path, _, _ in staged:
+            self._remove_local(manifest, None, prune_from=old_path)
+
+    def _apply_delta(self, drive_id, manifest, supported_extensions) -> str:
+        """Pages through the drive delta feed and applies it to the manifest. Returns the new delta link."""
+        url = manifest.delta_link or f"{self.account.protocol.service_url}drives/{drive_id}/root/delta"
+        while url:
+            response = self.account.con.get(url)
+            telemetry.count("graph_requests", source="delta")
+            data = response.json()
+
+            for item in data.get("value", []):
+                item_id = item["id"]
+                if "root" in item:
+                    manifest.root_id = item_id
+                    continue
+                if "deleted" in item:
+                    manifest.folders.pop(item_id, None)
+                    manifest.files.pop(item_id, None)
+                    continue
+
+                parent_id = item.get("parentReference", {}).get("id")
+                name = item.get("name", "")
+                if "folder" in item:
+                    manifest.folders[item_id] = {"name": name, "parent": parent_id}
+                elif "file" in item:
+                    if not any(name.lower().endswith(ext) for ext in supported_extensions):
+                        # Renamed to an unsupported type counts as removed.
+                        manifest.files.pop(item_id, None)
+                        continue
+                    old = manifest.files.get(item_id, {})
+                    manifest.files[item_id] = {
+                        "name": name,
+                        "parent": parent_id,
+                        "etag": item.get("eTag"),
+                        "ctag": item.get("cTag"),
+                        "size": item.get("size"),
+                        "path": old.get("path"),
+                        "pending": old.get("pending", False),
+                    }
+
+            if "@odata.deltaLink" in data:
+                return data["@odata.deltaLink"]
+            url = data.get("@odata.nextLink")
+        return manifest.delta_link
+
+    def _content_url(self, drive_id, item_id):
+        return f"{self.account.protocol.service_url}drives/{drive_id}/items/{item_id}/content"
 
-        for file_item in self.list_files(root_folder):
-            local_path = os.path.join(target_dir, file_item.name)
-            print(f"Downloading: {file_item.name} -> {local_path}")
-            file_item.download(to_path=os.path.dirname(local_path))
+    def _remove_local(self, manifest, rel_path, prune_from=None):
+        """Deletes a synced file and prunes the empty folders it leaves behind."""
+        if rel_path:
+            local_path = manifest.local_path(rel_path)
+            if os.path.exists(local_path):
+                print(f"Removing: {local_path}")
+                os.remove(local_path)
+        parent = os.path.dirname(manifest.local_path(rel_path or prune_from))
+        target_dir = os.path.abspath(manifest.target_dir)
+        while os.path.abspath(parent).startswith(target_dir + os.sep) and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
             
 if __name__ == "__main__":
     # Example usage
@@ -105,6 +340,7 @@ if __name__ == "__main__":
         fetcher = SharePointFetcher(CLIENT_ID, CLIENT_SECRET)
         fetcher.authenticate()
         # Param 1: Site Name (keyword), Param 2: Library Name (usually 'Documents')
-        fetcher.download_files("MyTargetSite", "Documents", "data/sharepoint_docs")
+        # Only added/changed files are downloaded after the first run.
+        fetcher.sync_library("MyTargetSite", "Documents", "data/sharepoint_docs")
     else:
         print("Please set credentials in .env")
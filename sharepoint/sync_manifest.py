@@ -0,0 +1,123 @@
+import os
+import json
+
+MANIFEST_FILENAME = ".sync_manifest.json"
+
+
+class SyncManifest:
+    """
+    Persisted state for incremental SharePoint sync.
+
+    Tracks the Graph delta link for a drive plus every folder and file seen so far,
+    so later runs only need to apply the changes reported by the delta query.
+    Delta responses for SharePoint do not include `parentReference.path`, so local
+    paths are rebuilt from the folder tree (id -> name/parent) on every run.
+    """
+
+    def __init__(self, target_dir, drive_id=None):
+        self.target_dir = target_dir
+        self.path = os.path.join(target_dir, MANIFEST_FILENAME)
+        self.drive_id = drive_id
+        self.delta_link = None
+        self.root_id = None
+        self.folders = {}  # item id -> {"name", "parent"}
+        self.files = {}    # item id -> {"name", "parent", "etag", "ctag", "size", "path"}
+
+    @classmethod
+    def load(cls, target_dir, drive_id):
+        """Loads the manifest for a drive, or returns an empty one if missing or for another drive."""
+        manifest = cls(target_dir, drive_id)
+        if not os.path.exists(manifest.path):
+            return manifest
+        try:
+            with open(manifest.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable sync manifest {manifest.path}: {e}")
+            return manifest
+
+        if data.get("drive_id") != drive_id:
+            print("Sync manifest belongs to a different library, starting a full sync.")
+            return manifest
+
+        manifest.delta_link = data.get("delta_link")
+        manifest.root_id = data.get("root_id")
+        manifest.folders = data.get("folders", {})
+        manifest.files = data.get("files", {})
+        return manifest
+
+    def save(self):
+        """Writes the manifest atomically so an interrupted run never leaves it half-written."""
+        os.makedirs(self.target_dir, exist_ok=True)
+        data = {
+            "drive_id": self.drive_id,
+            "delta_link": self.delta_link,
+            "root_id": self.root_id,
+            "folders": self.folders,
+            "files": self.files,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        """Forgets the delta link so the next delta query enumerates the whole drive."""
+        self.delta_link = None
+
+    def folder_path(self, folder_id):
+        """Returns the path of a folder relative to the library root, or None if its chain is broken."""
+        parts = []
+        seen = set()
+        current = folder_id
+        while current != self.root_id:
+            folder = self.folders.get(current)
+            if folder is None or current in seen:
+                return None
+            seen.add(current)
+            parts.append(folder["name"])
+            current = folder["parent"]
+        return "/".join(reversed(parts))
+
+    def relative_path(self, file_entry):
+        """Returns the path of a file relative to the library root, or None if its parent is gone."""
+        parent_path = self.folder_path(file_entry["parent"])
+        if parent_path is None:
+            return None
+        return f"{parent_path}/{file_entry['name']}" if parent_path else file_entry["name"]
+
+    def local_path(self, relative_path):
+        return os.path.join(self.target_dir, *relative_path.split("/"))
+
+
+class SyncResult:
+    """Summary of an incremental sync, listing local paths so the indexer can act on just those files."""
+
+    def __init__(self):
+        self.added = []
+        self.modified = []
+        self.removed = []
+        self.unchanged = 0
+        self.full_resync = False
+        self.download_stats = None  # DownloadStats for this run, if anything was downloaded
+
+    @property
+    def changed(self):
+        return self.added + self.modified
+
+    @property
+    def has_changes(self):
+        return bool(self.added or self.modified or self.removed)
+
+    def to_dict(self):
+        return {
+            "added": self.added,
+            "modified": self.modified,
+            "removed": self.removed,
+            "unchanged": self.unchanged,
+            "full_resync": self.full_resync,
+        }
+
+    def __str__(self):
+        return (f"{len(self.added)} added, {len(self.modified)} modified, "
+                f"{len(self.removed)} removed, {self.unchanged} unchanged")
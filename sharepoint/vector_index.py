@@ -0,0 +1,406 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Iterable, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+LOCAL_INDEX_DIRNAME = "local_index"
+DTYPES = ("float16", "int8")
+# Rows scored per block, so brute-force search never materializes the whole matrix as float32.
+SEARCH_BLOCK_ROWS = 65536
+# IVF lists are (re)trained once there are this many vectors per list, and again when the
+# index has grown 4x since the last training.
+MIN_ROWS_PER_LIST = 39
+KMEANS_ITERATIONS = 10
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_select(query_scores, candidates, k, lambda_mult=0.5) -> List[int]:
+    """
+    Maximal marginal relevance over normalized candidate vectors, vectorized.
+
+    `query_scores` are the candidates' similarities to the query; returns the positions of
+    the selected candidates in selection order.
+    """
+    if not len(candidates):
+        return []
+    similarity = candidates @ candidates.T
+    selected = [int(np.argmax(query_scores))]
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * query_scores - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
+
+
+def _kmeans(vectors, n_lists, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means; returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for j in range(n_lists):
+            members = vectors[assignment == j]
+            if len(members):
+                centroids[j] = members.sum(axis=0)
+            else:
+                # Re-seed empty lists so every list stays useful.
+                centroids[j] = vectors[rng.integers(len(vectors))]
+        centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+class LocalVectorIndex(VectorStore):
+    """
+    Compact on-disk vector store: a memory-mapped matrix plus a SQLite metadata sidecar.
+
+    Vectors are normalized and stored as float16, or as int8 with a float32 scale per row
+    (`dtype="int8"`, about 4x smaller than float32). Opening the index only reads the id
+    table, and search is brute-force matrix products over the memmap in blocks, so startup
+    is near-instant and resident memory follows what is actually touched.
+
+    With `n_lists` > 0, vectors are partitioned into that many k-means lists (IVF) and a
+    search only scores the `n_probe` lists nearest to the query.
+
+    Implements the parts of the Chroma interface SharePointAgent uses (add_documents with
+    ids, delete, get, MMR search), so it can be swapped in with `vector_backend="local"`.
+    """
+
+    def __init__(self, persist_directory, embedding_function: Embeddings, dtype="float16",
+                 n_lists=0, n_probe=8):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self._lock = threading.RLock()
+
+        os.makedirs(persist_directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(persist_directory, "meta.sqlite"), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS rows (
+                slot INTEGER PRIMARY KEY, id TEXT UNIQUE, content TEXT, metadata TEXT, list INTEGER);
+        """)
+        self._db.commit()
+
+        settings = dict(self._db.execute("SELECT key, value FROM settings").fetchall())
+        # An existing index keeps the dtype it was built with.
+        self.dtype = settings.get("dtype", dtype)
+        self.dim = int(settings.get("dim", 0))
+        self._capacity = int(settings.get("capacity", 0))
+        self._trained_rows = int(settings.get("trained_rows", 0))
+        self._matrix = None
+        self._scales = None
+
+        rows = self._db.execute("SELECT slot, id, list FROM rows").fetchall()
+        self._slot_of = {row_id: slot for slot, row_id, _ in rows}
+        self._live = np.zeros(self._capacity, dtype=bool)
+        self._lists = np.full(self._capacity, -1, dtype=np.int32)
+        for slot, _, list_id in rows:
+            self._live[slot] = True
+            self._lists[slot] = -1 if list_id is None else list_id
+
+        centroids_path = os.path.join(persist_directory, "centroids.npy")
+        self._centroids = np.load(centroids_path) if os.path.exists(centroids_path) else None
+        if self._capacity:
+            self._open_matrix()
+
+    # --- VectorStore interface -------------------------------------------------------
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        if ids is None:
+            raise ValueError("LocalVectorIndex needs explicit ids")
+        vectors = self.embedding_function.embed_documents(texts)
+        self.add_vectors(ids, vectors, texts, metadatas)
+        return list(ids)
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        return self.add_texts([d.page_content for d in documents], [d.metadata for d in documents], ids=ids)
+
+    def add_vectors(self, ids: List[str], vectors, texts: List[str], metadatas: List[dict]):
+        """Stores precomputed vectors; existing ids are overwritten in place."""
+        if not len(ids):
+            return
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            if not self.dim:
+                self.dim = vectors.shape[1]
+                self._set("dim", self.dim)
+                self._set("dtype", self.dtype)
+            slots = self._allocate(ids)
+            self._write(slots, vectors)
+            lists = self._assign(vectors) if self._centroids is not None else [None] * len(ids)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO rows (slot, id, content, metadata, list) VALUES (?, ?, ?, ?, ?)",
+                [(int(slot), row_id, text, json.dumps(metadata or {}, default=str),
+                  None if list_id is None else int(list_id))
+                 for slot, row_id, text, metadata, list_id in zip(slots, ids, texts, metadatas, lists)])
+            self._db.commit()
+            for slot, row_id, list_id in zip(slots, ids, lists):
+                self._slot_of[row_id] = int(slot)
+                self._live[slot] = True
+                self._lists[slot] = -1 if list_id is None else list_id
+
+            if self.n_lists and len(self) >= max(self.n_lists * MIN_ROWS_PER_LIST, 4 * self._trained_rows):
+                self.build_ivf()
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs) -> bool:
+        if not ids:
+            return False
+        with self._lock:
+            slots = [self._slot_of.pop(row_id) for row_id in ids if row_id in self._slot_of]
+            for i in range(0, len(slots), 500):
+                batch = slots[i:i + 500]
+                self._db.execute(f"DELETE FROM rows WHERE slot IN ({','.join('?' * len(batch))})", batch)
+            self._db.commit()
+            self._live[slots] = False
+            self._lists[slots] = -1
+        return True
+
+    def get(self, ids: Optional[List[str]] = None, include=None, limit=None, offset=0, **kwargs) -> dict:
+        """Chroma-style paging over stored rows: {"ids", "documents", "metadatas"}."""
+        with self._lock:
+            if ids is not None:
+                placeholders = ",".join("?" * len(ids))
+                rows = self._db.execute(
+                    f"SELECT id, content, metadata FROM rows WHERE id IN ({placeholders}) ORDER BY slot",
+                    list(ids)).fetchall()
+            else:
+                rows = self._db.execute("SELECT id, content, metadata FROM rows ORDER BY slot LIMIT ? OFFSET ?",
+                                        (-1 if limit is None else limit, offset)).fetchall()
+        return {
+            "ids": [row[0] for row in rows],
+            "documents": [row[1] for row in rows],
+            "metadatas": [json.loads(row[2]) for row in rows],
+        }
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k)
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        """Top-k (Document, cosine similarity) pairs."""
+        slots, scores = self.search_slots(embedding, k)
+        return list(zip(self._documents(slots), scores.tolist()))
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, **kwargs) -> List[Document]:
+        embedding = self.embedding_function.embed_query(query)
+        return self.max_marginal_relevance_search_by_vector(embedding, k, fetch_k, lambda_mult)
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, **kwargs) -> List[Document]:
+        slots, scores = self.search_slots(embedding, fetch_k)
+        if not len(slots):
+            return []
+        candidates = _normalize(self._vectors(slots))
+        selected = mmr_select(scores, candidates, k, lambda_mult)
+        return self._documents(slots[selected])
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity in [-1, 1] -> relevance in [0, 1].
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, persist_directory=LOCAL_INDEX_DIRNAME, **kwargs):
+        store = cls(persist_directory, embedding, **kwargs)
+        texts = list(texts)
+        store.add_texts(texts, metadatas, ids=ids or [str(i) for i in range(len(texts))])
+        return store
+
+    # --- search ----------------------------------------------------------------------
+
+    def search_slots(self, embedding, k):
+        """Returns (slots, similarities) of the k nearest live vectors, best first."""
+        with self._lock:
+            if not len(self) or k <= 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            query = _normalize(np.asarray(embedding, dtype=np.float32))
+            candidates = self._candidate_slots(query, k)
+            if candidates is None:
+                scores = self._score_all(query)
+                slots = np.arange(len(scores))
+            else:
+                slots = candidates
+                scores = self._vectors(slots) @ query
+
+            k = min(k, len(slots))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            top = top[np.isfinite(scores[top])]
+            return slots[top], scores[top]
+
+    def _candidate_slots(self, query, k):
+        """Slots in the IVF lists nearest to the query, or None to scan everything."""
+        if self._centroids is None:
+            return None
+        probe = np.argsort(-(self._centroids @ query))[:self.n_probe]
+        candidates = np.nonzero(self._live & np.isin(self._lists, probe))[0]
+        # Unassigned rows (added before training) are always scanned.
+        unassigned = np.nonzero(self._live & (self._lists < 0))[0]
+        candidates = np.concatenate([candidates, unassigned])
+        return candidates if len(candidates) >= k else None
+
+    def _score_all(self, query):
+        rows = self._high_water()
+        scores = np.empty(rows, dtype=np.float32)
+        for start in range(0, rows, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, rows)
+            scores[start:end] = np.asarray(self._matrix[start:end], dtype=np.float32) @ query
+        if self._scales is not None:
+            scores *= self._scales[:rows]
+        scores[~self._live[:rows]] = -np.inf
+        return scores
+
+    def _vectors(self, slots):
+        vectors = np.asarray(self._matrix[np.sort(slots)], dtype=np.float32)
+        # Fancy indexing a memmap wants sorted slots; restore the caller's order.
+        vectors = vectors[np.argsort(np.argsort(slots))]
+        if self._scales is not None:
+            vectors *= self._scales[slots][:, None]
+        return vectors
+
+    def _documents(self, slots) -> List[Document]:
+        if not len(slots):
+            return []
+        slots = [int(s) for s in slots]
+        placeholders = ",".join("?" * len(slots))
+        with self._lock:
+            rows = {slot: (content, metadata) for slot, content, metadata in self._db.execute(
+                f"SELECT slot, content, metadata FROM rows WHERE slot IN ({placeholders})", slots).fetchall()}
+        return [Document(page_content=rows[s][0], metadata=json.loads(rows[s][1])) for s in slots if s in rows]
+
+    # --- IVF -------------------------------------------------------------------------
+
+    def build_ivf(self, n_lists=None):
+        """(Re)trains the IVF centroids on the current vectors and reassigns every row."""
+        n_lists = n_lists or self.n_lists
+        with self._lock:
+            live = np.nonzero(self._live)[0]
+            if not n_lists or len(live) < n_lists:
+                return
+            rng = np.random.default_rng(0)
+            sample = live if len(live) <= 256 * n_lists else rng.choice(live, 256 * n_lists, replace=False)
+            self._centroids = _kmeans(_normalize(self._vectors(sample)), n_lists)
+            np.save(os.path.join(self.persist_directory, "centroids.npy"), self._centroids)
+
+            for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+                block = live[start:start + SEARCH_BLOCK_ROWS]
+                self._lists[block] = self._assign(self._vectors(block))
+            self._db.executemany("UPDATE rows SET list = ? WHERE slot = ?",
+                                 [(int(self._lists[s]), int(s)) for s in live])
+            self._trained_rows = len(live)
+            self._set("trained_rows", self._trained_rows)
+            self._db.commit()
+
+    def _assign(self, vectors):
+        return np.argmax(_normalize(vectors) @ self._centroids.T, axis=1).astype(np.int32)
+
+    # --- storage ---------------------------------------------------------------------
+
+    def disk_bytes(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.persist_directory, name))
+                   for name in os.listdir(self.persist_directory))
+
+    def _high_water(self):
+        live = np.nonzero(self._live)[0]
+        return int(live[-1]) + 1 if len(live) else 0
+
+    def _allocate(self, ids):
+        """Slots for ids: existing ones are reused, new ones fill freed slots before growing."""
+        free = iter(np.nonzero(~self._live)[0].tolist())
+        slots = []
+        taken = set()
+        for row_id in ids:
+            slot = self._slot_of.get(row_id)
+            if slot is None:
+                slot = next(free, None)
+                while slot is not None and slot in taken:
+                    slot = next(free, None)
+                if slot is None:
+                    slot = max(self._capacity, max(taken, default=-1) + 1)
+            taken.add(slot)
+            slots.append(slot)
+        self._grow(max(slots) + 1)
+        return np.asarray(slots, dtype=np.int64)
+
+    def _write(self, slots, vectors):
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+            for slot, row, scale in zip(slots, quantized, scales):
+                self._matrix[slot] = row
+                self._scales[slot] = scale
+            self._scales.flush()
+        else:
+            for slot, row in zip(slots, vectors):
+                self._matrix[slot] = row
+        self._matrix.flush()
+
+    def _grow(self, min_capacity):
+        """Grows the matrix (and scale) files by doubling."""
+        if min_capacity <= self._capacity:
+            return
+        capacity = max(min_capacity, self._capacity * 2, 1024)
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        if self._scales is not None:
+            self._scales.flush()
+            self._scales = None
+        itemsize = np.dtype(self.dtype).itemsize
+        with open(self._path("vectors.bin"), "ab") as f:
+            f.truncate(capacity * self.dim * itemsize)
+        if self.dtype == "int8":
+            with open(self._path("scales.bin"), "ab") as f:
+                f.truncate(capacity * 4)
+        self._live = np.concatenate([self._live, np.zeros(capacity - self._capacity, dtype=bool)])
+        self._lists = np.concatenate([self._lists, np.full(capacity - self._capacity, -1, dtype=np.int32)])
+        self._capacity = capacity
+        self._set("capacity", capacity)
+        self._open_matrix()
+
+    def _open_matrix(self):
+        self._matrix = np.memmap(self._path("vectors.bin"), dtype=self.dtype, mode="r+",
+                                 shape=(self._capacity, self.dim))
+        if self.dtype == "int8":
+            self._scales = np.memmap(self._path("scales.bin"), dtype=np.float32, mode="r+",
+                                     shape=(self._capacity,))
+
+    def _path(self, name):
+        return os.path.join(self.persist_directory, name)
+
+    def _set(self, key, value):
+        self._db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
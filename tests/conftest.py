@@ -0,0 +1,13 @@
+"""
+Puts the apps on the path the way they run: flat imports from sharepoint/ and
+personal_assistant/, plus the offline fakes from benchmarks/ (after the apps, whose
+module names come first).
+"""
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (os.path.join(ROOT, "benchmarks"), os.path.join(ROOT, "personal_assistant"),
+             os.path.join(ROOT, "sharepoint"), ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,97 @@
+import os
+
+import answer_cache
+from answer_cache import AnswerCache
+
+
+def vector(*values):
+    return list(values) + [0.0] * (4 - len(values))
+
+
+def test_versions_do_not_evict_each_other(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"))
+    cache.store("What is the policy?", vector(1, 0), "answer A", "scope-a", 1.0)
+    cache.store("What is the policy?", vector(1, 0), "answer B", "scope-b", 1.0)
+    assert cache.lookup_exact("what is the policy", "scope-a") == "answer A"
+    assert cache.lookup_semantic(vector(1, 0.01), "scope-a") == "answer A"
+    assert cache.lookup_exact("what is the policy", "scope-b") == "answer B"
+    assert cache.lookup_semantic(vector(1, 0.01), "scope-b") == "answer B"
+
+
+def test_answers_of_other_versions_are_not_returned(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"))
+    cache.store("What is the policy?", vector(1, 0), "answer A", "v1", 1.0)
+    assert cache.lookup("What is the policy?", vector(1, 0), "v2") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_semantic_tier_sees_answers_stored_after_loading(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"))
+    assert cache.lookup_semantic(vector(0, 1), "v1") is None
+    cache.store("Who approves travel?", vector(0, 1), "the manager", "v1", 1.0)
+    assert cache.lookup_semantic(vector(0, 1), "v1") == "the manager"
+    assert cache.lookup_semantic(vector(1, 0), "v1") is None
+
+
+def test_discard_deletes_only_that_version(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"))
+    cache.store("q", vector(1), "old", "v1", 1.0)
+    cache.store("q", vector(1), "other", "v2", 1.0)
+    cache.discard("v1")
+    assert cache.lookup("q", vector(1), "v1") is None
+    assert cache.lookup("q", vector(1), "v2") == "other"
+
+
+def test_expired_answers_are_not_returned_and_are_purged(tmp_path, monkeypatch):
+    path = str(tmp_path / "answers.sqlite")
+    cache = AnswerCache(path, ttl_seconds=60)
+    cache.store("q", vector(1), "answer", "v1", 1.0)
+    now = answer_cache.time.time()
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now + 3600)
+    assert cache.lookup("q", vector(1), "v1") is None
+    assert AnswerCache(path)._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 0
+
+
+def test_reopened_cache_keeps_every_version(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    cache = AnswerCache(path)
+    cache.store("q", vector(1), "a", "v1", 1.0)
+    cache.store("q", vector(1), "b", "v2", 1.0)
+    reopened = AnswerCache(path)
+    assert reopened.lookup_semantic(vector(1), "v2") == "b"
+    assert reopened.lookup_semantic(vector(1), "v1") == "a"
+
+
+def test_sharded_agent_keeps_answers_per_scope_until_a_shard_changes(tmp_path):
+    from fakes import FakeEmbeddings, fake_llm, make_corpus
+    from shards import ShardRegistry, ShardedAgent
+
+    registry = ShardRegistry(str(tmp_path / "shards"))
+    for n, site in enumerate(("hr", "it")):
+        shard = registry.add(site, "Documents")
+        for relative, content in make_corpus(3, 200, seed=n):
+            path = os.path.join(shard.data_dir, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+    agent = ShardedAgent(registry, embeddings=FakeEmbeddings(64), llm=fake_llm(0), embedding_cache_dir=None,
+                         vector_backend="local")
+    agent.create_vector_store()
+    hr, it = registry.keys()
+
+    def ask(shards):
+        from agent import QueryTimings
+        timings = QueryTimings()
+        "".join(agent.stream_query("What does the handbook say?", timings, shards=shards))
+        return timings.cached
+
+    assert not ask([hr]) and not ask([it]) and not ask(None)
+    assert ask([hr]) and ask([it]) and ask(None)
+
+    changed = os.path.join(registry.get(hr).data_dir, "new.txt")
+    with open(changed, "w", encoding="utf-8") as f:
+        f.write("A new leave policy.")
+    agent.refresh_index([changed])
+    # The scopes including the changed shard were discarded; the other one was kept.
+    assert agent.answer_cache._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 1
+    assert not ask([hr]) and ask([it]) and not ask(None)
@@ -0,0 +1,47 @@
+import io
+import json
+
+from batch_qa import BatchRunner
+
+
+class FakeAgent:
+    def __init__(self):
+        self.questions = []
+
+    def stream_query(self, question, timings):
+        self.questions.append(question)
+        timings.total = timings.retrieval = 0.5
+        yield f"answer to {question}"
+
+
+def run(tmp_path, questions, agent):
+    questions_path, output_path = tmp_path / "questions.jsonl", tmp_path / "answers.jsonl"
+    questions_path.write_text("".join(json.dumps(q) + "\n" for q in questions), encoding="utf-8")
+    stats = BatchRunner(agent, concurrency=2, log=io.StringIO()).run(str(questions_path), str(output_path))
+    records = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+    return stats, {record["id"]: record for record in records}
+
+
+def test_copies_point_at_the_answered_question(tmp_path):
+    agent = FakeAgent()
+    questions = [{"id": "a", "question": "What is the policy?"}, {"id": "b", "question": "what is the policy"},
+                 {"id": "c", "question": "WHAT IS THE POLICY?"}, {"id": "d", "question": "Who approves?"}]
+    stats, records = run(tmp_path, questions, agent)
+    assert len(agent.questions) == 2
+    assert stats["answered"] == 4 and stats["shared"] == 2
+    assert records["b"]["duplicate_of"] == "a" and records["c"]["duplicate_of"] == "a"
+    assert "duplicate_of" not in records["a"] and "duplicate_of" not in records["d"]
+    assert records["c"]["answer"] == records["a"]["answer"]
+    assert records["a"]["timings"]["total_s"] == 0.5 and "shared" not in records["a"]["timings"]
+    for id in "bc":
+        assert records[id]["timings"]["total_s"] == 0.0 and records[id]["timings"]["shared"]
+
+
+def test_rerun_shares_answers_written_before(tmp_path):
+    run(tmp_path, [{"id": "a", "question": "What is the policy?"}], FakeAgent())
+    agent = FakeAgent()
+    stats, records = run(tmp_path, [{"id": "a", "question": "What is the policy?"},
+                                    {"id": "b", "question": "what is the policy"}], agent)
+    assert agent.questions == []
+    assert stats["skipped"] == 1 and stats["shared"] == 1
+    assert records["b"]["duplicate_of"] == "a" and records["b"]["timings"]["shared"]
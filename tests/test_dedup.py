@@ -0,0 +1,83 @@
+import os
+
+from langchain_core.documents import Document
+
+from dedup import DedupIndex
+
+POLICY = " ".join(f"Clause {n}: travel above the monthly limit needs written approval from a director."
+                  for n in range(20))
+OTHER = " ".join(f"Item {n}: the canteen opens at eight and closes after the evening shift ends."
+                 for n in range(20))
+
+
+def chunk(text, source):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def add(index, path, text):
+    chunks = [chunk(text, path)]
+    return index.add_document(path, index.signatures(chunks))
+
+
+def test_copy_is_released_when_its_canonical_document_is_removed(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.sqlite"))
+    assert add(index, "a.txt", POLICY) is None
+    assert add(index, "a (1).txt", POLICY) == "a.txt"
+    assert index.take_released() == set()
+    index.remove_document("a.txt")
+    assert index.take_released() == {"a (1).txt"}
+    assert index.take_released() == set()
+    # Decided again, the copy becomes the canonical document.
+    assert add(index, "a (1).txt", POLICY) is None
+
+
+def test_copy_is_released_when_its_canonical_document_changes(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.sqlite"))
+    add(index, "a.txt", POLICY)
+    add(index, "b.txt", POLICY)
+    assert add(index, "a.txt", OTHER) is None
+    assert index.take_released() == {"b.txt"}
+    assert index.stats()["duplicate_documents"] == 0
+
+
+def test_file_holding_chunk_aliases_is_released_when_the_chunk_is_deleted(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.sqlite"))
+    stored, copy = chunk(POLICY, "a.txt"), chunk(POLICY, "b.txt")
+    [signature] = index.signatures([stored])
+    assert index.add_chunk("a-0", "a.txt", stored, signature) is None
+    assert index.add_chunk("b-0", "b.txt", copy, signature) == "a-0"
+    assert index.aliases(stored) == ["b.txt"]
+    index.remove_chunks(["a-0"])
+    assert index.take_released() == {"b.txt"}
+    assert index.aliases(stored) == []
+    assert index.stats()["chunks"] == 0
+
+
+def test_aliases_survive_reopening(tmp_path):
+    path = str(tmp_path / "dedup.sqlite")
+    index = DedupIndex(path)
+    add(index, "a.txt", POLICY)
+    index.commit()
+    reopened = DedupIndex(path)
+    assert add(reopened, "a (1).txt", POLICY) == "a.txt"
+
+
+def test_agent_indexes_a_released_copy(tmp_path):
+    from agent import SharePointAgent
+    from fakes import FakeEmbeddings, fake_llm
+
+    data = tmp_path / "docs"
+    data.mkdir()
+    for name in ("a.txt", "a (1).txt"):
+        (data / name).write_text(POLICY, encoding="utf-8")
+    agent = SharePointAgent(data_dir=str(data), persist_directory=str(tmp_path / "db"), embeddings=FakeEmbeddings(64),
+                            llm=fake_llm(0), embedding_cache_dir=None, vector_backend="local", parse_workers=1)
+    agent.create_vector_store()
+    files = agent.index_state.files
+    [original] = [path for path, entry in files.items() if entry["chunks"]]
+    [copy] = [path for path in files if path != original]
+
+    os.remove(original)
+    agent.update_index()
+    assert original not in agent.index_state.files
+    assert agent.index_state.files[copy]["chunks"]
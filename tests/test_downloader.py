@@ -0,0 +1,212 @@
+import threading
+import time
+
+import pytest
+
+import downloader
+from downloader import DownloadJob, ParallelDownloader, RetryableDownloadError, parse_retry_after
+from fakes import FakeResponse
+
+CONTENT = bytes(range(256)) * 40
+
+
+class FakeSession:
+    """Serves `files` ({url: bytes}), honouring Range, after the scripted failures in `errors` ({url: [status]})."""
+
+    def __init__(self, files, errors=None, retry_after="0", redirect_host=None, latency=0.0):
+        self.files = files
+        self.retry_after = retry_after
+        self.errors = {url: list(statuses) for url, statuses in (errors or {}).items()}
+        self.redirect_host = redirect_host
+        self.latency = latency
+        self.requests = []
+        self.active = {}
+        self.peak = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, stream=False):
+        headers = headers or {}
+        self.requests.append((url, dict(headers)))
+        if self.errors.get(url):
+            headers = {"Retry-After": self.retry_after} if self.retry_after is not None else {}
+            return FakeResponse(self.errors[url].pop(0), headers=headers)
+        content = self.files[url]
+        status = 200
+        if "Range" in headers:
+            start = int(headers["Range"].split("=")[1].rstrip("-"))
+            if start >= len(content):
+                return FakeResponse(416)
+            content, status = content[start:], 206
+        response = _TrackedResponse(self, status, content)
+        response.url = url.replace(url.split("/")[2], self.redirect_host) if self.redirect_host else url
+        return response
+
+
+class _TrackedResponse(FakeResponse):
+    """Counts concurrent body transfers per serving host."""
+
+    def __init__(self, session, status, content):
+        super().__init__(status, content=content)
+        self.session = session
+
+    def iter_content(self, chunk_size=1024 * 1024):
+        host = self.url.split("/")[2]
+        with self.session._lock:
+            self.session.active[host] = self.session.active.get(host, 0) + 1
+            self.session.peak[host] = max(self.session.peak.get(host, 0), self.session.active[host])
+        try:
+            if self.session.latency:
+                time.sleep(self.session.latency)
+            yield from super().iter_content(chunk_size)
+        finally:
+            with self.session._lock:
+                self.session.active[host] -= 1
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr(downloader.time, "sleep", delays.append)
+    return delays
+
+
+def make_job(tmp_path, name="a.bin", version="c1", host="graph.test"):
+    return DownloadJob(f"https://{host}/items/{name}/content", str(tmp_path / name),
+                       size=len(CONTENT), key=name, version=version)
+
+
+def test_downloads_and_renames_into_place(tmp_path):
+    job = make_job(tmp_path)
+    stats = ParallelDownloader(FakeSession({job.url: CONTENT})).download([job])
+    assert len(stats.completed) == 1
+    assert (tmp_path / "a.bin").read_bytes() == CONTENT
+    assert not (tmp_path / "a.bin.part").exists()
+    assert not (tmp_path / "a.bin.part.version").exists()
+
+
+def test_resumes_a_partial_download_of_the_same_version(tmp_path):
+    job = make_job(tmp_path)
+    (tmp_path / "a.bin.part").write_bytes(CONTENT[:1000])
+    (tmp_path / "a.bin.part.version").write_text("c1")
+    session = FakeSession({job.url: CONTENT})
+    ParallelDownloader(session).download([job])
+    assert session.requests[0][1] == {"Range": "bytes=1000-"}
+    assert job.bytes_downloaded == len(CONTENT) - 1000
+    assert (tmp_path / "a.bin").read_bytes() == CONTENT
+
+
+def test_discards_a_partial_download_of_another_version(tmp_path):
+    job = make_job(tmp_path, version="c2")
+    (tmp_path / "a.bin.part").write_bytes(b"x" * 1000)
+    (tmp_path / "a.bin.part.version").write_text("c1")
+    session = FakeSession({job.url: CONTENT})
+    ParallelDownloader(session).download([job])
+    assert session.requests[0][1] == {}
+    assert (tmp_path / "a.bin").read_bytes() == CONTENT
+
+
+def test_partial_download_without_a_recorded_version_is_not_resumed(tmp_path):
+    job = make_job(tmp_path)
+    (tmp_path / "a.bin.part").write_bytes(b"x" * 1000)
+    session = FakeSession({job.url: CONTENT})
+    ParallelDownloader(session).download([job])
+    assert session.requests[0][1] == {}
+    assert (tmp_path / "a.bin").read_bytes() == CONTENT
+
+
+def test_unversioned_partial_download_is_not_resumed(tmp_path):
+    job = make_job(tmp_path, version=None)
+    (tmp_path / "a.bin.part").write_bytes(b"x" * 1000)
+    session = FakeSession({job.url: CONTENT})
+    ParallelDownloader(session).download([job])
+    assert session.requests[0][1] == {}
+    assert (tmp_path / "a.bin").read_bytes() == CONTENT
+
+
+@pytest.mark.parametrize("same_revision", [True, False])
+def test_download_library_resumes_only_the_same_revision(tmp_path, same_revision):
+    from datetime import datetime, timezone
+    from fakes import DRIVE_ID, SERVICE_URL
+    from sharepoint_connector import SharePointFetcher
+
+    class Item:
+        object_id = "item-1"
+        name = "a.pdf"
+        is_folder, is_file = False, True
+        size = len(CONTENT)
+
+        def __init__(self, modified):
+            self.modified = modified
+
+    class Drive:
+        object_id = DRIVE_ID
+
+        def __init__(self, item):
+            self.item = item
+
+        def get_root_folder(self):
+            drive = self
+
+            class Root:
+                def get_items(self):
+                    return [drive.item]
+            return Root()
+
+    class Account:
+        class protocol:
+            service_url = SERVICE_URL
+
+    fetcher = SharePointFetcher.__new__(SharePointFetcher)
+    fetcher.account = Account()
+    old, new = (datetime(2026, 1, day, tzinfo=timezone.utc) for day in (1, 2))
+    url = fetcher._content_url(DRIVE_ID, "item-1")
+    (tmp_path / "a.pdf.part").write_bytes(CONTENT[:1000] if same_revision else b"x" * 1000)
+    (tmp_path / "a.pdf.part.version").write_text((new if same_revision else old).isoformat())
+    session = FakeSession({url: CONTENT})
+    fetcher.download_library(Drive(Item(new)), str(tmp_path), session=session)
+    assert session.requests[0][1] == ({"Range": "bytes=1000-"} if same_revision else {})
+    assert (tmp_path / "a.pdf").read_bytes() == CONTENT
+
+
+def test_retries_throttled_requests_after_retry_after(tmp_path, no_sleep):
+    job = make_job(tmp_path)
+    session = FakeSession({job.url: CONTENT}, errors={job.url: [429, 503]})
+    stats = ParallelDownloader(session).download([job])
+    assert len(stats.completed) == 1
+    assert no_sleep == [0.0, 0.0]
+    assert len(session.requests) == 3
+
+
+def test_backs_off_exponentially_without_retry_after(tmp_path, no_sleep):
+    job = make_job(tmp_path)
+    session = FakeSession({job.url: CONTENT}, errors={job.url: [500, 502, 504]}, retry_after=None)
+    ParallelDownloader(session, backoff_base=1.0).download([job])
+    assert len(no_sleep) == 3
+    for attempt, delay in enumerate(no_sleep):
+        assert 0.5 * 2 ** attempt <= delay <= 2 ** attempt
+
+
+def test_gives_up_after_max_retries(tmp_path):
+    job = make_job(tmp_path)
+    session = FakeSession({job.url: CONTENT}, errors={job.url: [503] * 10})
+    stats = ParallelDownloader(session, max_retries=2).download([job])
+    assert stats.failed == [job]
+    assert isinstance(job.error, RetryableDownloadError)
+    assert len(session.requests) == 3
+
+
+def test_per_host_limit_applies_to_the_redirected_download_host(tmp_path, monkeypatch):
+    monkeypatch.undo()  # real sleeps, so transfers overlap
+    # Two API hosts whose downloads are served by the same host.
+    jobs = [make_job(tmp_path, f"f{n}.bin", host=f"graph{n % 2}.test") for n in range(12)]
+    session = FakeSession({job.url: CONTENT for job in jobs}, redirect_host="download.test", latency=0.02)
+    stats = ParallelDownloader(session, max_workers=8, per_host_limit=2).download(jobs)
+    assert len(stats.completed) == 12
+    assert session.peak == {"download.test": 2}
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
@@ -0,0 +1,65 @@
+from email_text import extract_email_text
+
+
+def test_sign_off_in_the_middle_keeps_the_rest():
+    html = "<p>Hi Bob,</p><p>Thanks!</p><p>The budget is approved for Q3, so go ahead.</p>"
+    assert extract_email_text(html) == "Hi Bob,\nThanks!\nThe budget is approved for Q3, so go ahead."
+    plain = "Hi Bob,\nThanks!\nThe budget is approved for Q3, so go ahead."
+    assert extract_email_text(plain) == plain
+
+
+def test_sign_off_followed_by_a_signature_ends_the_message():
+    html = ("<p>The budget is approved.</p><p>Kind regards,</p><p>Jordan Example</p>"
+            "<p>Senior Analyst | Contoso Ltd</p><p>+1 555 0100</p>")
+    assert extract_email_text(html) == "The budget is approved."
+    assert extract_email_text("The budget is approved.\n\nThanks,\nAlex") == "The budget is approved."
+
+
+def test_sign_off_at_the_end_is_dropped():
+    assert extract_email_text("Hi Bob,\nSee you at 3pm.\nCheers") == "Hi Bob,\nSee you at 3pm."
+
+
+def test_unsubscribe_in_the_text_is_content():
+    plain = "Could you unsubscribe Jane from the list?\nAlso the meeting moved to 3pm."
+    assert extract_email_text(plain) == plain
+
+
+def test_footer_only_counts_near_the_end():
+    lines = ["This message is confidential between us, please don't forward it."] + [
+        f"Point {n}: details." for n in range(8)]
+    assert extract_email_text("\n".join(lines)) == "\n".join(lines)
+    html = ("<p>New prices attached.</p><p>You are receiving this because you subscribed.</p>"
+            "<p>Unsubscribe | Manage preferences</p>")
+    assert extract_email_text(html) == "New prices attached."
+
+
+def test_footer_element_is_skipped():
+    html = "<div><p>Agenda attached.</p><footer><p>Contoso Ltd, 1 Main St</p></footer></div>"
+    assert extract_email_text(html) == "Agenda attached."
+
+
+def test_from_without_header_fields_is_content():
+    assert extract_email_text("<p>From: next week we switch vendors.</p>") == "From: next week we switch vendors."
+    assert extract_email_text("From: next week we switch vendors.") == "From: next week we switch vendors."
+
+
+def test_from_with_header_fields_starts_the_history():
+    plain = ("Sounds good.\n\nFrom: Jane Doe <jane@x.com>\nSent: Monday, 1 January 2024 09:00\n"
+             "To: Bob\nSubject: Budget\n\nOld message.")
+    assert extract_email_text(plain) == "Sounds good."
+    html = "<p>Sounds good.</p><p>From: Jane Doe<br>To: Bob<br>Subject: Budget</p><p>Old message.</p>"
+    assert extract_email_text(html) == "Sounds good."
+
+
+def test_plain_text_with_an_address_is_not_html():
+    plain = ("Please loop in Jane <jane@x.com> on this.\n\nOn Mon, Jan 1, 2024, Bob <bob@x.com> wrote:\n"
+             "> Old message.")
+    assert extract_email_text(plain) == "Please loop in Jane <jane@x.com> on this."
+
+
+def test_quoted_history_is_dropped():
+    html = ("<div>Yes, Friday works.</div><div class='gmail_quote'>On Mon Someone wrote:"
+            "<blockquote>Does Friday work?</blockquote></div>")
+    assert extract_email_text(html) == "Yes, Friday works."
+    outlook = "<p>Done.</p><div id='divRplyFwdMsg'><b>From:</b> Someone</div><p>Old text</p>"
+    assert extract_email_text(outlook) == "Done."
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+import embedding_executor
+from embedding_executor import AdaptiveLimiter, EmbeddingExecutor, MIN_LATENCY_SAMPLES, QUERY_RETRIES, is_retryable
+from fakes import FakeEmbeddings, FakeResponse
+
+
+class Throttled(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("429 Too Many Requests")
+        self.response = FakeResponse(429, headers={"retry-after": str(retry_after)} if retry_after else {})
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+class FlakyEmbeddings(FakeEmbeddings):
+    """Throttles the first `failures` calls (or raises `error()` instead)."""
+
+    def __init__(self, failures, retry_after=None, error=None):
+        super().__init__(dim=8)
+        self.failures = failures
+        self.error = error or (lambda: Throttled(retry_after))
+        self.calls_failed = 0
+
+    def embed_documents(self, texts):
+        if self.failures:
+            self.failures -= 1
+            self.calls_failed += 1
+            raise self.error()
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+
+    async def async_sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(embedding_executor.asyncio, "sleep", async_sleep)
+    monkeypatch.setattr(embedding_executor.time, "sleep", slept.append)
+    return slept
+
+
+def test_throttle_halves_limit_and_success_grows_it():
+    limiter = AdaptiveLimiter(initial=8, latency_target=None)
+    limiter.on_throttle()
+    assert limiter.limit == 4
+    limiter.on_throttle()
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.limit == limiter.minimum
+    for _ in range(10):
+        limiter.on_success(0.1)
+    assert limiter.limit > 3
+
+
+def test_auto_target_follows_observed_median():
+    limiter = AdaptiveLimiter(initial=8)
+    assert limiter.target is None
+    for _ in range(MIN_LATENCY_SAMPLES):
+        limiter.on_success(0.1)
+    assert limiter.target == pytest.approx(0.2)
+    before = limiter.limit
+    limiter.on_success(1.0)
+    assert limiter.limit < before
+
+
+def test_fixed_and_disabled_targets():
+    assert AdaptiveLimiter(latency_target=0.5).target == 0.5
+    limiter = AdaptiveLimiter(initial=4, latency_target=None)
+    for _ in range(MIN_LATENCY_SAMPLES):
+        limiter.on_success(0.01)
+    limiter.on_success(10.0)
+    assert limiter.target is None and limiter.limit > 4
+
+
+def test_throttled_batch_is_retried_with_retry_after(sleeps):
+    executor = EmbeddingExecutor(FlakyEmbeddings(failures=2, retry_after=3), initial_concurrency=4)
+    vectors = executor.embed_documents(["a contract", "an invoice"])
+    assert len(vectors) == 2
+    assert sleeps == [3.0, 3.0]
+    stats = executor.stats()
+    assert stats["retries"] == 2 and stats["throttles"] == 2
+    assert stats["concurrency_limit"] < 4
+
+
+def test_batch_gives_up_after_max_retries(sleeps):
+    executor = EmbeddingExecutor(FlakyEmbeddings(failures=10), max_retries=2)
+    with pytest.raises(Throttled):
+        executor.embed_documents(["a contract"])
+    assert len(sleeps) == 2
+
+
+def test_query_is_retried(sleeps):
+    executor = EmbeddingExecutor(FlakyEmbeddings(failures=QUERY_RETRIES))
+    assert len(executor.embed_query("policy")) == 8
+    assert len(asyncio.run(EmbeddingExecutor(FlakyEmbeddings(failures=1)).aembed_query("policy"))) == 8
+    with pytest.raises(Throttled):
+        EmbeddingExecutor(FlakyEmbeddings(failures=QUERY_RETRIES + 1)).embed_query("policy")
+
+
+def test_only_transient_errors_are_retryable():
+    assert is_retryable(Throttled())
+    assert is_retryable(HTTPStatusError(503)) and is_retryable(HTTPStatusError(500))
+    assert is_retryable(APIConnectionError("reset")) and is_retryable(TimeoutError())
+    assert not is_retryable(HTTPStatusError(401)) and not is_retryable(HTTPStatusError(400))
+    assert not is_retryable(ValueError("bad model name"))
+
+
+@pytest.mark.parametrize("status", [400, 401, 403])
+def test_permanent_errors_are_raised_at_once(sleeps, status):
+    embeddings = FlakyEmbeddings(failures=10, error=lambda: HTTPStatusError(status))
+    executor = EmbeddingExecutor(embeddings, initial_concurrency=4)
+    with pytest.raises(HTTPStatusError):
+        executor.embed_documents(["a contract"])
+    with pytest.raises(HTTPStatusError):
+        executor.embed_query("policy")
+    assert embeddings.calls_failed == 2 and sleeps == []
+    assert executor.stats()["concurrency_limit"] >= 4
+
+
+def test_server_and_connection_errors_are_retried(sleeps):
+    for error in (lambda: HTTPStatusError(502), lambda: APIConnectionError("reset")):
+        executor = EmbeddingExecutor(FlakyEmbeddings(failures=2, error=error))
+        assert len(executor.embed_documents(["a contract"])) == 1
+        assert executor.stats()["retries"] == 2
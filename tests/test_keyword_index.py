@@ -0,0 +1,53 @@
+import pytest
+from langchain_core.documents import Document
+
+from keyword_index import KeywordIndex, is_identifier, reciprocal_rank_fusion
+
+
+@pytest.mark.parametrize("term", ["pol-2231", "pol2231", "kb4012", "report_v2", "budget.xlsx", "2023-10-01"])
+def test_identifier_shapes(term):
+    assert is_identifier(term)
+
+
+@pytest.mark.parametrize("term", ["2023", "5", "q3", "v2", "state-of-the-art", "e.g", "policy"])
+def test_ordinary_terms(term):
+    assert not is_identifier(term)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = KeywordIndex(str(tmp_path / "keywords.sqlite"))
+    texts = [f"Travel policy section {n}: meals, hotels and mileage in 2023." for n in range(20)]
+    texts[3] = "POL-2231 covers remote work equipment allowances."
+    texts[7] = "Remote work equipment, remote work allowances, remote work stipends and remote work rules."
+    index.add([f"c{n}" for n in range(len(texts))],
+              [Document(page_content=t, metadata={"source": f"doc{n}.txt"}) for n, t in enumerate(texts)])
+    return index
+
+
+def test_rare_identifier_takes_the_fast_path(index):
+    hits = index.search_identifiers("What does POL-2231 cover?")
+    assert [doc.metadata["source"] for doc in hits] == ["doc3.txt"]
+
+
+def test_questions_without_identifiers_have_no_fast_path(index):
+    assert index.search_identifiers("What changed for travel in 2023?") is None
+    assert index.search_identifiers("What about Q3?") is None
+
+
+def test_common_identifier_is_not_a_fast_path(tmp_path):
+    index = KeywordIndex(str(tmp_path / "keywords.sqlite"))
+    index.add([f"c{n}" for n in range(8)],
+              [Document(page_content=f"Form HR-100 step {n}.", metadata={"source": f"d{n}"}) for n in range(8)])
+    assert index.search_identifiers("How do I fill in HR-100?", k=5) == []
+
+
+def test_identifier_without_a_bm25_margin_is_not_a_fast_path(index):
+    question = "What does POL-2231 say about remote work equipment, remote work allowances and stipends?"
+    assert index.search_identifiers(question) == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    a, b, c = (Document(page_content=t, metadata={"source": t}) for t in "abc")
+    fused = reciprocal_rank_fusion([[a, b], [b, c]])
+    assert fused[0] is b
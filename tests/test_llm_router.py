@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from fakes import FakeChatEndpoint, FakeProviderError
+from llm_router import LLMRouter, MIN_ERRORS, MIN_SAMPLES
+
+
+def make_router(primary_latency=0.01, secondary_latency=0.02, **options):
+    primary = FakeChatEndpoint("primary", latency=primary_latency, chunk_latency=0)
+    secondary = FakeChatEndpoint("secondary", latency=secondary_latency, chunk_latency=0)
+    options.setdefault("min_hedge_after", 0.05)
+    return LLMRouter({"primary": primary, "secondary": secondary}, **options), primary, secondary
+
+
+def warm_up(router, calls=MIN_SAMPLES):
+    for _ in range(calls):
+        router.invoke("question")
+        "".join(router.stream("question"))
+
+
+def test_routes_to_the_preferred_provider():
+    router, primary, secondary = make_router()
+    assert router.invoke("question") == "Based on the documents, here is a short answer."
+    assert (primary.calls, secondary.calls) == (1, 0)
+
+
+def test_hedges_a_call_slower_than_p95():
+    router, primary, secondary = make_router()
+    warm_up(router)
+    assert router.hedge_after("primary") == pytest.approx(0.05, abs=0.02)
+    primary.latency = 2.0
+    started = time.perf_counter()
+    answer = "".join(router.stream("question"))
+    assert answer == "Based on the documents, here is a short answer."
+    assert time.perf_counter() - started < 1.0
+    stats = router.stats()
+    assert stats["secondary"]["hedges"] == 1
+    assert stats["secondary"]["wins"] == 1
+
+
+def test_no_hedge_before_enough_samples():
+    router, primary, secondary = make_router(default_hedge_after=0.3)
+    primary.latency = 0.1
+    "".join(router.stream("question"))
+    assert secondary.calls == 0
+
+
+def test_hedging_off_waits_for_the_slow_provider():
+    router, primary, secondary = make_router(hedge=False)
+    warm_up(router)
+    primary.latency = 0.3
+    "".join(router.stream("question"))
+    assert router.stats()["secondary"]["calls"] == 0
+
+
+def test_fails_over_on_error():
+    router, primary, secondary = make_router()
+    primary.error_rate = 1.0
+    assert router.invoke("question") == "Based on the documents, here is a short answer."
+    stats = router.stats()
+    assert stats["primary"]["errors"] == 1
+    assert stats["secondary"]["failovers"] == 1
+
+
+def test_raises_when_every_provider_fails():
+    router, primary, secondary = make_router()
+    primary.error_rate = secondary.error_rate = 1.0
+    with pytest.raises(FakeProviderError):
+        "".join(router.stream("question"))
+
+
+def test_failing_provider_cools_down_then_is_tried_again():
+    router, primary, secondary = make_router(cooldown=0.3)
+    warm_up(router, calls=3)
+    primary.error_rate = 1.0
+    for _ in range(MIN_ERRORS):
+        router.invoke("question")
+    assert router.stats()["primary"]["cooling_down_s"] > 0
+    assert router.ordered()[-1] == "primary"
+
+    calls = primary.calls
+    for _ in range(5):
+        router.invoke("question")
+    assert primary.calls == calls
+
+    primary.error_rate = 0.0
+    time.sleep(0.35)
+    assert router.stats()["primary"]["cooling_down_s"] == 0
+    secondary.error_rate = 1.0
+    assert router.invoke("question") == "Based on the documents, here is a short answer."
+    assert primary.calls == calls + 1
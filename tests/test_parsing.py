@@ -0,0 +1,72 @@
+import os
+import time
+import threading
+import multiprocessing
+
+import pytest
+
+import parsing
+from parsing import parse_files
+
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                                reason="the fake loader reaches the workers by forking")
+
+
+class FakeLoader:
+    """Crashes the interpreter on "crash" files and hangs on "slow" ones."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        name = os.path.basename(self.path)
+        if name.startswith("crash"):
+            os._exit(1)
+        if name.startswith("slow"):
+            time.sleep(30)
+        return [name]
+
+
+@pytest.fixture(autouse=True)
+def fake_loader(monkeypatch):
+    monkeypatch.setattr(parsing, "loader_class", lambda ext: FakeLoader)
+
+
+def names(count, prefix="ok"):
+    return [f"/docs/{prefix}{n}.txt" for n in range(count)]
+
+
+def test_results_come_back_in_input_order():
+    paths = names(20)
+    results = list(parse_files(paths, workers=3))
+    assert [r.path for r in results] == paths
+    assert [r.chunks for r in results] == [[os.path.basename(p)] for p in paths]
+
+
+def test_only_the_crashing_file_is_blamed():
+    paths = names(4) + ["/docs/crash.txt"] + names(4, prefix="more")
+    results = list(parse_files(paths, workers=2, timeout=10))
+    assert [r.path for r in results] == paths
+    failed = [(r.path, r.error.message) for r in results if r.error]
+    assert len(failed) == 1
+    assert failed[0][0] == "/docs/crash.txt"
+    assert "worker crashed" in failed[0][1]
+
+
+def test_timeout_in_process_on_the_main_thread():
+    started = time.perf_counter()
+    [result] = parse_files(["/docs/slow.txt"], workers=1, timeout=0.3)
+    assert result.error.kind == "timeout"
+    assert time.perf_counter() - started < 5
+
+
+def test_timeout_is_enforced_off_the_main_thread():
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(
+        parse_files(["/docs/slow.txt"], workers=1, timeout=0.3)))
+    started = time.perf_counter()
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive()
+    assert results[0].error.kind == "timeout"
+    assert time.perf_counter() - started < 5
@@ -0,0 +1,186 @@
+import os
+
+import pytest
+from requests.exceptions import HTTPError
+
+from fakes import FakeResponse, SERVICE_URL, DRIVE_ID, ROOT_ID
+from sharepoint_connector import SharePointFetcher
+from sync_manifest import SyncManifest, MANIFEST_FILENAME
+
+
+class Drive:
+    """A drive whose delta feed reports the changes made since the last call, like Graph."""
+
+    def __init__(self):
+        self.items = {}
+        self.changes = []
+        self.content_requests = []
+        self.expired = False
+        self._version = 0
+
+    def folder(self, item_id, name, parent=ROOT_ID):
+        self.items[item_id] = {"id": item_id, "name": name, "folder": {}, "parentReference": {"id": parent}}
+        self.changes.append(item_id)
+
+    def file(self, item_id, name, content, parent=ROOT_ID):
+        self._version += 1
+        self.items[item_id] = {"id": item_id, "name": name, "file": {}, "size": len(content), "content": content,
+                               "cTag": f"c{self._version}", "eTag": f"e{self._version}",
+                               "parentReference": {"id": parent}}
+        self.changes.append(item_id)
+
+    def rename(self, item_id, name):
+        self.items[item_id]["name"] = name
+        self.changes.append(item_id)
+
+    def delete(self, item_id):
+        self.items[item_id] = {"id": item_id, "deleted": {}}
+        self.changes.append(item_id)
+
+    def get(self, url, headers=None, stream=False, **kwargs):
+        if url.endswith("/content"):
+            item_id = url.split("/items/")[1].split("/")[0]
+            self.content_requests.append(item_id)
+            return FakeResponse(content=self.items[item_id]["content"])
+        if "token" in url and self.expired:
+            self.expired = False
+            raise HTTPError(response=FakeResponse(410))
+        if "token" in url:
+            ids = list(dict.fromkeys(self.changes))
+        else:
+            ids = list(self.items)
+        self.changes = []
+        value = [{"id": ROOT_ID, "root": {}}]
+        value += [{k: v for k, v in self.items[i].items() if k != "content"} for i in ids]
+        return FakeResponse(data={"value": value, "@odata.deltaLink": f"{SERVICE_URL}drives/{DRIVE_ID}/root/delta?token=1"})
+
+
+class Account:
+    class protocol:
+        service_url = SERVICE_URL
+
+    def __init__(self, drive):
+        self.con = drive
+
+
+class Library:
+    object_id = DRIVE_ID
+
+    def get_root_folder(self):
+        class Root:
+            object_id = ROOT_ID
+        return Root()
+
+
+@pytest.fixture
+def drive():
+    return Drive()
+
+
+@pytest.fixture
+def sync(drive, tmp_path):
+    fetcher = SharePointFetcher("id", "secret", account=Account(drive))
+    target = str(tmp_path / "data")
+    return lambda: fetcher._sync_drive(Library(), target, [".txt", ".md"], max_workers=2, per_host_limit=2)
+
+
+def read(tmp_path, relative):
+    with open(os.path.join(tmp_path, "data", *relative.split("/")), "rb") as f:
+        return f.read()
+
+
+def listing(tmp_path):
+    root = tmp_path / "data"
+    return sorted(str(p.relative_to(root)).replace(os.sep, "/") for p in root.rglob("*")
+                  if p.is_file() and p.name != MANIFEST_FILENAME)
+
+
+def test_first_sync_mirrors_the_folder_tree(drive, sync, tmp_path):
+    drive.folder("f1", "Policies")
+    drive.file("a", "a.txt", b"A", parent="f1")
+    drive.file("b", "b.txt", b"B")
+    drive.file("img", "logo.png", b"PNG")
+    result = sync()
+    assert len(result.added) == 2
+    assert listing(tmp_path) == ["Policies/a.txt", "b.txt"]
+    assert read(tmp_path, "Policies/a.txt") == b"A"
+
+
+def test_later_syncs_apply_only_the_delta(drive, sync, tmp_path):
+    drive.file("a", "a.txt", b"A")
+    drive.file("b", "b.txt", b"B")
+    drive.file("c", "c.txt", b"C")
+    sync()
+    drive.content_requests.clear()
+
+    drive.file("a", "a.txt", b"A2")
+    drive.delete("b")
+    result = sync()
+    assert drive.content_requests == ["a"]
+    assert result.modified == [os.path.join(str(tmp_path / "data"), "a.txt")]
+    assert len(result.removed) == 1
+    assert listing(tmp_path) == ["a.txt", "c.txt"]
+    assert read(tmp_path, "a.txt") == b"A2"
+
+
+def test_rename_moves_without_downloading(drive, sync, tmp_path):
+    drive.folder("f1", "Old")
+    drive.file("a", "a.txt", b"A", parent="f1")
+    sync()
+    drive.content_requests.clear()
+    drive.rename("f1", "New")
+    sync()
+    assert drive.content_requests == []
+    assert listing(tmp_path) == ["New/a.txt"]
+    assert not (tmp_path / "data" / "Old").exists()
+
+
+def test_files_swapping_names_keep_their_content(drive, sync, tmp_path):
+    drive.file("A", "a.txt", b"content of A")
+    drive.file("B", "b.txt", b"content of B")
+    sync()
+    drive.content_requests.clear()
+    drive.rename("A", "b.txt")
+    drive.rename("B", "a.txt")
+    sync()
+    assert drive.content_requests == []
+    assert read(tmp_path, "b.txt") == b"content of A"
+    assert read(tmp_path, "a.txt") == b"content of B"
+    assert listing(tmp_path) == ["a.txt", "b.txt"]
+
+
+def test_rename_chain_and_changed_file_moving_away(drive, sync, tmp_path):
+    drive.file("A", "a.txt", b"A")
+    drive.file("B", "b.txt", b"B")
+    sync()
+    # A takes over b.txt while B is edited and moves on to c.txt.
+    drive.rename("A", "b.txt")
+    drive.file("B", "c.txt", b"B2")
+    sync()
+    assert read(tmp_path, "b.txt") == b"A"
+    assert read(tmp_path, "c.txt") == b"B2"
+    assert listing(tmp_path) == ["b.txt", "c.txt"]
+
+
+def test_expired_delta_token_runs_a_full_resync(drive, sync, tmp_path):
+    drive.file("a", "a.txt", b"A")
+    sync()
+    drive.expired = True
+    result = sync()
+    assert result.full_resync
+    assert listing(tmp_path) == ["a.txt"]
+
+
+def test_manifest_round_trip_and_other_drive(tmp_path):
+    manifest = SyncManifest(str(tmp_path), "drive-1")
+    manifest.root_id = "root"
+    manifest.delta_link = "https://graph/delta?token=1"
+    manifest.folders = {"f1": {"name": "Docs", "parent": "root"}, "f2": {"name": "Sub", "parent": "f1"}}
+    manifest.files = {"a": {"name": "a.txt", "parent": "f2"}, "orphan": {"name": "o.txt", "parent": "gone"}}
+    manifest.save()
+
+    loaded = SyncManifest.load(str(tmp_path), "drive-1")
+    assert loaded.delta_link == manifest.delta_link
+    assert loaded.relative_path(loaded.files["a"]) == "Docs/Sub/a.txt"
+    assert loaded.relative_path(loaded.files["orphan"]) is None
+    assert SyncManifest.load(str(tmp_path), "drive-2").delta_link is None